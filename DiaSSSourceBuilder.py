@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+__all__ = ("DiaSSSourceBuilder",)
+
+import os
+import sys
+from typing import (Any, Callable, Generator, Iterable, List, Optional,
+                    Sequence, Tuple, Type)
+
+from .base import (ConversionPlan, FileTable, FileTableBuilder, Indexer,
+                   seed_noise)
+from .DiaSourceFileTable import DiaSourceBuilder, DiaSourceFileTable
+from .SSSourceFileTable import SSSourceFileTable
+
+
+class DiaSSSourceBuilder(FileTableBuilder):
+    """Builds the DiaSource and SSSource tables in a single pass over the
+    simulated inputs, which both tables are converted from.
+
+    Every distinct conversion function registered for either table is called
+    once per row, so columns shared by both tables (such as ssObjectId and
+    diaSourceId, which are hashed) are only computed once.
+    """
+    input_schema = DiaSourceBuilder.input_schema
+    SKY_COLUMNS = DiaSourceBuilder.SKY_COLUMNS
+    TIME_COLUMN = DiaSourceBuilder.TIME_COLUMN
+
+    def __init__(self, input_filename: str, dia_output_filename: str,
+                 sssource_output_filename: str, skip_rows: int,
+                 stop_after: Optional[int] = None,
+                 do_index: bool = True,
+                 sssource_do_index: bool = False,
+                 byte_range: Optional[Tuple[int, Optional[int]]] = None,
+                 line_index: bool = False,
+                 seed: Optional[int] = None,
+                 sky_order: Optional[int] = None,
+                 time_window: Optional[float] = None,
+                 compression: Optional[str] = None,
+                 compression_level: Optional[int] = None,
+                 compression_threads: int = 1,
+                 index_backend: str = "sqlite"):
+        """
+        Parameters
+        ----------
+        input_filename : `str`
+            Path to the simulated input file
+        dia_output_filename : `str`
+            Path the DiaSource table will be saved to
+        sssource_output_filename : `str`
+            Path the SSSource table will be saved to
+        do_index : `bool`
+            Index the DiaSource table, using the same indexer as the dia
+            command
+        sssource_do_index : `bool`
+            Index the SSSource table
+        sky_order : `int`
+            Write a SkyIndex of both tables at this HEALPix order
+        time_window : `float`
+            Partition both tables by time, each into its own directory
+        compression : `str`
+            Compress both tables with gzip or zstd
+
+        See FileTableBuilder for the remaining parameters.
+        """
+        super().__init__(DiaSourceFileTable, input_filename,  # type: ignore
+                         dia_output_filename, skip_rows, stop_after,
+                         do_index=do_index, byte_range=byte_range,
+                         line_index=line_index, seed=seed,
+                         sky_order=sky_order, time_window=time_window,
+                         compression=compression,
+                         compression_level=compression_level,
+                         compression_threads=compression_threads,
+                         index_backend=index_backend)
+        self.sssource_output_filename = sssource_output_filename
+        self.sssource_do_index = sssource_do_index
+        self.tables: Sequence[Type[FileTable]] = (DiaSourceFileTable,
+                                                  SSSourceFileTable)
+
+    def _plan(self) -> Tuple[List[Callable], List[Callable]]:
+        """Collect the distinct conversion functions used by the tables,
+        formatted as each table's schema asks, along with a getter for each
+        table that assembles its row from the values of those functions
+        followed by a null, used for columns without a function.
+        """
+        functions: List[Callable] = []
+        # A function is shared by the tables when they also format it the
+        # same way
+        keys: List[Tuple[Callable, Optional[str]]] = []
+        getters = []
+        for table in self.tables:
+            positions = []
+            for column in table.schema.fields:
+                function = table.schema.registry.get(column)
+                if function is None:
+                    positions.append(-1)
+                    continue
+                key = (function, table.schema.formats.get(column))
+                if key not in keys:
+                    keys.append(key)
+                    functions.append(table.schema.converter(column))
+                positions.append(keys.index(key))
+            getters.append(ConversionPlan.getter(positions))
+        return functions, getters
+
+    def _make_fused_rows(self, input_rows: Iterable[bytes], start: int,
+                         stop_after: Optional[int] = None,
+                         trackers: Sequence[Any] = ()) ->\
+            Generator[List[Tuple[str, ...]], None, None]:
+        """Yield, for every input row, a list holding the converted row of
+        each table in self.tables. Each input row is also passed to the add
+        method of every tracker. Noise streams are seeded for every chunk
+        of THREAD_CHUNK_ROWS lines, as the builders of the two tables seed
+        them.
+        """
+        functions, getters = self._plan()
+        source = os.path.basename(self.input_filename)
+        try:
+            for offset, lines in self._chunks(input_rows, start, stop_after):
+                seed_noise(self.seed, offset, source)
+                for file_row_interp in self._intrepret_rows(lines):
+                    for tracker in trackers:
+                        tracker.add(file_row_interp)
+                    values = [function(file_row_interp)
+                              for function in functions]
+                    values.append("\\N")
+                    yield [getter(values) for getter in getters]
+        except UnicodeDecodeError:
+            print(f"Error processing {self.input_filename}")
+            sys.exit(1)
+
+    def run(self):
+        dia_indexer = DiaSourceBuilder.INDEXER or Indexer
+        indexers = (dia_indexer(self.do_index,
+                                self.output_filename+".sidecar",
+                                tuple(DiaSourceFileTable.index_columns),
+                                backend=self.index_backend),
+                    Indexer(self.sssource_do_index,
+                            self.sssource_output_filename+".sidecar",
+                            tuple(SSSourceFileTable.index_columns),
+                            backend=self.index_backend))
+        index_getters = [ConversionPlan(table.schema, None,
+                                        table.index_columns).index
+                         for table in self.tables]
+        with self._open_input() as (start, rows_generator, stop_after),\
+                self._open_output(self.output_filename,
+                                  DiaSourceFileTable.schema) as dia_output,\
+                self._open_output(self.sssource_output_filename,
+                                  SSSourceFileTable.schema) as sss_output:
+            writers = (dia_output[0], sss_output[0])
+            trackers = dia_output[1] + sss_output[1]
+            outputs = list(zip(writers, indexers, index_getters))
+            for table_rows in self._make_fused_rows(rows_generator, start,
+                                                    stop_after, trackers):
+                for row, (writer, indexer, index) in zip(table_rows, outputs):
+                    if indexer.do_index:
+                        indexer.add(index(row))
+                    writer.writerow(row)
@@ -1,22 +1,23 @@
 __all__ = ("DiaSourceFileTable",)
 
-from .base import FileTable, FileTableBuilder
+from .base import FileTable, FileTableBuilder, Indexer
 from .schemas import DIASource
 from .customTypes import ColumnName
 
-from typing import Generator, Iterable
+from typing import Iterable, Optional, Tuple
 import pickle
-import zmq
 
 
 class ZMQ_Indexer:
-    def __init__(self, do_index: bool, _: str, _columns: Iterable[str]):
+    def __init__(self, do_index: bool, _: str, _columns: Iterable[str],
+                 backend: Optional[str] = None):
         self.do_index = do_index
 
         if do_index:
             self.accumulate_len = 5000
             self.tracker_len = 0
             self.tracker = [None]*self.accumulate_len
+            import zmq
             context = zmq.Context()
             try:
                 self.socket = context.socket(zmq.PUSH)
@@ -25,18 +26,14 @@ class ZMQ_Indexer:
                 raise Exception("cound no connect to server, did you start "
                                 "index process")
 
-    def insert(self, generator) -> Generator:
-        if self.do_index:
-            values = tuple(generator)
-            self.tracker[self.tracker_len] = tuple(v for v, truth in
-                                                   values if truth)
-            self.tracker_len += 1
-            if self.tracker_len == self.accumulate_len:
-                self.socket.send(pickle.dumps(self.tracker))
-                self.tracker_len = 0
-            yield from (value for value, _ in values)
-        else:
-            yield from (value for value, _ in generator)
+    def add(self, values: Tuple[str, ...]):
+        self.tracker[self.tracker_len] = values
+        self.tracker_len += 1
+        if self.tracker_len == self.accumulate_len:
+            self.socket.send(pickle.dumps(self.tracker))
+            self.tracker_len = 0
+
+    index_rows = Indexer.index_rows
 
 
 class DiaSourceBuilder(FileTableBuilder):
@@ -47,10 +44,14 @@ class DiaSourceBuilder(FileTableBuilder):
                     "Ast-Sun(J2000z)(km)", "Sun-Ast-Obs(deg)",
                     "V", "Filtermag", "V(H=0)", "Filter", "AstRASigma(mas)",
                     "AstDecSigma(mas)", "PhotometricSigma(mag)")
+    SKY_COLUMNS = ("AstRA(deg)", "AstDec(deg)")
+    TIME_COLUMN = "FieldMJD"
     INDEXER = ZMQ_Indexer
 
 
 class DiaSourceFileTable(FileTable):
     schema = DIASource
-    index_columns = tuple(ColumnName(x) for x in ("ssObjectId", "midPointTai"))
+    index_columns = tuple(ColumnName(x) for x in ("diaSourceId", "ssObjectId",
+                                                  "midPointTai", "filter",
+                                                  "mag"))
     builder = DiaSourceBuilder
@@ -4,10 +4,12 @@ __all__ = ("MPCORBFileTable",)
 
 import csv
 from glob import glob
+import os
 from itertools import islice
-from typing import Dict, Optional, Iterable, Generator
+from typing import Optional, Iterable, Generator
 
-from .base import FileTableBuilder, FileTable, Indexer
+from .base import (ConversionPlan, FileTableBuilder, FileTable, Indexer,
+                   merge_with_previous, open_input)
 from .schemas import MPCORB
 from .customTypes import ColumnName
 
@@ -16,12 +18,42 @@ class MPCORBBuilder(FileTableBuilder):
     input_schema = ("S3MID", "FORMAT", "q", "e", "i", "Omega",
                     "argperi", "t_p", "H", "t_0", "INDEX",
                     "N_PAR", "MOID", "COMPCODE")
+    DELIMITER = None
 
     def __init__(self, parent: FileTable, input_fileglob: str,
                  output_filename: str,
                  skip_rows: int,
                  stop_after: Optional[int] = None,
-                 columns: Optional[Iterable[ColumnName]] = None):
+                 columns: Optional[Iterable[ColumnName]] = None,
+                 previous_filename: Optional[str] = None,
+                 delta_only: bool = False,
+                 index_backend: str = "sqlite"):
+        """
+        Parameters
+        ----------
+        input_fileglob : `str`
+            Glob matching the MPCORB files to convert. When previous_filename
+            is set these only need to contain the orbits that changed.
+        output_filename : `str`
+            Path the output table will be saved to
+        skip_rows : `int`
+            The number of rows to skip at the start of each input file
+        stop_after : `int`
+            Only process a given number of rows from each input file
+        columns : `Iterable of str`
+            List of columns in cls.schema to convert
+        previous_filename : `str`
+            Path to a previously built MPCORB table. Rows of that table are
+            replaced by any converted orbit with the same ssObjectId, and
+            copied through untouched otherwise, rather than rebuilding the
+            whole table.
+        delta_only : `bool`
+            When previous_filename is set, only write the rows that are new
+            or differ from the previous table.
+        index_backend : `str`
+            Write the sidecar as a sqlite database, or as a BinarySidecar
+            with "binary"
+        """
         self.parent = parent
         self.output_filename = output_filename
         self.skip_rows = 0
@@ -31,10 +63,18 @@ class MPCORBBuilder(FileTableBuilder):
         self._mpc_skip_start = skip_rows
         self._mpc_stop_after = stop_after
         self.do_index = True
-
-        self.index_pos = {self.parent.schema.field_pos[column]: column
-                          for column in
-                          self.parent.index_columns}
+        self.previous_filename = previous_filename
+        self.delta_only = delta_only
+        self.index_backend = index_backend
+        if previous_filename is not None and\
+                os.path.abspath(previous_filename) ==\
+                os.path.abspath(output_filename):
+            raise ValueError("The previous table can not be overwritten in "
+                             "place, choose a different output_filename")
+        if previous_filename is not None and columns is not None and\
+                "ssObjectId" not in columns:
+            raise ValueError("Updating a previous table needs the "
+                             "ssObjectId column to be converted")
 
     def _get_input_rows(self) -> Generator:
         if self._mpc_stop_after is not None:
@@ -42,29 +82,36 @@ class MPCORBBuilder(FileTableBuilder):
         else:
             stop = None  # type: ignore
         for path in glob(self.input_fileglob):
-            with open(path, 'rb') as in_file:
-                yield from islice(in_file.readlines(), self._mpc_skip_start,
-                                  stop)
-
-    def _intrepret_row(self, interp_row: str) -> Dict:
-        return {k: v for k, v in zip(self.input_schema,
-                                     interp_row.split())}
+            # Inputs may be gzip or zstd compressed, and are decompressed as
+            # they are read
+            with open_input(path) as in_file:
+                yield from islice(in_file, self._mpc_skip_start, stop)
 
     def run(self):
         with open(self.output_filename, 'w+', newline='') as out_file:
             indexer = Indexer(self.do_index,
                               self.output_filename+".sidecar",
-                              self.parent.index_columns)
+                              self.parent.index_columns,
+                              backend=self.index_backend)
             writer = csv.writer(out_file, quoting=csv.QUOTE_NONE,
                                 lineterminator="\n")
             writer.writerow(self.parent.schema.fields.keys())
             rows_generator = self._get_input_rows()
-            rows = self._make_rows(rows_generator, self.columns,
-                                   self.skip_rows,
+            plan = ConversionPlan(self.parent.schema, self.columns,
+                                  self.parent.index_columns)
+            rows = self._make_rows(rows_generator, plan, self.skip_rows,
                                    self.stop_after)
-            writer.writerows(indexer.insert(
-                (b, i in self.index_pos) for i, b in enumerate(row_gen))
-                for row_gen in rows)
+            if self.previous_filename is not None:
+                key_pos = plan.fields.index(ColumnName("ssObjectId"))
+                replacements = {}
+                for row in rows:
+                    replacements[row[key_pos]] = row
+                rows = merge_with_previous(self.previous_filename,
+                                           self.parent.schema,
+                                           ColumnName("ssObjectId"),
+                                           replacements, self.delta_only,
+                                           plan.fields)
+            writer.writerows(indexer.index_rows(rows, plan.index))
 
 
 class MPCORBFileTable(FileTable):
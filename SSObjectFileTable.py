@@ -2,24 +2,114 @@ from __future__ import annotations
 
 __all__ = ("SSObjectFileTable",)
 
+from contextlib import closing
 import csv
 from dataclasses import dataclass
-from itertools import islice
+from itertools import groupby, islice
+from operator import itemgetter
+from mmap import mmap, PROT_READ
+import os
 import time
-from typing import (Optional, Iterable, Dict, Generator, List, Set,
-                    Union, Any)
+from typing import (Optional, Iterable, Dict, Generator, List, Mapping, Set,
+                    Tuple, Union, Any, Sequence)
 import sqlite3
 
-from .base import (FileTable, FileTableInMem, FileTableBuilder, NoIndexError)
+import numpy as np
+
+from .base import (BinarySidecar, ConversionPlan, FileTable, FileTableInMem,
+                   FileTableBuilder, NoIndexError, ObjectRangeIndex,
+                   is_binary_sidecar, merge_with_previous)
 from .schemas import SSObject, DIASource, MPCORB
 from .customTypes import ColumnName
+from .photometricFit import FILTERS, HG12Fit, PhotometryBatch
+
+
+class DiaAggregate:
+    """Running reductions over the DiaSource rows of a single object.
+
+    Rows are folded in one at a time as they stream out of the DiaSource
+    index, so the memory used per object is constant no matter how many
+    times it was observed.
+    """
+    __slots__ = ("count", "tai_min", "tai_max", "tai_null")
+
+    def __init__(self):
+        self.count = 0
+        self.tai_min = float("inf")
+        self.tai_max = float("-inf")
+        self.tai_null = False
+        # set if any midPointTai was null
+
+    def update(self, midPointTai: str):
+        self.count += 1
+        if midPointTai == '\\N':
+            self.tai_null = True
+        else:
+            tai = float(midPointTai)
+            if tai < self.tai_min:
+                self.tai_min = tai
+            if tai > self.tai_max:
+                self.tai_max = tai
+
+    @classmethod
+    def batch(cls, entries: Sequence[Sequence[Sequence[Any]]],
+              tai_pos: Optional[int]) -> List[DiaAggregate]:
+        """Reduce the DiaSource rows of a block of objects at once, giving
+        the same aggregates as calling update with every row of each object
+        in turn. entries holds the rows of each object, with the midPointTai
+        to reduce at tai_pos.
+        """
+        n_objects = len(entries)
+        counts = np.fromiter(map(len, entries), dtype=np.int64,
+                             count=n_objects)
+        slots = np.repeat(np.arange(n_objects), counts)
+        rows = [entry for object_entries in entries
+                for entry in object_entries]
+
+        def column(pos: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+            """Values at pos as floats, along with which are null."""
+            if pos is None:
+                return np.full(len(rows), np.nan), np.ones(len(rows), bool)
+            values = np.array([entry[pos] for entry in rows], dtype=object)
+            null = (values == '\\N') | (values == None)  # noqa: E711
+            values[null] = "nan"
+            return values.astype(np.float64), null
+
+        tai, tai_nulls = column(tai_pos)
+        tai_min = np.full(n_objects, np.inf)
+        tai_max = np.full(n_objects, -np.inf)
+        np.fmin.at(tai_min, slots, tai)
+        np.fmax.at(tai_max, slots, tai)
+        tai_null = np.bincount(slots, weights=tai_nulls,
+                               minlength=n_objects) > 0
+
+        aggregates = []
+        for slot in range(n_objects):
+            aggregate = cls.__new__(cls)
+            aggregate.count = int(counts[slot])
+            aggregate.tai_min = float(tai_min[slot])
+            aggregate.tai_max = float(tai_max[slot])
+            aggregate.tai_null = bool(tai_null[slot])
+            aggregates.append(aggregate)
+        return aggregates
 
 
 @dataclass
 class SSObjectRow:
     ssobjectid: Any
     dia_list: List
-    mpc_entry: Union[Dict, NoIndexError]
+    # Only populated when the builder is asked to keep the full list of
+    # DiaSource rows, converters should prefer aggregate
+    mpc_entry: Union[Mapping, NoIndexError]
+    # The MPCORB sidecar entry, indexed by column name
+    aggregate: Optional[DiaAggregate] = None
+    photometry: Optional[HG12Fit] = None
+    # Fits for the whole block of objects this row was built with, the
+    # entries for this object start at photometry_offset
+    photometry_offset: int = 0
+
+    def decode(self):
+        return self
 
 
 class SSObjectTuple(tuple):
@@ -33,51 +123,343 @@ class SSObjectKey(str):
 
 
 class JointIndex:
-    def __init__(self, dia_sidecar: str, mpc_sidecar: str):
+    """Looks up the DiaSource rows and MPCORB entry of each object.
+
+    Objects are looked up a block at a time by build_SSObjectRows. DiaSource
+    rows come either from the sidecar of a DiaSource table, fetching the
+    rows of every object in a block with a few ssObjectId IN (...) queries,
+    or from a DiaSource table sorted with sort_by_object, in which case the
+    rows of each object are read as one contiguous range of the table using
+    its range index. MPCORB entries are fetched from their sidecar the same
+    way, as sqlite3.Row tuples that can also be indexed by column name.
+
+    Any of the sidecars can also be a BinarySidecar, written with the binary
+    index backend, in which case the rows of a whole block are found with
+    one lookup_many call rather than queries, and MPCORB entries are dicts
+    of column name to value.
+    """
+    GEOMETRY_COLUMNS = ("phaseAngle", "heliocentricDist", "topocentricDist",
+                        "predictedMagnitudeSigma")
+    # Columns of the SSSource sidecar needed to fit H and G12
+    PROGRESS_EVERY = 1000
+    # Number of objects built between progress messages
+    QUERY_BATCH = 900
+    # Most keys looked up in one query of a sidecar, staying under the
+    # sqlite limit on query parameters
+
+    def __init__(self, dia_sidecar: str, mpc_sidecar: str,
+                 keep_dia_list: bool = False,
+                 sssource_sidecar: Optional[str] = None):
+        self.keep_dia_list = keep_dia_list
+        self.fit_photometry = sssource_sidecar is not None
+        self.dia_ranges = ObjectRangeIndex.load(dia_sidecar)
+        self.dia_sidecar: Optional[BinarySidecar] = None
+        self.geometry_sidecar: Optional[BinarySidecar] = None
+        # Geometry is joined onto the DiaSource rows by the query when both
+        # sidecars are sqlite databases, otherwise it is looked up after
+        self.geometry_joined = False
+        if self.dia_ranges is not None:
+            self._open_sorted(dia_sidecar, sssource_sidecar)
+        elif is_binary_sidecar(dia_sidecar):
+            self._open_binary(dia_sidecar, sssource_sidecar)
+        else:
+            self._open_sidecar(dia_sidecar, sssource_sidecar)
+        self.aggregate_pos = [self.dia_schema.index(column)
+                              if column in self.dia_schema else None
+                              for column in ("midPointTai", "filter",
+                                             "mag")]
+
+        self.mpc_sidecar: Optional[BinarySidecar] = None
+        self.mpc_db: Optional[sqlite3.Connection] = None
+        if is_binary_sidecar(mpc_sidecar):
+            self.mpc_sidecar = BinarySidecar(mpc_sidecar)
+            self.mpc_schema = list(self.mpc_sidecar.columns)
+        else:
+            self.mpc_db = sqlite3.connect(mpc_sidecar)
+            self.mpc_db.row_factory = sqlite3.Row
+            self.mpc_cursor = self.mpc_db.cursor()
+            self.mpc_cursor.execute("select * from ind limit 1")
+            self.mpc_schema = [description[0] for description in
+                               self.mpc_cursor.description]
+        self.count = 0
+        self.start = time.time()
+
+    def _open_sidecar(self, dia_sidecar: str,
+                      sssource_sidecar: Optional[str]):
         self.dia_db = sqlite3.connect(dia_sidecar)
         self.dia_cursor = self.dia_db.cursor()
         self.dia_cursor.execute("select * from ind limit 1")
         self.dia_schema = [description[0] for description in
                            self.dia_cursor.description]
+        self.dia_key_pos = self.dia_schema.index("ssObjectId")
+        self.dia_source_pos = self.dia_schema.index("diaSourceId")
+        self.dia_query = 'select * from ind where ssObjectId in ({})'
+        if sssource_sidecar is not None and\
+                is_binary_sidecar(sssource_sidecar):
+            self.geometry_sidecar = BinarySidecar(sssource_sidecar)
+        elif sssource_sidecar is not None:
+            # Join each DiaSource with the SSSource row for the same
+            # detection to get the geometry needed for photometric fits
+            self.dia_db.execute("attach database ? as geom",
+                                (sssource_sidecar,))
+            self.dia_db.execute("create index if not exists geom.diasrc on "
+                                "ind(diaSourceId)")
+            geometry = ", ".join(f"g.{column}" for column in
+                                 self.GEOMETRY_COLUMNS)
+            self.dia_query = f"select d.*, {geometry} from ind as d left " +\
+                "join geom.ind as g on g.diaSourceId = d.diaSourceId " +\
+                "where d.ssObjectId in ({})"
+            self.geometry_joined = True
 
-        self.mpc_db = sqlite3.connect(mpc_sidecar)
-        self.mpc_cursor = self.mpc_db.cursor()
-        self.mpc_cursor.execute("select * from ind limit 1")
-        self.mpc_schema = [description[0] for description in
-                           self.mpc_cursor.description]
-        self.count = 0
-        self.start = time.time()
+    def _open_sorted(self, dia_filename: str,
+                     sssource_sidecar: Optional[str]):
+        self._dia_file = open(dia_filename, "rb")
+        self._dia_mmap = mmap(self._dia_file.fileno(), 0, prot=PROT_READ)
+        self.dia_schema = self._dia_mmap.readline().decode()\
+            .rstrip("\n").split(",")
+        self.dia_source_pos = self.dia_schema.index("diaSourceId")
+        self._open_geometry(sssource_sidecar)
+
+    def _open_binary(self, dia_sidecar: str,
+                     sssource_sidecar: Optional[str]):
+        self.dia_sidecar = BinarySidecar(dia_sidecar)
+        self.dia_schema = list(self.dia_sidecar.columns)
+        self.dia_source_pos = self.dia_schema.index("diaSourceId")
+        self._open_geometry(sssource_sidecar)
+
+    def _open_geometry(self, sssource_sidecar: Optional[str]):
+        """Open the SSSource sidecar that _geometry looks DiaSources up in,
+        which is only used for the geometry of photometric fits.
+        """
+        if sssource_sidecar is not None and\
+                is_binary_sidecar(sssource_sidecar):
+            self.geometry_sidecar = BinarySidecar(sssource_sidecar)
+            sssource_sidecar = None
+        self.dia_db = sqlite3.connect(sssource_sidecar or ":memory:")
+        if sssource_sidecar is not None:
+            self.dia_db.execute("create index if not exists diasrc on "
+                                "ind(diaSourceId)")
+
+    def _query_batches(self, db: sqlite3.Connection, query: str,
+                       keys: Sequence[str]) -> Iterable[Sequence[Any]]:
+        """Run query, which has a {} standing in for the contents of an IN
+        (...) list, for keys QUERY_BATCH at a time.
+        """
+        for start in range(0, len(keys), self.QUERY_BATCH):
+            batch = keys[start:start + self.QUERY_BATCH]
+            yield from db.execute(query.format(", ".join("?"*len(batch))),
+                                  batch)
+
+    def _geometry(self, dia_source_ids: Sequence[str]) ->\
+            Dict[str, Sequence[Any]]:
+        """Look up the SSSource geometry of DiaSources, for when it is not
+        joined onto the DiaSource rows by the query.
+        """
+        if self.geometry_sidecar is not None:
+            found = self.geometry_sidecar.lookup_many(dia_source_ids,
+                                                      "diaSourceId")
+            pos = [self.geometry_sidecar.columns.index(column)
+                   for column in self.GEOMETRY_COLUMNS]
+            return {dia_source_id: [rows[0][p] for p in pos]
+                    for dia_source_id, rows in found.items()}
+        columns = ", ".join(self.GEOMETRY_COLUMNS)
+        query = f"select diaSourceId, {columns} from ind where " +\
+            "diaSourceId in ({})"
+        return {entry[0]: entry[1:] for entry in
+                self._query_batches(self.dia_db, query, dia_source_ids)}
+
+    def _dia_range(self, key: str) -> List[List[str]]:
+        """The rows of the object key in a sorted DiaSource table."""
+        try:
+            found = self.dia_ranges.lookup(int(key))  # type: ignore
+        except ValueError:
+            found = None
+        if found is None:
+            return []
+        offset, count = found
+        self._dia_mmap.seek(offset)
+        readline = self._dia_mmap.readline
+        return [readline().decode().rstrip("\n").split(",")
+                for _ in range(count)]
+
+    def _dia_entries(self, keys: Sequence[str]) ->\
+            Dict[str, List[Sequence[Any]]]:
+        """The DiaSource rows of each of the objects keys, with the SSSource
+        geometry of each appended when fitting photometry. Objects without
+        any rows are left out.
+        """
+        entries: Dict[str, List[Sequence[Any]]] = {}
+        if self.dia_sidecar is not None:
+            entries.update(self.dia_sidecar.lookup_many(keys))
+        elif self.dia_ranges is None:
+            # Rows come back grouped by object, as they are found through
+            # the ssObjectId index, but are merged in case they are not
+            rows = self._query_batches(self.dia_db, self.dia_query, keys)
+            for key, group in groupby(rows, itemgetter(self.dia_key_pos)):
+                entries.setdefault(key, []).extend(group)
+        else:
+            for key in keys:
+                rows = self._dia_range(key)
+                if rows:
+                    entries[key] = rows
+        if self.fit_photometry and not self.geometry_joined:
+            pos = self.dia_source_pos
+            geometry = self._geometry([entry[pos]
+                                       for rows in entries.values()
+                                       for entry in rows])
+            missing = (None,)*len(self.GEOMETRY_COLUMNS)
+            for key, rows in entries.items():
+                entries[key] = [list(entry) + list(geometry.get(entry[pos],
+                                                                missing))
+                                for entry in rows]
+        return entries
+
+    def _mpc_entries(self, keys: Sequence[str]) -> Dict[str, Mapping]:
+        """The MPCORB sidecar entry of each of the objects keys that has
+        one, taking the first if there are several.
+        """
+        if self.mpc_sidecar is not None:
+            return {key: dict(zip(self.mpc_schema, rows[0])) for key, rows
+                    in self.mpc_sidecar.lookup_many(keys).items()}
+        entries: Dict[str, Mapping] = {}
+        query = 'select * from ind where ssObjectId in ({})'
+        for entry in self._query_batches(self.mpc_db, query, keys):
+            entries.setdefault(entry["ssObjectId"], entry)
+        return entries
+
+    def _has_dia(self, key: str) -> bool:
+        if self.dia_sidecar is not None:
+            return key in self.dia_sidecar
+        if self.dia_ranges is None:
+            return self.dia_cursor.execute(
+                'select 1 from ind where ssObjectId = ? limit 1',
+                (key,)).fetchone() is not None
+        try:
+            return self.dia_ranges.lookup(int(key)) is not None
+        except ValueError:
+            return False
 
     def get_ssobject_keys(self) -> Generator[SSObjectKey, None, None]:
+        if self.dia_ranges is not None:
+            for key, _, _ in self.dia_ranges:
+                yield SSObjectKey((str(key),))
+            return
+        if self.dia_sidecar is not None:
+            for key in self.dia_sidecar.keys():
+                yield SSObjectKey((key,))
+            return
         seen: Set[str] = set()
         for entry in self.dia_db.execute('select ssObjectId from ind'):
-            if entry[0] not in seen:
+            # DiaSources without an object are not an object themselves
+            if entry[0] not in seen and entry[0] != '\\N':
                 seen.add(entry[0])
                 yield SSObjectKey(entry)
 
-    def build_SSObjectRow(self, key: SSObjectKey) -> SSObjectRow:
-        print(f"building object {self.count} "
-              f"{self.count/(time.time() - self.start)}", end='\r')
+    def get_changed_keys(self, sidecars: Iterable[str]) ->\
+            Generator[SSObjectKey, None, None]:
+        """Yield the ssObjectIds found in any of the given sidecars, i.e.
+        those of a new DiaSource batch or MPCORB delta, that have at least
+        one observation in the DiaSource index. Null ids are skipped.
+        """
+        seen: Set[str] = set()
+        for sidecar in sidecars:
+            for key in self._sidecar_keys(sidecar):
+                if key in seen or key == '\\N':
+                    continue
+                seen.add(key)
+                if self._has_dia(key):
+                    yield SSObjectKey((key,))
+
+    @staticmethod
+    def _sidecar_keys(sidecar: str) -> Generator[str, None, None]:
+        """Yield the ssObjectId of every row of a sidecar of either
+        backend.
+        """
+        if is_binary_sidecar(sidecar):
+            yield from BinarySidecar(sidecar).keys()
+            return
+        with closing(sqlite3.connect(sidecar)) as changed_db:
+            for entry in changed_db.execute('select ssObjectId from ind'):
+                yield entry[0]
+
+    def build_SSObjectRows(self, keys: Iterable[SSObjectKey],
+                           block_size: int) ->\
+            Generator[SSObjectRow, None, None]:
+        """Build rows for keys a block at a time. The DiaSource rows and
+        MPCORB entries of every object in a block are fetched together, and
+        when photometry is being fit every object in a block is fit in one
+        vectorized call.
+        """
+        keys = iter(keys)
+        while True:
+            block = list(islice(keys, block_size))
+            if not block:
+                return
+            ids = [key[2:-3] for key in block]
+            found = self._dia_entries(ids)
+            dia_entries = [found.get(key_id, ()) for key_id in ids]
+            aggregates = DiaAggregate.batch(dia_entries,
+                                            self.aggregate_pos[0])
+            mpc_entries = self._mpc_entries(ids)
+            photometry = PhotometryBatch(len(block)) if self.fit_photometry\
+                else None
+            rows = [self.build_SSObjectRow(key, slot, photometry, entries,
+                                           mpc_entries.get(key_id,
+                                                           NoIndexError),
+                                           aggregate)
+                    for slot, (key, key_id, entries, aggregate) in
+                    enumerate(zip(block, ids, dia_entries, aggregates))]
+            if photometry is not None:
+                fits = photometry.fit()
+                for slot, row in enumerate(rows):
+                    row.photometry = fits
+                    row.photometry_offset = slot*len(FILTERS)
+            yield from rows
+
+    def build_SSObjectRow(self, key: SSObjectKey, slot: int = 0,
+                          photometry: Optional[PhotometryBatch] = None,
+                          dia_entries: Optional[Iterable[Sequence[Any]]] =
+                          None,
+                          mpc_entry: Any = None,
+                          aggregate: Optional[DiaAggregate] = None) ->\
+            SSObjectRow:
+        """Build the row of the object key from its DiaSource rows, MPCORB
+        entry and the aggregate of its DiaSource rows, which are looked up
+        or computed if not given.
+        """
         self.count += 1
+        if self.count % self.PROGRESS_EVERY == 0:
+            print(f"building object {self.count} "
+                  f"{self.count/(time.time() - self.start)}", end='\r')
         dia_list = []
+        update = aggregate is None
+        if aggregate is None:
+            aggregate = DiaAggregate()
+        tai_pos, filter_pos, mag_pos = self.aggregate_pos
+        n_dia = len(self.dia_schema)
         key = key[2:-3]
-        for entry in self.dia_db.execute('select * from ind where '
-                                         'ssObjectId = ?', (key,)):
-            dia_list.append({k: v for k, v in
-                             zip(self.dia_schema, entry)})
-        mpc_row = self.mpc_cursor.execute('select * from ind '
-                                          'where ssObjectId = ?',
-                                          (key,))
-        try:
-            mpc_entry = {k: v for k, v in
-                         zip(self.mpc_schema, next(mpc_row))}
-        except Exception:
-            mpc_entry = NoIndexError
-        return SSObjectRow(key, dia_list, mpc_entry)
+        if dia_entries is None:
+            dia_entries = self._dia_entries([key]).get(key, ())
+        if mpc_entry is None:
+            mpc_entry = self._mpc_entries([key]).get(key, NoIndexError)
+        for entry in dia_entries:
+            if update:
+                aggregate.update(entry[tai_pos])  # type: ignore
+            if photometry is not None:
+                photometry.add(slot, entry[filter_pos],  # type: ignore
+                               entry[mag_pos], *entry[n_dia:])
+            if self.keep_dia_list:
+                dia_list.append({k: v for k, v in
+                                 zip(self.dia_schema, entry)})
+        return SSObjectRow(key, dia_list, mpc_entry, aggregate)
 
     def __del__(self):
         self.dia_db.close()
-        self.mpc_db.close()
+        if self.mpc_db is not None:
+            self.mpc_db.close()
+        if self.dia_ranges is not None:
+            self._dia_mmap.close()
+            self._dia_file.close()
 
 
 class SSObjectBuilder(FileTableBuilder):
@@ -87,32 +469,105 @@ class SSObjectBuilder(FileTableBuilder):
                  output_filename: str, input_mpc_filename: str,
                  skip_rows: int,
                  stop_after: Optional[int] = None,
-                 columns: Optional[Iterable[ColumnName]] = None):
+                 columns: Optional[Iterable[ColumnName]] = None,
+                 previous_filename: Optional[str] = None,
+                 changed_filenames: Iterable[str] = (),
+                 delta_only: bool = False,
+                 keep_dia_list: bool = False,
+                 input_sssource_filename: Optional[str] = None,
+                 block_size: int = 1000):
+        """
+        Parameters
+        ----------
+        input_dia_filename : `str`
+            Path to the sidecar of the DiaSource table holding every
+            observation, including any new batch, or to the DiaSource table
+            itself once sorted with sort_by_object, which reads the rows of
+            each object from the table as one contiguous range. Objects are
+            then built in order of ssObjectId.
+        output_filename : `str`
+            Path the output table will be saved to
+        input_mpc_filename : `str`
+            Path to the sidecar of the MPCORB table
+        skip_rows : `int`
+            The number of objects to skip
+        stop_after : `int`
+            Only process a given number of objects
+        columns : `Iterable of str`
+            List of columns in cls.schema to convert
+        previous_filename : `str`
+            Path to a previously built SSObject table. Only the objects
+            found in changed_filenames are recomputed, and the remaining rows
+            are copied through from this table.
+        changed_filenames : `Iterable of str`
+            Sidecars of a new DiaSource batch and/or a MPCORB delta. Every
+            ssObjectId in these is recomputed when previous_filename is set.
+        delta_only : `bool`
+            When previous_filename is set, only write the rows that are new
+            or differ from the previous table.
+        keep_dia_list : `bool`
+            Materialize every DiaSource row of an object into
+            SSObjectRow.dia_list for converters that need more than the
+            running reductions in SSObjectRow.aggregate. This makes memory
+            use grow with the number of observations of an object.
+        input_sssource_filename : `str`
+            Path to the sidecar of the SSSource table built from the same
+            inputs as the DiaSource table. When given, H and G12 are fit per
+            filter from the DiaSource magnitudes and SSSource geometry,
+            otherwise the H columns fall back to the MPCORB H.
+        block_size : `int`
+            Number of objects whose DiaSource rows and MPCORB entries are
+            looked up, and whose photometry is fit, together
+        """
         self.parent = parent
         self.output_filename = output_filename
         self.skip_rows = skip_rows
         self.stop_after = stop_after
         self.columns = columns
-        self.indexer = JointIndex(input_dia_filename, input_mpc_filename)
+        self.previous_filename = previous_filename
+        self.changed_filenames = tuple(changed_filenames)
+        self.delta_only = delta_only
+        if previous_filename is not None and\
+                os.path.abspath(previous_filename) ==\
+                os.path.abspath(output_filename):
+            raise ValueError("The previous table can not be overwritten in "
+                             "place, choose a different output_filename")
+        self.block_size = block_size
+        self.indexer = JointIndex(input_dia_filename, input_mpc_filename,
+                                  keep_dia_list, input_sssource_filename)
 
     def _get_objects_list_generator(self) -> Generator:
+        if self.previous_filename is not None:
+            return self.indexer.get_changed_keys(self.changed_filenames)
         return self.indexer.get_ssobject_keys()
 
-    def _intrepret_row(self, object_id):
-        return self.indexer.build_SSObjectRow(object_id)
+    def _intrepret_row(self, row: SSObjectRow) -> SSObjectRow:
+        return row
 
     def run(self):
         with open(self.output_filename, 'w+', newline="") as out_file:
             writer = csv.writer(out_file, quoting=csv.QUOTE_NONE,
                                 lineterminator="\n")
             writer.writerow(self.parent.schema.fields.keys())
-            row_generator = self._get_objects_list_generator()
-            rows = self._make_rows(islice(row_generator, self.skip_rows,
-                                   self.stop_after))
+            row_generator = self.indexer.build_SSObjectRows(
+                islice(self._get_objects_list_generator(), self.skip_rows,
+                       self.stop_after), self.block_size)
+            plan = ConversionPlan(self.parent.schema)
+            rows = self._make_rows(row_generator, plan)
+            if self.previous_filename is not None:
+                key_pos = plan.fields.index(ColumnName("ssObjectId"))
+                replacements = {}
+                for row in rows:
+                    replacements[row[key_pos]] = row
+                rows = merge_with_previous(self.previous_filename,
+                                           self.parent.schema,
+                                           ColumnName("ssObjectId"),
+                                           replacements, self.delta_only,
+                                           plan.fields)
             writer.writerows(rows)
 
 
 class SSObjectFileTable(FileTableInMem):
     schema = SSObject
-    index_columns = (ColumnName(x) for x in ("diaSourceId", "ssObjectId"))
+    index_columns = (ColumnName("ssObjectId"),)
     builder = SSObjectBuilder
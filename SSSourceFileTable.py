@@ -15,9 +15,14 @@ class SSSourceBuilder(FileTableBuilder):
                     "Ast-Sun(J2000z)(km)", "Sun-Ast-Obs(deg)",
                     "V", "Filtermag", "V(H=0)", "Filter", "AstRASigma(mas)",
                     "AstDecSigma(mas)", "PhotometricSigma(mag)")
+    SKY_COLUMNS = ("AstRA(deg)", "AstDec(deg)")
+    TIME_COLUMN = "FieldMJD"
 
 
 class SSSourceFileTable(FileTable):
     schema = SSSource
-    index_columns = tuple(ColumnName(x) for x in ("ssObjectId",))
+    index_columns = tuple(ColumnName(x) for x in
+                          ("ssObjectId", "diaSourceId", "phaseAngle",
+                           "heliocentricDist", "topocentricDist",
+                           "predictedMagnitudeSigma"))
     builder = SSSourceBuilder
@@ -1,4 +1,26 @@
-from .DiaSourceFileTable import DiaSourceFileTable as DiaSourceFT  # noqa: F401
-from .MPCORBFileTable import MPCORBFileTable as MPCORBFT  # noqa: F401
-from .SSObjectFileTable import SSObjectFileTable as SSObjectFT  # noqa: F401
-from .SSSourceFileTable import SSSourceFileTable as SSSourceFT  # noqa: F401
+from importlib import import_module
+
+# Tables are imported on first access, so that importing the package (i.e.
+# to run a single cli command) only pays for the modules that command uses
+_LAZY_ATTRIBUTES = {
+    "DiaSourceFT": (".DiaSourceFileTable", "DiaSourceFileTable"),
+    "MPCORBFT": (".MPCORBFileTable", "MPCORBFileTable"),
+    "SSObjectFT": (".SSObjectFileTable", "SSObjectFileTable"),
+    "SSSourceFT": (".SSSourceFileTable", "SSSourceFileTable"),
+    "DiaSSSourceBuilder": (".DiaSSSourceBuilder", "DiaSSSourceBuilder"),
+}
+
+
+def __getattr__(name):
+    try:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute "
+                             f"{name!r}") from None
+    value = getattr(import_module(module_name, __name__), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
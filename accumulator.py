@@ -7,8 +7,9 @@ from .DiaSourceFileTable import DiaSourceFileTable
 
 
 class ZMQ_indexer_server(Indexer):
-    def __init__(self, do_index: bool, filename: str, columns: Iterable[str]):
-        super().__init__(do_index, filename, columns)
+    def __init__(self, do_index: bool, filename: str, columns: Iterable[str],
+                 backend: str = "sqlite"):
+        super().__init__(do_index, filename, columns, backend=backend)
         self.num_messages = 0
 
         context = zmq.Context()
@@ -16,15 +17,24 @@ class ZMQ_indexer_server(Indexer):
         self.socket.bind("tcp://127.0.0.1:8391")
 
     def serve(self):
-        while True:
-            msg = pickle.loads(self.socket.recv())
-            self.num_messages += len(msg)
-            self.c.executemany(self.insert_command, msg)
-            if self.num_messages % 100000 == 0:
-                print(f"added {self.num_messages} total", end='\r')
+        """Add the rows sent by ZMQ_Indexers until interrupted, then finish
+        the sidecar.
+        """
+        try:
+            while True:
+                msg = pickle.loads(self.socket.recv())
+                self.num_messages += len(msg)
+                self._write(msg)
+                if self.num_messages % 100000 == 0:
+                    print(f"added {self.num_messages} total", end='\r')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
 
 
-def run_server(filename: str):
+def run_server(filename: str, backend: str = "sqlite"):
     zmq_server = ZMQ_indexer_server(True, filename,
-                                    DiaSourceFileTable.index_columns)
+                                    DiaSourceFileTable.index_columns,
+                                    backend=backend)
     zmq_server.serve()
@@ -4,11 +4,22 @@ __all__ = ("TableSchema",)
 
 from abc import ABC
 from dataclasses import dataclass, fields
-from typing import Callable, Iterable, Dict, MutableMapping, ClassVar, Mapping
+from typing import (Any, Callable, Iterable, Dict, MutableMapping, ClassVar,
+                    Mapping, Optional)
 
 from ..customTypes import ColumnName
 
 
+def _formatted(function: Callable[[Any], Any], spec: str) ->\
+        Callable[[Any], str]:
+    def convert(row: Any) -> str:
+        value = function(row)
+        if value.__class__ is str:
+            return value
+        return format(value, spec)
+    return convert
+
+
 @dataclass
 class TableSchema(ABC):
     """Base class for all FileTable schemas. This class is not intended to be
@@ -33,8 +44,16 @@ class TableSchema(ABC):
     The easiest way to ensure this will happen is to put new handler functions
     inside SSTableConvertMod.schemas.columnConversion, or in a file that will
     be imported inside SSTableConvertMod.schemas.__init__.
+
+    Subclasses may also set formats, a mapping of column name to a format
+    spec (i.e. ".9f") that float values returned by the column's handler
+    are written with. Without one a float is written with its full repr,
+    which is both slower to produce and longer than the precision most
+    columns are known to. Handlers of formatted columns return the float
+    itself, or a string such as a null, which is written unchanged.
     """
     registry: ClassVar[MutableMapping[ColumnName, Callable]]
+    formats: ClassVar[Mapping[ColumnName, str]] = {}
     fields: ClassVar[Mapping[ColumnName, type]]
     pos_field: ClassVar[Mapping[int, ColumnName]]
     field_pos: ClassVar[Mapping[ColumnName, int]]
@@ -48,6 +67,12 @@ class TableSchema(ABC):
                       if field not in fields(TableSchema)}
         cls.pos_field = {pos: field for pos, field in enumerate(cls.fields)}
         cls.field_pos = {field: pos for pos, field in enumerate(cls.fields)}
+        for column, spec in cls.formats.items():
+            if column not in cls.fields:
+                raise AttributeError(f"No column named {column} in {cls} to "
+                                     "format")
+            # Fail when the schema is defined rather than on the first row
+            format(0.0, spec)
 
     @classmethod
     def register(cls, column_name: ColumnName) ->\
@@ -60,6 +85,18 @@ class TableSchema(ABC):
             return function
         return inner
 
+    @classmethod
+    def converter(cls, column_name: ColumnName) -> Optional[Callable]:
+        """The handler registered for column_name, wrapped to format its
+        float values with the column's spec if it has one in formats, or
+        None if no handler is registered.
+        """
+        function = cls.registry.get(column_name)
+        spec = cls.formats.get(column_name)
+        if function is None or spec is None:
+            return function
+        return _formatted(function, spec)
+
     @classmethod
     def registry_subset(cls, columns: Iterable[ColumnName]) -> Dict:
         subset: Dict[ColumnName, Callable] = {}
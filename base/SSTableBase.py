@@ -1,21 +1,45 @@
 from __future__ import annotations
 
 __all__ = ("FileTable", "Indexer", "FileTableBuilder", "NoIndexError",
-           "FileTableInMem", "Indexer")
+           "FileTableInMem", "Indexer", "merge_sidecars", "ConversionPlan")
 
 from abc import ABC
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, InitVar
-from itertools import islice
+from functools import reduce
+from itertools import islice, repeat
 from mmap import mmap, PROT_READ
-import pandas as pd
+from multiprocessing import Pool
+from operator import itemgetter
 import sqlite3
 import os
 from typing import (Iterable, Generator, ClassVar, Optional, Type,
-                    Mapping, Tuple, Union, Any, Dict, List)
+                    Mapping, Tuple, Union, Any, Dict, List, Sequence,
+                    Callable, Deque, Iterator)
 import csv
 import sys
 
+import numpy as np
+
 from .SSSchemaBase import TableSchema
+from .binarySidecar import (SIDECAR_BACKENDS, BinarySidecar,
+                            BinarySidecarWriter, is_binary_sidecar)
+from .columnCache import cached_frame
+from .databaseSink import DATABASE_BACKENDS, DatabaseSink
+from .compression import (COMPRESSIONS, BlockReader, compression_of,
+                          open_text_output)
+from .lineIndex import (LineIndex, snap_to_line, skip_lines,
+                        snap_stream_to_line, skip_stream_lines,
+                        split_ranges)
+from .noise import noise_per_thread, seed_noise
+from .parallelScan import rows_to_records, scan_range
+from .resultCache import ColumnResultCache
+from .externalSort import ObjectRangeIndex
+from .skyIndex import SkyIndex, SkyIndexer
+from .timePartition import TIMES_SUFFIX, TimePartitioner, read_manifest
+from .tokenizer import RowTokenizer, count_lines
 
 from ..customTypes import ColumnName
 
@@ -32,53 +56,258 @@ class BuilderDescriptor:
 
 
 class Indexer:
-    def __init__(self, do_index: bool, filename: str, columns: Iterable[str]):
+    """Writes the index values of each row of a table being built to its
+    sidecar, either a sqlite table with an index on ssObjectId or, with a
+    backend of "binary", a BinarySidecar.
+    """
+    closed = True
+    # Whether the sidecar is finished, or there is none to write
+
+    def __init__(self, do_index: bool, filename: str, columns: Iterable[str],
+                 backend: str = "sqlite"):
+        if backend not in SIDECAR_BACKENDS:
+            raise ValueError(f"Unknown sidecar backend {backend}, expected "
+                             f"one of {', '.join(SIDECAR_BACKENDS)}")
         self.do_index = do_index
         self.filename = filename
+        self.backend = backend
         if do_index:
             self.accumulate_len = 5000
             self.columns = tuple(columns)
             if os.path.exists(filename):
                 os.remove(filename)
-            self.db = sqlite3.connect(filename, timeout=10)
-            self.c = self.db.cursor()
-            command = f"create table IF NOT EXISTS ind " +\
-                f"{tuple(f'{c} text ' for c in columns)}"
-            command = command.replace("'", "").rstrip(',)')+')'
-            self.c.execute(command)
+            if backend == "binary":
+                self.writer = BinarySidecarWriter(filename, self.columns)
+            else:
+                self.db = sqlite3.connect(filename, timeout=10)
+                self.c = self.db.cursor()
+                command = f"create table IF NOT EXISTS ind " +\
+                    f"{tuple(f'{c} text ' for c in columns)}"
+                command = command.replace("'", "").rstrip(',)')+')'
+                self.c.execute(command)
+                self.insert_command = "insert into ind values " +\
+                    f"{tuple('? ' for _ in range(len(columns)))}"
+                self.insert_command =\
+                    self.insert_command.replace("'", "").rstrip(',)')+')'
             self.iteration = 0
-            self.insert_command = "insert into ind values " +\
-                f"{tuple('? ' for _ in range(len(columns)))}"
-            self.insert_command =\
-                self.insert_command.replace("'", "").rstrip(',)')+')'
             self.tracker = [None]*self.accumulate_len
             self.tracker_len = 0
+            self.closed = False
 
-    def insert(self, generator) -> Generator:
-        if self.do_index:
-            values = tuple(generator)
-            self.tracker[self.tracker_len] = tuple(v for v, truth in
-                                                   values if truth)
-            self.tracker_len += 1
-            if self.tracker_len == self.accumulate_len:
-                with self.db:
-                    self.c.executemany(self.insert_command,
-                                       self.tracker)
-                self.tracker_len = 0
-            yield from (value for value, _ in values)
-        else:
-            yield from (value for value, _ in generator)
+    def _write(self, rows: Sequence[Tuple[str, ...]]):
+        if self.backend == "binary":
+            self.writer.extend(rows)
+            return
+        with self.db:
+            self.c.executemany(self.insert_command, rows)
+
+    def add(self, values: Tuple[str, ...]):
+        """Queue the index values of one row, in the order of the sidecar
+        columns, writing them out once enough have accumulated.
+        """
+        self.tracker[self.tracker_len] = values
+        self.tracker_len += 1
+        if self.tracker_len == self.accumulate_len:
+            self._write(self.tracker)
+            self.tracker_len = 0
+
+    def index_rows(self, rows: Iterable[Tuple[str, ...]],
+                   index: Callable[[Tuple[str, ...]], Tuple[str, ...]]) ->\
+            Generator[Tuple[str, ...], None, None]:
+        """Yield rows unchanged, adding the values index picks out of each
+        one to the sidecar.
+        """
+        if not self.do_index:
+            yield from rows
+            return
+        for row in rows:
+            self.add(index(row))
+            yield row
+
+    def close(self):
+        """Write any queued values and finish the sidecar. This happens when
+        the Indexer is deleted if it was not closed before.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.tracker_len:
+            self._write(self.tracker[:self.tracker_len])
+            self.tracker_len = 0
+        if self.backend == "binary":
+            self.writer.close()
+            return
+        self.c.execute("CREATE INDEX objid on ind(ssObjectId)")
+        self.db.commit()
+        self.db.close()
 
     def __del__(self):
-        if self.do_index:
-            if self.tracker_len:
-                with self.db:
-                    self.c.executemany(self.insert_command,
-                                       self.tracker[:self.tracker_len])
-                    self.tracker_len = 0
-            self.c.execute("CREATE INDEX objid on ind(ssObjectId)")
-            self.db.commit()
-            self.db.close()
+        self.close()
+
+
+def merge_sidecars(partial_filenames: Sequence[str], filename: str,
+                   sources: Optional[Sequence[str]] = None,
+                   backend: Optional[str] = None):
+    """Combine sidecars written by separate Indexers into one.
+
+    Sqlite partial sidecars are attached and copied over with a single
+    insert ... select each, and the ssObjectId index is built once at the
+    end. Binary partial sidecars, which are already sorted, are merged with
+    BinarySidecar.merge without parsing their rows. Partial sidecars of
+    another backend than the combined one have their rows copied over
+    through an Indexer.
+
+    Parameters
+    ----------
+    partial_filenames : `Sequence of str`
+        Paths of the sidecars to combine, all with the same columns
+    filename : `str`
+        Path to write the combined sidecar to
+    sources : `Sequence of str`
+        If given, a source column is added to the combined sidecar holding,
+        for each row, the entry of sources that corresponds to the partial
+        sidecar the row came from
+    backend : `str`
+        Backend of the combined sidecar, sqlite or binary, defaulting to
+        that of the first partial sidecar
+    """
+    if not partial_filenames:
+        raise ValueError("No sidecars to merge")
+    backends = ["binary" if is_binary_sidecar(partial) else "sqlite"
+                for partial in partial_filenames]
+    if backend is None:
+        backend = backends[0]
+    if backend not in SIDECAR_BACKENDS:
+        raise ValueError(f"Unknown sidecar backend {backend}, expected one "
+                         f"of {', '.join(SIDECAR_BACKENDS)}")
+    if set(backends) != {backend}:
+        _copy_sidecars(partial_filenames, filename, sources, backend)
+        return
+    if backend == "binary":
+        BinarySidecar.merge(partial_filenames, filename, sources)
+        return
+    if os.path.exists(filename):
+        os.remove(filename)
+    db = sqlite3.connect(filename, timeout=10)
+    # The combined sidecar is written from scratch and is useless if the
+    # merge is interrupted, so there is no need to wait for each write to
+    # reach the disk
+    db.execute("pragma synchronous = off")
+    for i, partial in enumerate(partial_filenames):
+        db.execute("attach database ? as part", (partial,))
+        if i == 0:
+            db.execute(db.execute("select sql from part.sqlite_master where "
+                                  "type = 'table' and name = 'ind'"
+                                  ).fetchone()[0])
+            if sources is not None:
+                db.execute("alter table ind add column source text")
+        with db:
+            if sources is not None:
+                db.execute("insert into ind select *, ? from part.ind",
+                           (sources[i],))
+            else:
+                db.execute("insert into ind select * from part.ind")
+        db.execute("detach database part")
+    db.execute("CREATE INDEX objid on ind(ssObjectId)")
+    db.commit()
+    db.close()
+
+
+def _sidecar_rows(filename: str) ->\
+        Tuple[Tuple[str, ...], Iterable[Sequence[str]]]:
+    """The columns of a sidecar of either backend, and an iterable of its
+    rows in the order they were written.
+    """
+    if is_binary_sidecar(filename):
+        sidecar = BinarySidecar(filename)
+        return sidecar.columns, sidecar
+    db = sqlite3.connect(filename)
+    cursor = db.execute("select * from ind")
+    columns = tuple(description[0] for description in cursor.description)
+    return columns, cursor
+
+
+def _copy_sidecars(partial_filenames: Sequence[str], filename: str,
+                   sources: Optional[Sequence[str]], backend: str):
+    """Combine sidecars by adding every row of each to an Indexer of
+    backend, for when they are not all of that backend.
+    """
+    indexer = None
+    for i, partial in enumerate(partial_filenames):
+        columns, rows = _sidecar_rows(partial)
+        extra: Tuple[str, ...] = ()
+        if sources is not None:
+            columns += ("source",)
+            extra = (sources[i],)
+        if indexer is None:
+            indexer = Indexer(True, filename, columns, backend=backend)
+        elif columns != indexer.columns:
+            raise ValueError(f"{partial} has columns {columns}, not "
+                             f"{indexer.columns}")
+        for row in rows:
+            indexer.add(tuple(row) + extra)
+    indexer.close()  # type: ignore
+
+
+NULL = "\\N"
+
+
+class ConversionPlan:
+    """The conversion of input rows into rows of a schema, worked out once
+    per run so that converting a row does no registry lookups.
+
+    The registered conversion functions of the chosen columns are called in
+    column order, and a single getter assembles their values, along with
+    null for columns without a function, into the output row. Index values
+    are picked out of the finished row the same way.
+
+    Parameters
+    ----------
+    schema : `TableSchema`
+        Schema whose registry holds the conversion functions
+    columns : `Iterable of str`
+        Columns of the output rows, defaulting to every field of schema
+    index_columns : `Iterable of str`
+        Columns to pick out with index, in the order given
+    """
+    def __init__(self, schema: Type[TableSchema],
+                 columns: Optional[Iterable[ColumnName]] = None,
+                 index_columns: Iterable[ColumnName] = ()):
+        registry = schema.registry
+        self.fields = tuple(schema.fields if columns is None else columns)
+        self.function_columns = tuple(column for column in self.fields
+                                      if column in registry)
+        self.functions = tuple(schema.converter(column)
+                               for column in self.function_columns)
+        # Columns without a function take the null appended after the values
+        positions = []
+        n_functions = 0
+        for column in self.fields:
+            if column in registry:
+                positions.append(n_functions)
+                n_functions += 1
+            else:
+                positions.append(-1)
+        self._assemble = self.getter(positions)
+        self.index = self.getter([self.fields.index(column)
+                                  for column in index_columns
+                                  if column in self.fields])
+
+    @staticmethod
+    def getter(positions: Sequence[int]) ->\
+            Callable[[Sequence[str]], Tuple[str, ...]]:
+        """Like operator.itemgetter, but always returns a tuple."""
+        if not positions:
+            return lambda values: ()
+        if len(positions) == 1:
+            pos = positions[0]
+            return lambda values: (values[pos],)
+        return itemgetter(*positions)
+
+    def convert(self, row: Any) -> Tuple[str, ...]:
+        values = [function(row) for function in self.functions]
+        values.append(NULL)
+        return self._assemble(values)
 
 
 @dataclass
@@ -101,12 +330,35 @@ class FileTableBuilder(ABC):
     # This is the schema of the input file
     input_schema: ClassVar[Tuple[Union[Type[TableSchema], str], ...]]
     INDEXER: Optional[str] = None
+    SKY_COLUMNS: ClassVar[Optional[Tuple[str, str]]] = None
+    # Input columns holding the right ascension and declination of each row
+    # in degrees, for builders that can write a sky index
+    TIME_COLUMN: ClassVar[Optional[str]] = None
+    # Input column holding the MJD of each row, for builders that can
+    # partition their output by time
+    DELIMITER: ClassVar[Optional[str]] = ","
+    # Separator of the fields of input lines, None meaning runs of whitespace
+    THREAD_CHUNK_ROWS: ClassVar[int] = 1 << 13
+    # Number of input lines in each chunk converted by a conversion thread
 
     def __init__(self, parent: FileTable, input_filename: str,
                  output_filename: str, skip_rows: int,
                  stop_after: Optional[int] = None,
                  columns: Optional[Iterable[ColumnName]] = None,
-                 do_index: Optional[bool] = True):
+                 do_index: Optional[bool] = True,
+                 byte_range: Optional[Tuple[int, Optional[int]]] = None,
+                 line_index: bool = False,
+                 seed: Optional[int] = None,
+                 indexer_class: Optional[Type] = None,
+                 sky_order: Optional[int] = None,
+                 time_window: Optional[float] = None,
+                 compression: Optional[str] = None,
+                 compression_level: Optional[int] = None,
+                 compression_threads: int = 1,
+                 index_backend: str = "sqlite",
+                 column_cache: Optional[str] = None,
+                 conversion_threads: int = 1,
+                 database: Optional[str] = None):
         """
         Parameters
         ----------
@@ -127,6 +379,65 @@ class FileTableBuilder(ABC):
             When making an input file, should the columns defined in
             cls.index_columns be indexed? This is useful for reopening the
             file later, but doubles the conversion time.
+        byte_range : `tuple of int`
+            Only convert the lines of the input file that start within
+            [start, end) bytes, an end of None meaning the end of the file.
+            Both ends are snapped forward to line boundaries so that
+            adjacent ranges never share or drop a line. skip_rows is still
+            counted from the start of the file, so header lines are skipped
+            no matter where the range starts.
+        line_index : `bool`
+            Use, building it if it does not exist yet, a line offset index
+            stored next to the input file. This makes skipping to a given
+            row O(1) rather than O(skip_rows).
+        seed : `int`
+            Seed for the noise streams used by conversion functions. Each
+            stream is seeded from this and the byte offset the conversion
+            starts at, so output is reproducible for a given seed and split
+            of the input into byte ranges.
+        indexer_class : `type`
+            Indexer to use in place of the builder's INDEXER, i.e. a local
+            Indexer when a shared index server is not running
+        sky_order : `int`
+            Write a SkyIndex of the output at this HEALPix order, which lets
+            the table answer cone searches without reading every row. Only
+            builders that define SKY_COLUMNS support this.
+        time_window : `float`
+            Partition the output into one file per this many days, in which
+            case output_filename is a directory that receives the partitions
+            and a manifest (see TimePartitioner), while the sidecar is still
+            written to output_filename + ".sidecar". Only builders that
+            define TIME_COLUMN support this.
+        compression : `str`
+            Compress the output with gzip or zstd, in independently
+            compressed blocks listed in a BlockIndex so that the table can
+            still be read from any row (see BlockWriter). Inputs are
+            decompressed as they are read whatever this is set to, in which
+            case byte_range counts decompressed bytes.
+        compression_level : `int`
+            Level to compress the output at, defaulting to that of the gzip
+            or zstd tools
+        compression_threads : `int`
+            Number of threads to compress the output with
+        index_backend : `str`
+            Write the sidecar as a sqlite database, or as a BinarySidecar
+            with "binary", which is smaller and faster to look objects up in
+        column_cache : `str`
+            Directory to keep the converted values of every column in (see
+            ColumnResultCache). Building the table again from the same input
+            then only runs the conversion functions whose source changed,
+            and does not read the input at all if none did.
+        conversion_threads : `int`
+            Number of threads to convert the input with. Successive chunks
+            of THREAD_CHUNK_ROWS lines are converted concurrently and
+            written in order, without forking or pickling anything. Noise
+            streams are seeded for each chunk as if it were its own byte
+            range, whatever the number of threads, so with a seed the output
+            does not depend on it.
+        database : `str`
+            Write the output into a table of a sqlite or duckdb database at
+            output_filename, named after the schema, rather than to a CSV
+            file (see DatabaseSink). The sidecar is written as usual.
         """
         self.parent = parent
         self.input_filename = input_filename
@@ -135,10 +446,49 @@ class FileTableBuilder(ABC):
         self.stop_after = stop_after
         self.columns = columns
         self.do_index = do_index
-
-        self.index_pos = {self.parent.schema.field_pos[column]: column
-                          for column in
-                          self.parent.index_columns}
+        self.byte_range = byte_range
+        self.line_index = line_index
+        self.seed = seed
+        self.indexer_class = indexer_class
+        if sky_order is not None and self.SKY_COLUMNS is None:
+            raise ValueError(f"{type(self).__name__} can not write a sky "
+                             "index")
+        self.sky_order = sky_order
+        if time_window is not None and self.TIME_COLUMN is None:
+            raise ValueError(f"{type(self).__name__} can not partition its "
+                             "output by time")
+        self.time_window = time_window
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}, expected "
+                             f"one of {', '.join(COMPRESSIONS)}")
+        if compression is not None and time_window is not None:
+            raise ValueError("Outputs partitioned by time can not be "
+                             "compressed")
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_threads = compression_threads
+        if index_backend not in SIDECAR_BACKENDS:
+            raise ValueError(f"Unknown sidecar backend {index_backend}, "
+                             f"expected one of {', '.join(SIDECAR_BACKENDS)}")
+        self.index_backend = index_backend
+        self.column_cache = column_cache
+        if conversion_threads < 1:
+            raise ValueError("conversion_threads must be at least 1")
+        if conversion_threads > 1 and column_cache is not None:
+            raise ValueError("A column cache can not be used with more than "
+                             "one conversion thread, as it hands out values "
+                             "in row order")
+        self.conversion_threads = conversion_threads
+        if database is not None:
+            if database not in DATABASE_BACKENDS:
+                raise ValueError(f"Unknown database {database}, expected "
+                                 f"one of {', '.join(DATABASE_BACKENDS)}")
+            if time_window is not None or compression is not None or\
+                    sky_order is not None:
+                raise ValueError("Outputs written to a database can not be "
+                                 "partitioned by time, compressed or sky "
+                                 "indexed")
+        self.database = database
 
     def __init_subclass__(cls):
         """This handles adding all the appropriate attributes and validates that
@@ -152,71 +502,322 @@ class FileTableBuilder(ABC):
                                       "implement class attribute "
                                       "input_schema")
 
-    def _make_rows(self, input_rows: Iterable[bytes],
-                   columns: Optional[Iterable[ColumnName]] = None,
-                   skip_rows=0, stop_after=None) ->\
-            Generator[Generator[str, None, None], None, None]:
-        """This funciton is responsible for creating generators that apply
-        schema conversions to a generator of input row mappings. If a schema
-        does not have a conversion function registered for a given column,
-        null is yielded instead.
-
-        The function itself yields a generator for each row yielded from
-        the input_rows generator, making it a generator of generators.
+    def _make_rows(self, input_rows: Iterable[bytes], plan: ConversionPlan,
+                   skip_rows=0, stop_after=None,
+                   trackers: Sequence[Any] = ()) ->\
+            Generator[Tuple[str, ...], None, None]:
+        """This funciton is responsible for applying schema conversions to a
+        generator of input rows, yielding a tuple for each converted row. If
+        a schema does not have a conversion function registered for a given
+        column, null is used instead. Each input row is also passed to the
+        add method of every tracker, i.e. a SkyIndexer.
         """
-        registry = self.parent.schema.registry
-        if columns is None:
-            fields = self.parent.schema.fields
-        else:
-            fields = columns
-        # make the generator objects for each column
+        convert = plan.convert
         if stop_after is not None:
             stop: Optional[int] = skip_rows + stop_after
         else:
             stop = None
-        for i, file_row in enumerate(islice(input_rows, skip_rows, stop)):
-            if file_row == '\n':
+        rows = self._intrepret_rows(islice(input_rows, skip_rows, stop))
+        try:
+            if not trackers:
+                yield from map(convert, rows)
+                return
+            for file_row_interp in rows:
+                for tracker in trackers:
+                    tracker.add(file_row_interp)
+                yield convert(file_row_interp)
+        except UnicodeDecodeError:
+            print(f"Error processing {self.input_filename}")
+            sys.exit(1)
+
+    def _chunks(self, input_rows: Iterable[bytes], start: int,
+                stop_after: Optional[int]) ->\
+            Generator[Tuple[int, List[bytes]], None, None]:
+        """Split the lines to convert into lists of THREAD_CHUNK_ROWS lines,
+        each along with the byte offset of its first line.
+        """
+        lines = islice(input_rows, stop_after)
+        while True:
+            chunk = list(islice(lines, self.THREAD_CHUNK_ROWS))
+            if not chunk:
                 return
+            yield start, chunk
+            start += sum(map(len, chunk))
+
+    def _make_rows_chunked(self, input_rows: Iterable[bytes], start: int,
+                           plan: ConversionPlan, stop_after=None,
+                           trackers: Sequence[Any] = ()) ->\
+            Generator[Tuple[str, ...], None, None]:
+        """Like _make_rows, but seeding the noise streams at the start of
+        every chunk of THREAD_CHUNK_ROWS lines, as _make_rows_threaded does.
+        """
+        source = os.path.basename(self.input_filename)
+        for offset, lines in self._chunks(input_rows, start, stop_after):
+            seed_noise(self.seed, offset, source)
+            yield from self._make_rows(lines, plan, 0, None, trackers)
+
+    def _make_rows_threaded(self, input_rows: Iterable[bytes], start: int,
+                            plan: ConversionPlan, stop_after=None,
+                            trackers: Sequence[Any] = ()) ->\
+            Generator[Tuple[str, ...], None, None]:
+        """Like _make_rows, but converting chunks of the input concurrently
+        in conversion_threads threads, keeping a bounded number of chunks in
+        flight and yielding their rows in order. Trackers are given the
+        input rows of each chunk in order as it is yielded.
+        """
+        source = os.path.basename(self.input_filename)
+
+        def convert(chunk: Tuple[int, List[bytes]]) ->\
+                Tuple[List[Any], List[Tuple[str, ...]]]:
+            offset, lines = chunk
+            seed_noise(self.seed, offset, source)
+            rows = list(self._intrepret_rows(lines))
+            return (rows if trackers else []), list(map(plan.convert, rows))
+
+        pending: Deque[Future] = deque()
+
+        def finished() -> Iterator[Tuple[str, ...]]:
+            rows, converted = pending.popleft().result()
+            for row in rows:
+                for tracker in trackers:
+                    tracker.add(row)
+            return iter(converted)
+
+        with noise_per_thread(),\
+                ThreadPoolExecutor(self.conversion_threads) as pool:
             try:
-                file_row_interp = self._intrepret_row(file_row.decode())
+                for chunk in self._chunks(input_rows, start, stop_after):
+                    pending.append(pool.submit(convert, chunk))
+                    while len(pending) > 2*self.conversion_threads:
+                        yield from finished()
+                while pending:
+                    yield from finished()
             except UnicodeDecodeError:
                 print(f"Error processing {self.input_filename}")
                 sys.exit(1)
-            yield (registry[column](file_row_interp) if column in registry else
-                   "\\N"
-                   for column in fields)
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    @contextmanager
+    def _open_output(self, filename: str, schema: Type[TableSchema]):
+        """Open the output at filename, with its header written, yielding
+        an object to write rows to with writerow or writerows, along with
+        the trackers that must see every input row before its converted row
+        is written. Sky indexes and time partitions are finished once the
+        output is closed.
+        """
+        if self.database is not None:
+            with DatabaseSink(filename, self.database, schema.__name__,
+                              schema.fields) as sink:
+                yield sink, []
+            return
+        if self.time_window is not None:
+            partitioner = TimePartitioner(filename, self.time_window,
+                                          self.TIME_COLUMN,  # type: ignore
+                                          list(schema.fields.keys()),
+                                          self.sky_order, self.SKY_COLUMNS)
+            yield partitioner, [partitioner]
+            partitioner.close()
+            return
+        sky = None
+        if self.sky_order is not None:
+            sky = SkyIndexer(self.sky_order, *self.SKY_COLUMNS,  # type: ignore
+                             filename)
+        with open_text_output(filename, self.compression,
+                              self.compression_level,
+                              self.compression_threads) as out_file:
+            writer = csv.writer(out_file, quoting=csv.QUOTE_NONE,
+                                lineterminator="\n")
+            writer.writerow(schema.fields.keys())
+            yield writer, [sky] if sky is not None else []
+        if sky is not None:
+            sky.write()
 
     def _intrepret_row(self, interp_row: str) -> Dict:
         """A method responsible for converting a string representation of
         a row in an input file into a mapping of input schema to value.
         """
-        return {k: v for k, v in zip(self.input_schema,  # type: ignore
-                                     interp_row.split(','))}
+        return dict(zip(self.input_schema,  # type: ignore
+                        interp_row.split(self.DELIMITER)))
+
+    def _intrepret_rows(self, input_rows: Iterable[Any]) -> Iterable[Any]:
+        """Lazily interpret every row of input_rows with _intrepret_row.
+        Builders that keep the default _intrepret_row have their lines split
+        by a RowTokenizer, which gives the same rows without a Python call
+        per line.
+        """
+        if type(self)._intrepret_row is FileTableBuilder._intrepret_row:
+            return RowTokenizer(self.input_schema,  # type: ignore
+                                self.DELIMITER).rows(input_rows)
+        return (self._intrepret_row(row.decode()) for row in input_rows)
+
+    def _resolve_range(self, mm_in: Union[mmap, BlockReader]) ->\
+            Tuple[int, Optional[int], Optional[int]]:
+        """Work out the byte offsets of the first and one past the last line
+        to convert, along with how many lines should still be counted off
+        with stop_after once reading has started. The end is None for
+        streamed inputs that should be read to the end, as their length is
+        not known up front.
+        """
+        index = LineIndex.open(self.input_filename) if self.line_index\
+            else None
+        streamed = not isinstance(mm_in, mmap)
+        if index is not None:
+            header_end = index.row_offset(self.skip_rows)
+        elif streamed:
+            header_end = skip_stream_lines(mm_in, 0,  # type: ignore
+                                           self.skip_rows)
+        else:
+            header_end = skip_lines(mm_in, 0, self.skip_rows)
+        snap = snap_stream_to_line if streamed else snap_to_line
+        start = 0
+        end: Optional[int] = None if streamed else len(mm_in)
+        if self.byte_range is not None:
+            range_start, range_end = self.byte_range
+            start = snap(mm_in, range_start)  # type: ignore
+            if range_end is not None:
+                end = snap(mm_in, range_end)  # type: ignore
+        start = max(start, header_end)
+        stop_after = self.stop_after
+        if stop_after is not None and index is not None:
+            last = index.row_offset(index.row_at(start) + stop_after)
+            end = last if end is None else min(end, last)
+            stop_after = None
+        return start, None if end is None else max(start, end), stop_after
+
+    @staticmethod
+    def _read_lines(mm_in: Union[mmap, BlockReader], start: int,
+                    end: Optional[int]) -> Generator[bytes, None, None]:
+        """Yield the lines of mm_in starting at byte offset start, stopping
+        at end, which must fall on a line boundary, or at the end of the
+        input if end is None.
+        """
+        if end is not None and start >= end:
+            return
+        mm_in.seek(start)
+        lines = iter(mm_in.readline, b"")
+        if end is None or (isinstance(mm_in, mmap) and end == len(mm_in)):
+            yield from lines
+            return
+        if isinstance(mm_in, mmap):
+            # Count the lines of the range in bulk, rather than adding up
+            # the length of each line as it is read
+            yield from islice(lines, count_lines(mm_in, start, end))
+            return
+        position = start
+        for line in lines:
+            position += len(line)
+            yield line
+            if position >= end:
+                return
+
+    @contextmanager
+    def _open_input(self):
+        """Open the input, yielding the byte offset conversion starts at, a
+        generator of the lines to convert, and how many of them to convert
+        (see _resolve_range). Uncompressed inputs are memory mapped, while
+        compressed ones are decompressed as they are read, through a
+        BlockReader.
+        """
+        if compression_of(self.input_filename) is not None:
+            with BlockReader(self.input_filename) as reader:
+                start, end, stop_after = self._resolve_range(reader)
+                yield start, self._read_lines(reader, start, end), stop_after
+            return
+        with open(self.input_filename, "rb") as in_file,\
+                mmap(in_file.fileno(), 0, prot=PROT_READ) as mm_in:
+            start, end, stop_after = self._resolve_range(mm_in)
+            yield start, self._read_lines(mm_in, start, end), stop_after
 
     def run(self):
-        if self.INDEXER is not None:
+        if self.indexer_class is not None:
+            indexer = self.indexer_class
+        elif self.INDEXER is not None:
             indexer = self.INDEXER
         else:
             indexer = Indexer
         indexes = indexer(self.do_index,
                           self.output_filename+".sidecar",
-                          tuple(self.parent.index_columns)
-                          )
-        with open(self.input_filename, "rb") as in_file,\
-                open(self.output_filename, 'w+', newline='') as out_file:
-            writer = csv.writer(out_file, quoting=csv.QUOTE_NONE,
-                                lineterminator="\n")
-            writer.writerow(self.parent.schema.fields.keys())
-            with mmap(in_file.fileno(), 0, prot=PROT_READ) as mm_in:
-                rows_generator = iter(mm_in.readline, b"")
-                rows = self._make_rows(rows_generator, self.columns,
-                                       self.skip_rows,
-                                       self.stop_after)
-                writer.writerows(indexes.insert(
-                    (b,
-                     i in self.index_pos
-                     )
-                    for i, b in enumerate(row_gen)) for row_gen in rows)
+                          tuple(self.parent.index_columns),
+                          backend=self.index_backend)
+        with self._open_input() as (start, rows_generator, stop_after),\
+                self._open_output(self.output_filename,
+                                  self.parent.schema) as (writer, trackers):
+            seed_noise(self.seed, start,
+                       os.path.basename(self.input_filename))
+            plan = ConversionPlan(self.parent.schema, self.columns,
+                                  self.parent.index_columns)
+            cache = None
+            if self.column_cache is not None:
+                cache = self._result_cache(start, stop_after)
+                plan.functions, cached_rows = cache.wrap(
+                    plan.function_columns, plan.functions)
+            if cache is not None and cached_rows >= 0 and not trackers:
+                # Every column is cached, so the input is not needed
+                rows = map(plan.convert, repeat(None, cached_rows))
+            else:
+                rows = self._convert_rows(rows_generator, start, plan,
+                                          stop_after, trackers)
+            try:
+                writer.writerows(indexes.index_rows(rows, plan.index))
+            except BaseException:
+                if cache is not None:
+                    cache.discard()
+                raise
+            if cache is not None:
+                cache.close()
+
+    def _convert_rows(self, input_rows: Iterable[bytes], start: int,
+                      plan: ConversionPlan, stop_after: Optional[int],
+                      trackers: Sequence[Any] = ()) ->\
+            Iterator[Tuple[str, ...]]:
+        """The converted rows of the lines of the input starting at byte
+        offset start, converted in threads if conversion_threads is more
+        than 1.
+        """
+        if self.conversion_threads > 1:
+            return self._make_rows_threaded(input_rows, start, plan,
+                                            stop_after, trackers)
+        return self._make_rows_chunked(input_rows, start, plan, stop_after,
+                                       trackers)
+
+    def stream(self, batch_size: int = 1 << 16) ->\
+            Generator[np.ma.MaskedArray, None, None]:
+        """Convert the input without writing anything, yielding the rows a
+        batch of up to batch_size at a time as numpy masked structured
+        arrays, with a field per column typed as in decode_batch: int64 for
+        int columns, masked where they are null, float64 for float columns,
+        with nulls as NaN, and str objects for the rest, so every batch has
+        the same dtype. The output
+        options of the builder, along with indexing and the column cache,
+        are ignored, while everything that chooses or converts rows, i.e.
+        byte_range, columns, seed and conversion_threads, applies as in run.
+        """
+        with self._open_input() as (start, rows_generator, stop_after):
+            seed_noise(self.seed, start,
+                       os.path.basename(self.input_filename))
+            plan = ConversionPlan(self.parent.schema, self.columns)
+            rows = self._convert_rows(rows_generator, start, plan,
+                                      stop_after)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    return
+                yield rows_to_records(batch, self.parent.schema.fields,
+                                      plan.fields)
+
+    def _result_cache(self, start: int, stop_after: Optional[int]) ->\
+            ColumnResultCache:
+        """The ColumnResultCache of the rows of the input this builder
+        converts, starting at byte offset start.
+        """
+        stats = os.stat(self.input_filename)
+        return ColumnResultCache(self.column_cache,  # type: ignore
+                                 [type(self).__name__,
+                                  os.path.abspath(self.input_filename),
+                                  stats.st_size, stats.st_mtime_ns, start,
+                                  self.byte_range, stop_after, self.seed])
 
 
 @dataclass
@@ -251,7 +852,8 @@ class FileTable(ABC):
     input file are not deliniated by a space, or if there is a more complicated
     mapping of schema name to column. The default simply splits a line on a
     comma character, and creates a dictionary mapping between the column name
-    and value.
+    and value. Builders whose fields are only separated by something else set
+    DELIMITER instead, which keeps the faster RowTokenizer in use.
     """
     schema: ClassVar[Type[TableSchema]]
     # Schema object to use when building the output table
@@ -305,12 +907,19 @@ class FileTable(ABC):
         self.index_pos = {self.schema.field_pos[column]: column for column in
                           self.index_columns}
         self._file_handle = None
-        self._mmap: Optional[mmap] = None
+        self._mmap: Optional[Union[mmap, BlockReader]] = None
 
         self._open(do_index)
 
     def _open(self, do_index: bool):
-        if self.filename is not None:
+        # Tables partitioned by time are directories, whose partitions are
+        # opened as they are read
+        if self.filename is not None and not os.path.isdir(self.filename):
+            if compression_of(self.filename) is not None:
+                # Compressed tables are read through the same interface,
+                # decompressing from the nearest block when seeking
+                self._mmap = BlockReader(self.filename)
+                return
             self._file_handle = open(self.filename, 'rb')
             self._mmap = mmap(self._file_handle.fileno(), 0,
                               prot=PROT_READ)
@@ -330,6 +939,8 @@ class FileTable(ABC):
             self._mmap.seek(value)
 
     def __iter__(self):
+        if self._mmap is None and self.filename is not None:
+            return self.time_range(-np.inf, np.inf)
         self._seek(0)
         generator = (row.decode().split(',')
                      for row in iter(self._mmap.readline, b""))
@@ -338,6 +949,153 @@ class FileTable(ABC):
         generator = (self._load_line(r) for r in generator)
         return generator
 
+    def cone_search(self, ra: float, dec: float, radius: float) ->\
+            Generator[Mapping[ColumnName, Any], None, None]:
+        """Yield the rows within radius degrees of ra, dec in the order
+        they appear in the file. This needs the table to have been built
+        with a sky index, and only reads the rows in the HEALPix pixels
+        that overlap the search. Tables partitioned by time are searched a
+        partition at a time, in order of time, each with its own index.
+        """
+        if self.filename is not None and os.path.isdir(self.filename):
+            for entry in read_manifest(self.filename)["partitions"]:
+                partition = type(self)(  # type: ignore
+                    filename=os.path.join(self.filename, entry["filename"]),
+                    do_index=False)
+                yield from partition.cone_search(ra, dec, radius)
+            return
+        index = SkyIndex.load(self.filename)  # type: ignore
+        if index is None:
+            raise ValueError(f"{self.filename} does not have an up to date "
+                             "sky index, build it with sky_order set")
+        lines = LineIndex.open(self.filename)  # type: ignore
+        for row in index.cone_rows(ra, dec, radius):
+            # Row numbers do not count the header
+            self._seek(lines.row_offset(int(row) + 1))
+            yield self._load_line(self._mmap.readline()  # type: ignore
+                                  .decode().split(','))
+
+    def object_rows(self, ssObjectId: int) ->\
+            Generator[Mapping[ColumnName, Any], None, None]:
+        """Yield the rows of the object ssObjectId. This needs the table to
+        have been sorted with sort_by_object, and reads the rows of the
+        object as one contiguous range of the file, or to have a binary
+        sidecar, which holds the position of each row of the object.
+        """
+        index = ObjectRangeIndex.load(self.filename)  # type: ignore
+        sidecar = f"{self.filename}.sidecar"
+        if index is None and is_binary_sidecar(sidecar):
+            lines = LineIndex.open(self.filename)  # type: ignore
+            for row in BinarySidecar(sidecar).row_numbers(ssObjectId)\
+                    .tolist():
+                # Row numbers do not count the header
+                self._seek(lines.row_offset(row + 1))
+                yield self._load_line(self._mmap.readline()  # type: ignore
+                                      .decode().split(','))
+            return
+        if index is None:
+            raise ValueError(f"{self.filename} does not have an up to date "
+                             "range index, sort it with sort_by_object, or "
+                             "a binary sidecar")
+        found = index.lookup(int(ssObjectId))
+        if found is None:
+            return
+        offset, count = found
+        self._seek(offset)
+        for _ in range(count):
+            yield self._load_line(self._mmap.readline()  # type: ignore
+                                  .decode().split(','))
+
+    def time_range(self, start: float, end: float) ->\
+            Generator[Mapping[ColumnName, Any], None, None]:
+        """Yield the rows whose time, as an MJD, is in [start, end). This
+        needs the table to have been built with time_window set, and only
+        opens the partitions whose times overlap the range. Rows are yielded
+        a partition at a time, in order of time, and in file order within a
+        partition.
+        """
+        if self.filename is None or not os.path.isdir(self.filename):
+            raise ValueError(f"{self.filename} is not partitioned by time, "
+                             "build it with time_window set")
+        for entry in read_manifest(self.filename)["partitions"]:
+            if entry["min"] is None or entry["max"] < start or\
+                    entry["min"] >= end:
+                continue
+            filename = os.path.join(self.filename, entry["filename"])
+            partition = type(self)(filename=filename,  # type: ignore
+                                   do_index=False)
+            if start <= entry["min"] and entry["max"] < end:
+                yield from partition
+                continue
+            times = np.fromfile(filename + TIMES_SUFFIX, dtype="<f8")
+            inside = (times >= start) & (times < end)
+            partition._seek(0)
+            lines = iter(partition._mmap.readline, b"")  # type: ignore
+            # skip the header
+            next(lines)
+            for line, keep in zip(lines, inside):
+                if keep:
+                    yield partition._load_line(line.decode().split(','))
+
+    def parallel_map(self, fn: Callable[[Dict[str, np.ndarray]], Any],
+                     reduce_fn: Callable[[Any, Any], Any], workers: int = 1,
+                     columns: Optional[Sequence[str]] = None,
+                     chunk_size: int = 1 << 28, initial: Any = None) -> Any:
+        """Apply fn to every row of the table a batch at a time, combining
+        the results with reduce_fn, i.e. to count rows per filter.
+
+        The table, or each partition of a table partitioned by time, is
+        split into line aligned byte ranges of chunk_size bytes that are
+        scanned by a pool of worker processes. Rows are decoded a batch at a
+        time with decode_batch, so fn is given a dict of a numpy array per
+        column. The results of the batches are combined in file order, so
+        reduce_fn only needs to be associative. When workers is more than 1
+        fn and reduce_fn are sent to the workers, so they have to be
+        picklable, i.e. defined at the top level of a module.
+
+        Parameters
+        ----------
+        fn : `Callable`
+            Called with each batch of rows
+        reduce_fn : `Callable`
+            Combines two results into one
+        workers : `int`
+            Number of processes to scan the table with
+        columns : `Sequence of str`
+            Columns to decode, by default all of them
+        chunk_size : `int`
+            Number of bytes of the table scanned by each task
+        initial : `Any`
+            Result combined with the first result, and returned if the
+            table has no rows
+        """
+        if self.filename is None:
+            raise ValueError("Only tables read from a file can be scanned")
+        for column in columns or ():
+            if column not in self.schema.fields:
+                raise ValueError(f"{column} is not a column of "
+                                 f"{type(self).__name__}")
+        if os.path.isdir(self.filename):
+            filenames = [os.path.join(self.filename, entry["filename"])
+                         for entry in read_manifest(self.filename)
+                         ["partitions"]]
+        else:
+            filenames = [self.filename]
+        tasks = [(filename, byte_range, self.schema.fields, columns, fn,
+                  reduce_fn) for filename in filenames
+                 for byte_range in split_ranges(filename, chunk_size)]
+        if workers > 1:
+            with Pool(workers) as pool:
+                results = pool.map(scan_range, tasks)
+        else:
+            results = list(map(scan_range, tasks))
+        partials = [value for result in results for value in result]
+        if initial is not None:
+            partials.insert(0, initial)
+        if not partials:
+            return None
+        return reduce(reduce_fn, partials)
+
     def __del__(self):
         """Once this class has been expanded to support loading in already
         proccessed files, this method makes sure the file handlers and
@@ -348,15 +1106,35 @@ class FileTable(ABC):
             self._mmap.close()
 
 
+@dataclass
 class FileTableInMem(FileTable):
+    """A FileTable that is read into a pandas DataFrame when opened.
+
+    When cache_dir is set, the table is read through a columnar cache in
+    that directory (see cached_frame) rather than parsed by each process,
+    so that processes on a node opening the same table share one copy of
+    its numeric columns.
+    """
+    cache_dir: Optional[str] = None
+    # Directory to keep columnar caches of opened tables in, i.e. a node
+    # local scratch directory
+
     def _open(self, _):
         if self.filename is not None:
-            self.df: pd.DataFrame = pd.read_csv(self.filename)
+            if self.cache_dir is not None:
+                self.df = cached_frame(self.filename, self.cache_dir)
+                return
+            # pandas is slow to import, so only pull it in when a table is
+            # actually loaded into memory
+            import pandas as pd
+            self.df: pd.DataFrame = pd.read_csv(
+                self.filename, compression=compression_of(self.filename))
 
     def get_with_index(self, identifier: Tuple[ColumnName, Any]) ->\
             Union[List[Mapping[ColumnName, Any]], NoIndexError]:
         result =\
-            self.df.query(f"{identifier[0]} == {identifier[1]}").to_dict('r')
+            self.df.query(f"{identifier[0]} == {identifier[1]}")\
+            .to_dict('records')
         if result:
             return result
         else:
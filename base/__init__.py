@@ -1,2 +1,15 @@
 from .SSSchemaBase import *  # noqa: F401, F403
 from .SSTableBase import *  # noqa: F401, F403
+from .lineIndex import *  # noqa: F401, F403
+from .incremental import *  # noqa: F401, F403
+from .noise import *  # noqa: F401, F403
+from .skyIndex import *  # noqa: F401, F403
+from .timePartition import *  # noqa: F401, F403
+from .externalSort import *  # noqa: F401, F403
+from .compression import *  # noqa: F401, F403
+from .columnCache import *  # noqa: F401, F403
+from .tokenizer import *  # noqa: F401, F403
+from .binarySidecar import *  # noqa: F401, F403
+from .resultCache import *  # noqa: F401, F403
+from .parallelScan import *  # noqa: F401, F403
+from .databaseSink import *  # noqa: F401, F403
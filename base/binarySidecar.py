@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+__all__ = ("SIDECAR_BACKENDS", "BinarySidecar", "BinarySidecarWriter",
+           "is_binary_sidecar")
+
+from array import array
+import json
+from mmap import mmap, PROT_READ
+import os
+import tempfile
+from typing import (Any, BinaryIO, Callable, Dict, Iterator, List, Optional,
+                    Sequence, Tuple)
+
+import numpy as np
+
+SIDECAR_BACKENDS = ("sqlite", "binary")
+MAGIC = b"SSTSIDE1"
+KEY_COLUMNS = ("ssObjectId", "diaSourceId")
+# Columns a sidecar can be looked up by, when it has them. Rows are stored
+# sorted by the first of these the sidecar has.
+COPY_BATCH = 1 << 16
+# Number of rows copied at a time when sorting the spilled rows
+
+
+def is_binary_sidecar(filename: str) -> bool:
+    """Whether filename is a sidecar written by BinarySidecarWriter, rather
+    than a sqlite database. Missing files are not binary sidecars.
+    """
+    try:
+        with open(filename, "rb") as in_file:
+            return in_file.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _write_sidecar(filename: str, columns: Sequence[str],
+                   key_columns: Sequence[str], n_rows: int,
+                   arrays: Dict[str, np.ndarray],
+                   write_text: Callable[[BinaryIO], None]):
+    """Write a BinarySidecar of arrays, followed by the text of the rows
+    that write_text writes, to a temporary file that replaces filename once
+    it is complete.
+    """
+    tmp_filename = f"{filename}.{os.getpid()}"
+    with open(tmp_filename, "wb") as out_file:
+        out_file.write(MAGIC)
+        locations = {}
+        for name, values in arrays.items():
+            locations[name] = [out_file.tell(), len(values)]
+            values.astype("<i8").tofile(out_file)
+        locations["text"] = [out_file.tell(), int(arrays["offsets"][-1])]
+        write_text(out_file)
+        footer = json.dumps({"columns": tuple(columns), "rows": n_rows,
+                             "keys": list(key_columns),
+                             "arrays": locations}).encode()
+        out_file.write(footer)
+        out_file.write(np.array([len(footer)], dtype="<i8").tobytes())
+    os.replace(tmp_filename, filename)
+
+
+def _parse_keys(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Parse values as int64 keys, returning the keys and a mask of which
+    values were integers. Other values (i.e. nulls) get a key of 0.
+    """
+    try:
+        return (np.array(values, dtype=np.int64),
+                np.ones(len(values), dtype=bool))
+    except (ValueError, OverflowError):
+        pass
+    keys = np.zeros(len(values), dtype=np.int64)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            keys[i] = int(value)
+            valid[i] = True
+        except (ValueError, OverflowError):
+            pass
+    return keys, valid
+
+
+class BinarySidecarWriter:
+    """Collects the index values of the rows of a table, in the order the
+    rows are written, and writes them out as a BinarySidecar on close.
+
+    The values of each row are spilled to a temporary file next to filename
+    as a line of text, while only the key columns are held in memory as
+    int64 values, so that the rows can be sorted by key on close.
+
+    Parameters
+    ----------
+    filename : `str`
+        Path to write the sidecar to
+    columns : `Sequence of str`
+        Names of the values of each row
+    """
+    def __init__(self, filename: str, columns: Sequence[str]):
+        self.filename = filename
+        self.columns = tuple(columns)
+        self.key_pos = {column: self.columns.index(column)
+                        for column in KEY_COLUMNS if column in self.columns}
+        self._keys = {column: array('q') for column in self.key_pos}
+        self._valid = {column: bytearray() for column in self.key_pos}
+        self._lengths = array('q')
+        self._spill: BinaryIO = tempfile.TemporaryFile(
+            dir=os.path.dirname(os.path.abspath(filename)))
+
+    def extend(self, rows: Sequence[Sequence[str]]):
+        """Add the values of rows, which are copied straight away."""
+        if not rows:
+            return
+        lines = [(",".join(row) + "\n").encode() for row in rows]
+        self._lengths.extend(map(len, lines))
+        self._spill.write(b"".join(lines))
+        for column, pos in self.key_pos.items():
+            keys, valid = _parse_keys([row[pos] for row in rows])
+            self._keys[column].frombytes(keys.tobytes())
+            self._valid[column].extend(valid.tobytes())
+
+    def close(self):
+        """Sort the rows and write the sidecar."""
+        n_rows = len(self._lengths)
+        lengths = np.frombuffer(self._lengths, dtype=np.int64) if n_rows\
+            else np.zeros(0, dtype=np.int64)
+        keys = {column: (np.frombuffer(self._keys[column], dtype=np.int64)
+                         if n_rows else np.zeros(0, dtype=np.int64),
+                         np.frombuffer(bytes(self._valid[column]),
+                                       dtype=bool))
+                for column in self.key_pos}
+        arrays: Dict[str, np.ndarray] = {}
+        # Rows are sorted by the first key, with rows that have no key for
+        # it (i.e. a null) kept in their original order after the others
+        order = np.arange(n_rows, dtype=np.int64)
+        for i, (column, (values, valid)) in enumerate(keys.items()):
+            keyed = np.flatnonzero(valid)
+            keyed = keyed[np.argsort(values[keyed], kind="stable")]
+            if i == 0:
+                order = np.concatenate([keyed, np.flatnonzero(~valid)])
+                arrays[f"{column}.keys"] = values[keyed]
+                continue
+            # Later keys point at rows by their position in the sorted rows
+            position = np.empty(n_rows, dtype=np.int64)
+            position[order] = np.arange(n_rows, dtype=np.int64)
+            arrays[f"{column}.keys"] = values[keyed]
+            arrays[f"{column}.rows"] = position[keyed]
+        arrays["rows"] = order
+        offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(lengths[order], out=offsets[1:])
+        arrays["offsets"] = offsets
+        _write_sidecar(self.filename, self.columns, tuple(self.key_pos),
+                       n_rows, arrays,
+                       lambda out_file: self._copy_sorted(out_file, order,
+                                                          lengths))
+        self._spill.close()
+
+    def _copy_sorted(self, out_file: BinaryIO, order: np.ndarray,
+                     lengths: np.ndarray):
+        if not len(order):
+            return
+        self._spill.flush()
+        starts = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        with mmap(self._spill.fileno(), 0, prot=PROT_READ) as spilled:
+            for batch in range(0, len(order), COPY_BATCH):
+                rows = order[batch:batch + COPY_BATCH]
+                out_file.write(b"".join(
+                    spilled[start:start + length]
+                    for start, length in zip(starts[rows].tolist(),
+                                             lengths[rows].tolist())))
+
+
+class BinarySidecar:
+    """A sidecar stored as memory mapped arrays rather than a sqlite
+    database, as written by BinarySidecarWriter (see Indexer).
+
+    The values of each row are stored as a line of text, with the rows
+    sorted by ssObjectId and an array of the byte offset of each. For each
+    of the key columns ssObjectId and diaSourceId the sidecar has, it stores
+    the int64 key of every row in sorted order, so looking up any number of
+    keys is one vectorized searchsorted, and the rows of an object are one
+    contiguous slice of the text. The position of each row in the table is
+    kept as well. Values come back as the same strings a sqlite sidecar
+    holds. Rows whose key is not an integer (i.e. null) are stored but can
+    not be looked up by it.
+
+    Parameters
+    ----------
+    filename : `str`
+        Path of the sidecar
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as in_file:
+            if in_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{filename} is not a binary sidecar")
+            in_file.seek(-8, os.SEEK_END)
+            footer_size, = np.frombuffer(in_file.read(8), dtype="<i8")
+            in_file.seek(-8 - int(footer_size), os.SEEK_END)
+            footer = json.loads(in_file.read(int(footer_size)))
+        self.columns: Tuple[str, ...] = tuple(footer["columns"])
+        self.key_columns: Tuple[str, ...] = tuple(footer["keys"])
+        self.n_rows: int = footer["rows"]
+        self._arrays = {name: self._map(offset, count)
+                        for name, (offset, count) in
+                        footer["arrays"].items() if name != "text"}
+        self._offsets = self._arrays["offsets"]
+        # Text is sliced through an mmap, which is much cheaper per row than
+        # slicing a memmap
+        self._text_start = footer["arrays"]["text"][0]
+        with open(filename, "rb") as in_file:
+            self._text = mmap(in_file.fileno(), 0, prot=PROT_READ)
+
+    def _map(self, offset: int, count: int) -> np.ndarray:
+        if not count:
+            return np.zeros(0, dtype=np.int64)
+        # A plain view of the memmap, avoiding the overhead the memmap
+        # subclass adds to every indexing
+        return np.asarray(np.memmap(self.filename, dtype="<i8", mode="r",
+                                    offset=offset, shape=(count,)))
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def _lines(self, start: int, end: int) -> List[List[str]]:
+        """The values of the sorted rows in [start, end)."""
+        if start >= end:
+            return []
+        base = self._text_start
+        text = self._text[base + int(self._offsets[start]):
+                          base + int(self._offsets[end])].decode()
+        return [line.split(",") for line in text[:-1].split("\n")]
+
+    def _spans(self, keys: Sequence[Any], column: str) ->\
+            Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The positions in the sorted keys of column of the first and one
+        past the last row of each key, along with which keys are integers.
+        """
+        if column not in self.key_columns:
+            raise ValueError(f"{self.filename} can not be looked up by "
+                             f"{column}")
+        sorted_keys = self._arrays[f"{column}.keys"]
+        values, valid = _parse_keys([str(key) for key in keys])
+        starts = np.searchsorted(sorted_keys, values, side="left")
+        ends = np.searchsorted(sorted_keys, values, side="right")
+        ends[~valid] = starts[~valid]
+        return starts, ends, valid
+
+    def lookup_many(self, keys: Sequence[Any],
+                    column: str = "ssObjectId") -> Dict[Any, List[List[str]]]:
+        """The rows of each of keys in column, keyed by the keys as given.
+        Keys without any rows are left out. Rows of a key are in the order
+        they were written.
+        """
+        starts, ends, _ = self._spans(keys, column)
+        found: Dict[Any, List[List[str]]] = {}
+        primary = column == self.key_columns[0]
+        rows = None if primary else self._arrays[f"{column}.rows"]
+        for key, start, end in zip(keys, starts.tolist(), ends.tolist()):
+            if start == end:
+                continue
+            if primary:
+                found[key] = self._lines(start, end)
+            else:
+                found[key] = [self._lines(row, row + 1)[0] for row in
+                              rows[start:end].tolist()]  # type: ignore
+        return found
+
+    def __contains__(self, key: Any) -> bool:
+        """Whether the first key column has any rows of key."""
+        starts, ends, _ = self._spans([key], self.key_columns[0])
+        return bool(ends[0] > starts[0])
+
+    def lookup(self, key: Any, column: str = "ssObjectId") ->\
+            List[List[str]]:
+        """The rows of key in column, in the order they were written."""
+        return self.lookup_many([key], column).get(key, [])
+
+    def row_numbers(self, key: Any, column: str = "ssObjectId") ->\
+            np.ndarray:
+        """The positions in the table of the rows of key in column, not
+        counting its header, in the order they were written.
+        """
+        starts, ends, _ = self._spans([key], column)
+        start, end = int(starts[0]), int(ends[0])
+        positions = np.arange(start, end)
+        if column != self.key_columns[0]:
+            positions = self._arrays[f"{column}.rows"][start:end]
+        return np.sort(self._arrays["rows"][positions])
+
+    def keys(self) -> List[str]:
+        """The distinct keys of the first key column, as strings in sorted
+        order, the order a sqlite sidecar lists them in through its index.
+        """
+        sorted_keys = self._arrays[f"{self.key_columns[0]}.keys"]
+        return sorted(str(key) for key in np.unique(sorted_keys).tolist())
+
+    def __iter__(self) -> Iterator[List[str]]:
+        """Yield the values of every row in the order they were written."""
+        for row in np.argsort(self._arrays["rows"], kind="stable").tolist():
+            yield self._lines(row, row + 1)[0]
+
+    def close(self):
+        self._text.close()
+
+    @classmethod
+    def merge(cls, partial_filenames: Sequence[str], filename: str,
+              sources: Optional[Sequence[str]] = None):
+        """Combine binary sidecars into one, like merge_sidecars. The rows
+        of each partial sidecar follow those of the ones before it.
+
+        Each partial is already sorted, so the keys are merged with a stable
+        sort of their concatenation, which merges the sorted runs (a k-way
+        merge), keeping the rows of equal keys in partial order. The text of
+        the rows is then copied across in runs of consecutive rows of a
+        partial, without parsing it.
+        """
+        partials = [cls(partial) for partial in partial_filenames]
+        if not partials:
+            raise ValueError("No sidecars to merge")
+        columns = partials[0].columns
+        key_columns = partials[0].key_columns
+        for partial in partials[1:]:
+            if partial.columns != columns:
+                raise ValueError(f"{partial.filename} has columns "
+                                 f"{partial.columns}, not {columns}")
+        suffixes = [b"\n" if sources is None else
+                    f",{source}\n".encode() for source in
+                    (sources if sources is not None else [None]*len(partials))]
+
+        # Rows are numbered across the partials by their sorted position
+        # within their partial plus the rows of the partials before it
+        counts = np.array([len(partial) for partial in partials],
+                          dtype=np.int64)
+        bases = np.zeros(len(partials), dtype=np.int64)
+        np.cumsum(counts[:-1], out=bases[1:])
+        n_rows = int(counts.sum())
+        arrays: Dict[str, np.ndarray] = {}
+
+        primary = key_columns[0]
+        keys = np.concatenate([partial._arrays[f"{primary}.keys"]
+                               for partial in partials])
+        keyed = np.concatenate([
+            base + np.arange(len(partial._arrays[f"{primary}.keys"]))
+            for base, partial in zip(bases, partials)])
+        unkeyed = np.concatenate([
+            base + np.arange(len(partial._arrays[f"{primary}.keys"]),
+                             len(partial))
+            for base, partial in zip(bases, partials)])
+        merged = np.argsort(keys, kind="stable")
+        order = np.concatenate([keyed[merged], unkeyed]).astype(np.int64)
+        arrays[f"{primary}.keys"] = keys[merged]
+        position = np.empty(n_rows, dtype=np.int64)
+        position[order] = np.arange(n_rows, dtype=np.int64)
+        for column in key_columns[1:]:
+            keys = np.concatenate([partial._arrays[f"{column}.keys"]
+                                   for partial in partials])
+            rows = np.concatenate([base + partial._arrays[f"{column}.rows"]
+                                   for base, partial in zip(bases,
+                                                            partials)])
+            merged = np.argsort(keys, kind="stable")
+            arrays[f"{column}.keys"] = keys[merged]
+            arrays[f"{column}.rows"] = position[rows[merged]]
+        arrays["rows"] = np.concatenate([
+            base + partial._arrays["rows"]
+            for base, partial in zip(bases, partials)])[order]
+        lengths = np.concatenate([
+            np.diff(partial._offsets) + len(suffix) - 1
+            for partial, suffix in zip(partials, suffixes)])
+        offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(lengths[order], out=offsets[1:])
+        arrays["offsets"] = offsets
+
+        def copy_runs(out_file: BinaryIO):
+            if not n_rows:
+                return
+            owner = np.searchsorted(bases, order, side="right") - 1
+            # A run ends where the next row is not the next row of the same
+            # partial
+            ends = np.flatnonzero((np.diff(order) != 1) |
+                                  (np.diff(owner) != 0)) + 1
+            starts = np.concatenate([[0], ends])
+            ends = np.concatenate([ends, [n_rows]])
+            # Where the text of each row starts and ends in its partial
+            text_starts = np.concatenate([
+                partial._text_start + partial._offsets[:-1]
+                for partial in partials])
+            text_ends = np.concatenate([
+                partial._text_start + partial._offsets[1:]
+                for partial in partials])
+            texts = [partial._text for partial in partials]
+            for batch in range(0, len(starts), COPY_BATCH):
+                runs = slice(batch, batch + COPY_BATCH)
+                spans = zip(owner[starts[runs]].tolist(),
+                            text_starts[order[starts[runs]]].tolist(),
+                            text_ends[order[ends[runs] - 1]].tolist())
+                if sources is None:
+                    out_file.write(b"".join(texts[i][start:end]
+                                            for i, start, end in spans))
+                else:
+                    out_file.write(b"".join(
+                        texts[i][start:end].replace(b"\n", suffixes[i])
+                        for i, start, end in spans))
+
+        _write_sidecar(filename, columns if sources is None else
+                       columns + ("source",), key_columns, n_rows, arrays,
+                       copy_runs)
+        for partial in partials:
+            partial.close()
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+__all__ = ("cache_filename", "write_columns", "read_columns", "cached_frame")
+
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+from .compression import compression_of
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MAGIC = b"SSTCOLS1"
+SUFFIX = ".cols"
+ALIGNMENT = 64
+# Columns start on multiples of this many bytes, so mapped arrays are aligned
+
+
+def cache_filename(filename: str, cache_dir: Optional[str] = None) -> str:
+    """Path of the columnar cache of filename in cache_dir, which defaults
+    to the temporary directory of the node. The name is keyed by the path,
+    modification time and size of filename, so a rebuilt table gets a new
+    cache rather than reading a stale one.
+    """
+    stats = os.stat(filename)
+    path = os.path.abspath(filename)
+    path_key = hashlib.sha1(path.encode()).hexdigest()[:12]
+    version_key = hashlib.sha1(
+        f"{stats.st_mtime_ns}:{stats.st_size}".encode()).hexdigest()[:12]
+    return os.path.join(cache_dir or tempfile.gettempdir(),
+                        f"{os.path.basename(path)}.{path_key}.{version_key}"
+                        f"{SUFFIX}")
+
+
+def _pad(out_file) -> int:
+    position = out_file.tell()
+    padding = -position % ALIGNMENT
+    out_file.write(b"\0"*padding)
+    return position + padding
+
+
+def write_columns(df: pd.DataFrame, filename: str):
+    """Write the columns of df to filename as flat binary arrays that
+    read_columns can map without copying.
+
+    Numeric and boolean columns are written as they are. Other columns,
+    i.e. strings or numbers with nulls, are dictionary encoded: an integer
+    code per row, with -1 for nulls, and the UTF-8 encoding and offset of
+    each distinct value. The file starts
+    with MAGIC and the length of a JSON header describing where each column
+    is, followed by the header and the columns.
+    """
+    import pandas as pd
+    columns: List[Dict[str, Any]] = []
+    arrays: List[np.ndarray] = []
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if values.dtype.kind in "biuf":
+            data = np.ascontiguousarray(values)
+            columns.append({"name": name, "kind": "array",
+                            "dtype": data.dtype.str})
+            arrays.append(data)
+        else:
+            # Dictionary encode everything else, so the codes can be mapped
+            # and only the distinct values are decoded by each process
+            codes, uniques = pd.factorize(df[name])
+            encoded = [str(value).encode() for value in uniques]
+            offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            columns.append({"name": name, "kind": "text",
+                            "dtype": str(df[name].dtype)})
+            arrays.extend((codes.astype("<i8"),
+                           np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                           offsets))
+    header = {"rows": len(df), "columns": columns}
+    # The offsets of each array depend on the length of the header, so
+    # write the arrays first and the header, padded to a fixed size, last
+    tmp_filename = f"{filename}.{os.getpid()}"
+    with open(tmp_filename, "wb") as out_file:
+        out_file.write(MAGIC)
+        header_size = len(json.dumps(header).encode()) +\
+            64*len(arrays) + ALIGNMENT
+        out_file.write(np.array([header_size], dtype="<i8").tobytes())
+        out_file.write(b" "*header_size)
+        locations = []
+        for data in arrays:
+            offset = _pad(out_file)
+            data.tofile(out_file)
+            locations.append([offset, data.dtype.str, len(data)])
+        header["arrays"] = locations
+        encoded_header = json.dumps(header).encode()
+        out_file.seek(len(MAGIC) + 8)
+        out_file.write(encoded_header.ljust(header_size))
+    os.replace(tmp_filename, filename)
+
+
+def read_columns(filename: str) -> pd.DataFrame:
+    """Map a file written by write_columns as a DataFrame.
+
+    Numeric columns share the pages of the mapped file, so any number of
+    processes on a node reading the same file hold one copy of them. For
+    other columns each process only decodes the distinct values, holding a
+    reference to one of them per row.
+    """
+    import pandas as pd
+    with open(filename, "rb") as in_file:
+        if in_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a column cache")
+        header_size, = np.frombuffer(in_file.read(8), dtype="<i8")
+        header = json.loads(in_file.read(int(header_size)))
+    arrays = iter(np.memmap(filename, dtype=dtype, mode="r", offset=offset,
+                            shape=(count,))
+                  if count else np.empty(0, dtype=dtype)
+                  for offset, dtype, count in header["arrays"])
+    data = {}
+    for column in header["columns"]:
+        if column["kind"] == "array":
+            data[column["name"]] = next(arrays)
+            continue
+        codes, encoded, offsets = next(arrays), next(arrays), next(arrays)
+        text = encoded.tobytes()
+        # Nulls have a code of -1, which picks the nan at the end
+        table = np.empty(len(offsets), dtype=object)
+        table[:-1] = [text[start:end].decode() for start, end in
+                      zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        table[-1] = np.nan
+        values = table[codes]
+        data[column["name"]] = values if column["dtype"] == "object" else\
+            pd.array(values, dtype=column["dtype"])
+    # copy=False keeps each mapped column as its own block rather than
+    # consolidating them into new arrays
+    return pd.DataFrame(data, copy=False)
+
+
+def cached_frame(filename: str, cache_dir: Optional[str] = None) ->\
+        pd.DataFrame:
+    """Read the table at filename into a DataFrame through a columnar cache
+    shared by every process on the node.
+
+    The first process to open a given version of filename parses it with
+    pandas and writes the cache (see cache_filename), while others wait on
+    a lock and then map it. Caches of older versions of the same table are
+    removed when a new one is written.
+    """
+    cache = cache_filename(filename, cache_dir)
+    if not os.path.exists(cache):
+        with open(cache + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(cache):
+                import pandas as pd
+                df = pd.read_csv(filename,
+                                 compression=compression_of(filename))
+                write_columns(df, cache)
+                stale_pattern = cache.rsplit(".", 2)[0] + f".*{SUFFIX}*"
+                for stale in glob.glob(stale_pattern):
+                    if not stale.startswith(cache):
+                        os.remove(stale)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return read_columns(cache)
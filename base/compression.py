@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+__all__ = ("COMPRESSIONS", "BlockIndex", "BlockReader", "BlockWriter",
+           "compression_of", "open_input", "open_text_output",
+           "concatenate_blocks", "compress_file")
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import gzip
+import io
+import os
+import shutil
+import threading
+from typing import BinaryIO, Deque, Iterable, List, Optional, TextIO, Union
+
+import numpy as np
+
+COMPRESSIONS = ("gzip", "zstd")
+MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+BLOCK_SIZE = 1 << 20
+# Number of uncompressed bytes written to each block of a BlockWriter, which
+# is also about how much has to be decompressed to reach a random row
+SKIP_SIZE = 1 << 20
+# Number of bytes read at a time when skipping forward through a stream
+
+
+def _zstandard():
+    # zstandard is only needed to read or write zstd tables, so it is an
+    # optional dependency
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading or writing zstd compressed tables needs "
+                          "the zstandard package") from None
+    return zstandard
+
+
+def compression_of(filename: str) -> Optional[str]:
+    """Return which of COMPRESSIONS filename is compressed with, going by
+    the first bytes of the file rather than its name, or None if it is not
+    compressed.
+    """
+    with open(filename, "rb") as in_file:
+        start = in_file.read(4)
+    for magic, compression in MAGIC.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def _decompress_stream(raw: BinaryIO, compression: str) -> BinaryIO:
+    """Decompress raw from its current position, which must be the start of
+    a gzip member or zstd frame, reading on through any that follow.
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")  # type: ignore
+    reader = _zstandard().ZstdDecompressor().stream_reader(
+        raw, read_across_frames=True, closefd=False)
+    return io.BufferedReader(reader)  # type: ignore
+
+
+def open_input(filename: str) -> BinaryIO:
+    """Open filename for reading as bytes, transparently decompressing it if
+    it is compressed with gzip or zstd.
+    """
+    compression = compression_of(filename)
+    if compression is None:
+        return open(filename, "rb")
+    return BlockReader(filename, compression)  # type: ignore
+
+
+class BlockIndex:
+    """Where each block of a table written by BlockWriter starts, both in
+    the compressed file and in the decompressed contents.
+
+    Every block is a complete gzip member or zstd frame, so decompression
+    can start at the beginning of any of them. The index is stored next to
+    the table as little endian int64 values: the number of blocks, then the
+    compressed and the decompressed offset of each block, each followed by
+    the total size. It is memory mapped when loaded.
+    """
+    SUFFIX = ".blocks"
+
+    def __init__(self, compressed: np.ndarray, uncompressed: np.ndarray):
+        self.compressed = compressed
+        self.uncompressed = uncompressed
+
+    @staticmethod
+    def index_filename(filename: str) -> str:
+        return filename + BlockIndex.SUFFIX
+
+    @classmethod
+    def write(cls, filename: str, compressed: Iterable[int],
+              uncompressed: Iterable[int]) -> BlockIndex:
+        arrays = [np.fromiter(values, dtype="<i8")
+                  for values in (compressed, uncompressed)]
+        index_filename = cls.index_filename(filename)
+        tmp_filename = f"{index_filename}.{os.getpid()}"
+        with open(tmp_filename, "wb") as out_file:
+            np.array([len(arrays[0]) - 1], dtype="<i8").tofile(out_file)
+            for values in arrays:
+                values.tofile(out_file)
+        os.replace(tmp_filename, index_filename)
+        return cls.load(filename)  # type: ignore
+
+    @classmethod
+    def load(cls, filename: str) -> Optional[BlockIndex]:
+        """Load the index for filename, returning None if there is no index
+        or it does not describe the current file.
+        """
+        index_filename = cls.index_filename(filename)
+        if not os.path.exists(index_filename):
+            return None
+        stats = os.stat(filename)
+        if os.stat(index_filename).st_mtime < stats.st_mtime:
+            return None
+        size, = np.fromfile(index_filename, dtype="<i8", count=1)
+        compressed, uncompressed = (
+            np.memmap(index_filename, dtype="<i8", mode="r",
+                      offset=8*(1 + i*(size + 1)), shape=(size + 1,))
+            for i in range(2))
+        if compressed[-1] != stats.st_size:
+            return None
+        return cls(compressed, uncompressed)
+
+    def __len__(self) -> int:
+        return len(self.compressed) - 1
+
+    @property
+    def size(self) -> int:
+        """Size of the decompressed contents."""
+        return int(self.uncompressed[-1])
+
+    def block_at(self, offset: int) -> int:
+        """Number of the block holding the decompressed byte offset."""
+        block = int(np.searchsorted(self.uncompressed, offset,
+                                    side="right")) - 1
+        return min(max(block, 0), max(len(self) - 1, 0))
+
+
+class BlockReader:
+    """A read only file over the decompressed contents of a gzip or zstd
+    compressed file, with offsets counted in decompressed bytes.
+
+    It supports the parts of the mmap interface that tables read through
+    (seek, tell, read and readline), so compressed tables are read the same
+    way as uncompressed ones. If the file has a BlockIndex, seeking
+    decompresses from the start of the block holding the offset, otherwise
+    from the start of the file whenever it seeks backwards.
+
+    Parameters
+    ----------
+    filename : `str`
+        Path of the compressed file
+    compression : `str`
+        Which of COMPRESSIONS the file uses, worked out from the file if
+        not given
+    """
+    def __init__(self, filename: str, compression: Optional[str] = None):
+        self.filename = filename
+        self.compression = compression or compression_of(filename)
+        if self.compression is None:
+            raise ValueError(f"{filename} is not compressed")
+        self.blocks = BlockIndex.load(filename)
+        self._raw = open(filename, "rb")
+        self._stream: BinaryIO
+        self._position = 0
+        self._open_block(0)
+
+    def _open_block(self, block: int):
+        if self.blocks is None:
+            start, position = 0, 0
+        else:
+            start = int(self.blocks.compressed[block])
+            position = int(self.blocks.uncompressed[block])
+        self._raw.seek(start)
+        self._stream = _decompress_stream(self._raw,
+                                          self.compression)  # type: ignore
+        self._position = position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._position
+        elif whence != 0:
+            raise ValueError("Compressed tables can only be seeked from the "
+                             "start or the current position")
+        if offset < self._position or (
+                self.blocks is not None and
+                self.blocks.block_at(offset) >
+                self.blocks.block_at(self._position)):
+            self._open_block(0 if self.blocks is None
+                             else self.blocks.block_at(offset))
+        while self._position < offset:
+            skipped = len(self._stream.read(min(offset - self._position,
+                                                SKIP_SIZE)))
+            if not skipped:
+                break
+            self._position += skipped
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._position += len(data)
+        return data
+
+    def readline(self) -> bytes:
+        line = self._stream.readline()
+        self._position += len(line)
+        return line
+
+    def readlines(self, hint: int = -1) -> List[bytes]:
+        lines = self._stream.readlines(hint)
+        self._position += sum(map(len, lines))
+        return lines
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def __enter__(self) -> BlockReader:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._raw.close()
+
+
+class BlockWriter(io.RawIOBase):
+    """A write only file that compresses what is written to it in
+    independent blocks, recording them in a BlockIndex once it is closed.
+
+    The concatenated blocks are an ordinary gzip or zstd file, which any
+    tool can decompress, but with the index a reader can start decompressing
+    at any block rather than only at the start of the file. Blocks end on
+    line boundaries, and the first line, normally the header, is a block of
+    its own, so that block compressed tables can be concatenated without
+    decompressing them (see concatenate_blocks).
+
+    Parameters
+    ----------
+    filename : `str`
+        Path to write the compressed file to
+    compression : `str`
+        One of COMPRESSIONS
+    level : `int`
+        Compression level, defaulting to that of the gzip or zstd tools
+    threads : `int`
+        Number of threads to compress blocks with. Blocks are compressed
+        independently, so this scales until writing becomes the bottleneck.
+    block_size : `int`
+        Approximate number of uncompressed bytes in each block
+    """
+    def __init__(self, filename: str, compression: str,
+                 level: Optional[int] = None, threads: int = 1,
+                 block_size: int = BLOCK_SIZE):
+        super().__init__()
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}, expected "
+                             f"one of {', '.join(COMPRESSIONS)}")
+        self.filename = filename
+        self.compression = compression
+        self.level = DEFAULT_LEVELS[compression] if level is None else level
+        self.block_size = block_size
+        if compression == "zstd":
+            self._zstd = _zstandard()
+            # A ZstdCompressor can not be shared between threads
+            self._local = threading.local()
+        self._file = open(filename, "wb")
+        self._buffer = bytearray()
+        self._header = True
+        self._compressed = [0]
+        self._uncompressed = [0]
+        self._pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._threads = threads
+        self._pending: Deque[Future] = deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=self.level, mtime=0)
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._zstd.ZstdCompressor(level=self.level)
+            self._local.compressor = compressor
+        return compressor.compress(data)
+
+    def _write_block(self, block: bytes, size: int):
+        self._file.write(block)
+        self._compressed.append(self._compressed[-1] + len(block))
+        self._uncompressed.append(self._uncompressed[-1] + size)
+
+    def _submit(self, data: bytes):
+        if self._pool is None:
+            self._write_block(self._compress(data), len(data))
+            return
+        self._pending.append((self._pool.submit(self._compress, data),
+                              len(data)))  # type: ignore
+        # Keep a bounded number of blocks in flight, written in order
+        while len(self._pending) > 2*self._threads:
+            future, size = self._pending.popleft()  # type: ignore
+            self._write_block(future.result(), size)
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        self._buffer += data
+        if self._header:
+            newline = self._buffer.find(b"\n")
+            if newline == -1:
+                return len(data)
+            self._submit(bytes(self._buffer[:newline + 1]))
+            del self._buffer[:newline + 1]
+            self._header = False
+        while len(self._buffer) >= self.block_size:
+            # End the block at the last line ending within block_size bytes,
+            # or after the first line if that is longer on its own
+            end = self._buffer.rfind(b"\n", 0, self.block_size) + 1 or\
+                self._buffer.find(b"\n", self.block_size) + 1
+            if not end:
+                break
+            self._submit(bytes(self._buffer[:end]))
+            del self._buffer[:end]
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            future, size = self._pending.popleft()  # type: ignore
+            self._write_block(future.result(), size)
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._file.close()
+        BlockIndex.write(self.filename, self._compressed, self._uncompressed)
+        super().close()
+
+
+def open_text_output(filename: str, compression: Optional[str] = None,
+                     level: Optional[int] = None,
+                     threads: int = 1) -> TextIO:
+    """Open filename to write a table to as text, compressing it with a
+    BlockWriter if compression is set.
+    """
+    if compression is None:
+        return open(filename, "w+", newline="")
+    return io.TextIOWrapper(BlockWriter(filename, compression,  # type: ignore
+                                        level, threads), newline="")
+
+
+def concatenate_blocks(partial_filenames: List[str], filename: str):
+    """Concatenate tables written by BlockWriter into filename, keeping the
+    header of the first one only. Compressed blocks are copied as they are
+    and the block indexes combined, so nothing is decompressed.
+    """
+    compressed = [0]
+    uncompressed = [0]
+    with open(filename, "wb") as out_file:
+        for i, part in enumerate(partial_filenames):
+            blocks = BlockIndex.load(part)
+            if blocks is None:
+                raise ValueError(f"{part} does not have an up to date block "
+                                 "index")
+            # The first block of every part is its header
+            first = 1 if i else 0
+            with open(part, "rb") as part_file:
+                part_file.seek(int(blocks.compressed[first]))
+                shutil.copyfileobj(part_file, out_file)
+            for offsets, ends in ((compressed, blocks.compressed),
+                                  (uncompressed, blocks.uncompressed)):
+                shift = offsets[-1] - int(ends[first])
+                offsets.extend((ends[first + 1:] + shift).tolist())
+    BlockIndex.write(filename, compressed, uncompressed)
+
+
+def compress_file(input_filename: str, output_filename: str,
+                  compression: str = "gzip", level: Optional[int] = None,
+                  threads: int = 1):
+    """Compress input_filename, which may itself be compressed, into blocks
+    with a BlockWriter, so that it can be read from any line. This turns a
+    table or simulated input compressed by other tools into one that byte
+    ranges and line indexes can seek into cheaply.
+    """
+    if os.path.abspath(input_filename) == os.path.abspath(output_filename):
+        raise ValueError("A file can not be compressed in place, choose a "
+                         "different output_filename")
+    with open_input(input_filename) as in_file,\
+            BlockWriter(output_filename, compression, level,
+                        threads) as out_file:
+        shutil.copyfileobj(in_file, out_file, BLOCK_SIZE)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+__all__ = ("DATABASE_BACKENDS", "DatabaseSink")
+
+from itertools import islice
+import sqlite3
+from typing import Any, Iterable, List, Mapping, Sequence
+
+DATABASE_BACKENDS = ("sqlite", "duckdb")
+# Embedded databases a builder can write its output into
+SQL_TYPES = {"sqlite": {"int": "INTEGER", "float": "REAL"},
+             "duckdb": {"int": "BIGINT", "float": "DOUBLE"}}
+# Column types of the schema types, anything else is stored as text
+TEXT_TYPES = {"sqlite": "TEXT", "duckdb": "VARCHAR"}
+# Column type of the other schema types
+BATCH_ROWS = 1 << 16
+# Number of rows inserted into duckdb at a time
+NULL = "\\N"
+# How conversion functions write nulls
+
+
+def _duckdb():
+    # duckdb is only needed to write duckdb outputs, so it is an optional
+    # dependency
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("Writing duckdb outputs needs the duckdb package")\
+            from None
+    return duckdb
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DatabaseSink:
+    """Writes converted rows into a table of an embedded database, in place
+    of a CSV file that would have to be parsed again to load it.
+
+    The table is created, replacing any table of the same name, with a
+    column per schema field typed after the field, and the null marker
+    written by conversion functions is stored as NULL. The table is replaced
+    and filled in a single transaction, committed when the sink is closed
+    and rolled back if conversion fails, so a failed run leaves any previous
+    table in place. Rows are inserted through the fastest bulk path of each
+    engine: one executemany for sqlite, with the journal kept in memory and
+    syncing turned off, and for duckdb batches of BATCH_ROWS rows handed
+    over as DataFrames and cast in SQL.
+
+    Parameters
+    ----------
+    filename : `str`
+        Path of the database file, which is created if needed
+    backend : `str`
+        One of DATABASE_BACKENDS
+    table : `str`
+        Name of the table to write
+    fields : `Mapping of str to str`
+        Schema fields of the table, i.e. TableSchema.fields
+    """
+    def __init__(self, filename: str, backend: str, table: str,
+                 fields: Mapping[str, str]):
+        if backend not in DATABASE_BACKENDS:
+            raise ValueError(f"Unknown database {backend}, expected one of "
+                             f"{', '.join(DATABASE_BACKENDS)}")
+        self.backend = backend
+        self.table = table
+        self.columns = list(fields)
+        self.types = [SQL_TYPES[backend].get(kind, TEXT_TYPES[backend])
+                      for kind in fields.values()]
+        if backend == "sqlite":
+            # Transactions are begun explicitly, so that replacing the table
+            # is part of the one transaction too
+            self._connection: Any = sqlite3.connect(filename,
+                                                    isolation_level=None)
+            self._connection.execute("pragma journal_mode = memory")
+            self._connection.execute("pragma synchronous = off")
+        else:
+            self._connection = _duckdb().connect(filename)
+        self._connection.execute("begin transaction")
+        columns = ", ".join(f"{_quote(name)} {kind}"
+                            for name, kind in zip(self.columns, self.types))
+        self._connection.execute(f"drop table if exists {_quote(table)}")
+        self._connection.execute(f"create table {_quote(table)} ({columns})")
+
+    def writerows(self, rows: Iterable[Sequence[Any]]):
+        if self.backend == "sqlite":
+            # Column affinity turns numeric text into numbers, so only nulls
+            # need converting, which nullif does without a Python call per
+            # value
+            values = ", ".join([f"nullif(?, '{NULL}')"]*len(self.columns))
+            self._connection.executemany(
+                f"insert into {_quote(self.table)} values ({values})", rows)
+            return
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, BATCH_ROWS))
+            if not batch:
+                return
+            self._insert_batch(batch)
+
+    def _insert_batch(self, batch: List[Sequence[Any]]):
+        import pandas as pd
+        # Every value is passed as text, as the CSV writer would write it,
+        # and cast by duckdb a column at a time
+        frame = pd.DataFrame({f"c{i}": [str(value) for value in values]
+                              for i, values in enumerate(zip(*batch))})
+        casts = ", ".join(f"cast(nullif(c{i}, '{NULL}') as {kind})"
+                          for i, kind in enumerate(self.types))
+        self._connection.register("sstable_batch", frame)
+        self._connection.execute(f"insert into {_quote(self.table)} "
+                                 f"select {casts} from sstable_batch")
+        self._connection.unregister("sstable_batch")
+
+    def close(self, commit: bool = True):
+        if commit:
+            self._connection.commit()
+        else:
+            self._connection.rollback()
+        self._connection.close()
+
+    def __enter__(self) -> DatabaseSink:
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(commit=exc_type is None)
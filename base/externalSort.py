@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+__all__ = ("ObjectRangeIndex", "sort_by_object")
+
+from array import array
+from contextlib import ExitStack
+import heapq
+from itertools import groupby
+import os
+import tempfile
+from typing import (Any, Callable, Generator, Iterable, List, Optional,
+                    Sequence, Tuple)
+
+import numpy as np
+
+from .compression import open_input
+
+from ..customTypes import ColumnName
+
+MAX_MERGE_RUNS = 64
+# Most sorted runs merged at once, more runs being merged in passes of this
+# many into longer runs first, so the number of open files stays bounded
+
+
+class ObjectRangeIndex:
+    """Where the rows of each object are in a table sorted by object, as
+    written by sort_by_object.
+
+    The index is stored next to the table as little endian int64 values: the
+    number of objects, followed by arrays of the object id, the byte offset
+    of its first row and its number of rows, all sorted by object id. It is
+    memory mapped when loaded.
+    """
+    SUFFIX = ".ranges"
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray,
+                 counts: np.ndarray):
+        self.keys = keys
+        self.offsets = offsets
+        self.counts = counts
+
+    @staticmethod
+    def index_filename(filename: str) -> str:
+        return filename + ObjectRangeIndex.SUFFIX
+
+    @classmethod
+    def write(cls, filename: str, keys: Iterable[int], offsets: Iterable[int],
+              counts: Iterable[int]) -> ObjectRangeIndex:
+        arrays = [np.fromiter(values, dtype="<i8")
+                  for values in (keys, offsets, counts)]
+        index_filename = cls.index_filename(filename)
+        tmp_filename = f"{index_filename}.{os.getpid()}"
+        with open(tmp_filename, "wb") as out_file:
+            np.array([len(arrays[0])], dtype="<i8").tofile(out_file)
+            for values in arrays:
+                values.tofile(out_file)
+        os.replace(tmp_filename, index_filename)
+        return cls.load(filename)  # type: ignore
+
+    @classmethod
+    def load(cls, filename: str) -> Optional[ObjectRangeIndex]:
+        """Load the index for filename, returning None if there is no index
+        or it is older than the file it describes.
+        """
+        index_filename = cls.index_filename(filename)
+        if not os.path.exists(index_filename) or\
+                os.stat(index_filename).st_mtime <\
+                os.stat(filename).st_mtime:
+            return None
+        size, = np.fromfile(index_filename, dtype="<i8", count=1)
+        return cls(*(np.memmap(index_filename, dtype="<i8", mode="r",
+                               offset=8*(1 + i*size), shape=(size,))
+                     for i in range(3)))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self) -> Generator[Tuple[int, int, int], None, None]:
+        """Yield the id, offset and row count of every object in order."""
+        for key, offset, count in zip(self.keys.tolist(),
+                                      self.offsets.tolist(),
+                                      self.counts.tolist()):
+            yield key, offset, count
+
+    def lookup(self, key: int) -> Optional[Tuple[int, int]]:
+        """Byte offset of the first row and number of rows of the object
+        key, or None if it has no rows.
+        """
+        pos = int(np.searchsorted(self.keys, key))
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return None
+        return int(self.offsets[pos]), int(self.counts[pos])
+
+
+def _object_key(key_pos: int) -> Callable[[bytes], Tuple[int, int]]:
+    """Sort key of a line by the integer in column key_pos, with rows that
+    do not have one sorted last.
+    """
+    def key(line: bytes) -> Tuple[int, int]:
+        value = line.split(b",", key_pos + 1)[key_pos]
+        try:
+            return (0, int(value))
+        except ValueError:
+            return (1, 0)
+    return key
+
+
+def _write_run(lines: Iterable[bytes], run_dir: str) -> str:
+    descriptor, filename = tempfile.mkstemp(dir=run_dir, suffix=".run")
+    with open(descriptor, "wb") as run:
+        run.writelines(lines)
+    return filename
+
+
+def _merge_runs(filenames: Sequence[str], sort_key: Callable[[bytes], Any],
+                run_dir: str) -> str:
+    """Merge sorted runs into a single run, removing them. Runs are merged
+    in order, so the merge is stable.
+    """
+    with ExitStack() as stack:
+        runs = [stack.enter_context(open(filename, "rb"))
+                for filename in filenames]
+        merged = _write_run(heapq.merge(*runs, key=sort_key), run_dir)
+    for filename in filenames:
+        os.remove(filename)
+    return merged
+
+
+def sort_by_object(input_filename: str, output_filename: str,
+                   key_column: ColumnName = ColumnName("ssObjectId"),
+                   max_memory: int = 1 << 28,
+                   tmp_dir: Optional[str] = None) -> ObjectRangeIndex:
+    """Sort a converted table by an integer object id column, clustering the
+    rows of every object together, and write an ObjectRangeIndex for the
+    sorted table.
+
+    The sort is external: the input is read max_memory/2 bytes at a time,
+    each chunk is sorted and spilled to a temporary file, and the sorted
+    runs are combined with k-way merges of at most MAX_MERGE_RUNS runs at a
+    time. The last chunk is merged from memory rather than spilled, and is
+    read while the chunk before it is still held, hence the chunks of half
+    of max_memory. The range index is built in int64 arrays, 24 bytes per
+    object. The sort is stable, so rows of an object keep their order from
+    the input. Rows without an id (null)
+    are written at the end and are not included in the range index.
+
+    Parameters
+    ----------
+    input_filename : `str`
+        Path to the table to sort, which must have a header row. Compressed
+        tables are decompressed as they are read.
+    output_filename : `str`
+        Path to write the sorted table to
+    key_column : `ColumnName`
+        Column holding the object id
+    max_memory : `int`
+        Approximate number of bytes of rows held in memory at once, not
+        counting the overhead of Python objects for each row
+    tmp_dir : `str`
+        Directory for the sorted runs, defaulting to the system temporary
+        directory
+    """
+    if os.path.abspath(input_filename) == os.path.abspath(output_filename):
+        raise ValueError("A table can not be sorted in place, choose a "
+                         "different output_filename")
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        with open_input(input_filename) as in_file:
+            header = in_file.readline()
+            fields = header.decode().rstrip("\n").split(",")
+            if key_column not in fields:
+                raise ValueError(f"{input_filename} does not have a column "
+                                 f"{key_column}")
+            sort_key = _object_key(fields.index(key_column))
+            runs: List[str] = []
+            pending: List[bytes] = []
+            while True:
+                lines = in_file.readlines(max(max_memory//2, 1))
+                if not lines:
+                    break
+                if not lines[-1].endswith(b"\n"):
+                    lines[-1] += b"\n"
+                lines.sort(key=sort_key)
+                if pending:
+                    runs.append(_write_run(pending, run_dir))
+                pending = lines
+        while len(runs) > MAX_MERGE_RUNS:
+            runs = [_merge_runs(runs[i:i + MAX_MERGE_RUNS], sort_key, run_dir)
+                    for i in range(0, len(runs), MAX_MERGE_RUNS)]
+
+        keys = array('q')
+        offsets = array('q')
+        counts = array('q')
+        with ExitStack() as stack:
+            run_files = [stack.enter_context(open(filename, "rb"))
+                         for filename in runs]
+            out_file = stack.enter_context(open(output_filename, "wb"))
+            out_file.write(header)
+            offset = len(header)
+            # The last run is already in memory, so it is merged from there
+            merged = heapq.merge(*run_files, pending, key=sort_key)
+            for (is_null, key), group in groupby(merged, key=sort_key):
+                count = 0
+                start = offset
+                for line in group:
+                    out_file.write(line)
+                    offset += len(line)
+                    count += 1
+                if not is_null:
+                    keys.append(key)
+                    offsets.append(start)
+                    counts.append(count)
+    return ObjectRangeIndex.write(output_filename, keys, offsets, counts)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+__all__ = ("merge_with_previous",)
+
+from typing import Generator, MutableMapping, Optional, Sequence, Type
+
+from .SSSchemaBase import TableSchema
+from .compression import open_input
+
+from ..customTypes import ColumnName
+
+
+def merge_with_previous(previous_filename: str, schema: Type[TableSchema],
+                        key_column: ColumnName,
+                        replacements: MutableMapping[str, Sequence[str]],
+                        delta_only: bool = False,
+                        columns: Optional[Sequence[ColumnName]] = None) ->\
+        Generator[Sequence[str], None, None]:
+    """Merge freshly converted rows into a previously built output file.
+
+    Rows of the previous output are streamed through unchanged unless their
+    value in key_column appears in replacements, in which case the
+    replacement is yielded in its place. Replacements whose key does not
+    appear in the previous output are yielded at the end. Only the rows
+    being replaced need to be held in memory, so this is cheap even when
+    the previous output is very large.
+
+    Parameters
+    ----------
+    previous_filename : `str`
+        Path to an output file previously produced for schema, which may
+        be compressed
+    schema : `TableSchema`
+        Schema of both the previous output and the replacement rows
+    key_column : `ColumnName`
+        Column that uniquely identifies a row, i.e. ssObjectId
+    replacements : `MutableMapping`
+        Mapping of key value to newly converted row. This mapping is
+        consumed by the merge.
+    delta_only : `bool`
+        Only yield the rows that are new or differ from the previous output
+        rather than the full merged table.
+    columns : `Sequence of str`
+        Columns of the rows of both the previous output and the
+        replacements, when they were converted with a subset of the
+        columns of schema, i.e. ConversionPlan.fields
+    """
+    names = list(schema.fields if columns is None else columns)
+    if key_column not in names:
+        raise ValueError(f"Rows can only be merged with {previous_filename} "
+                         f"by {key_column} if they have that column")
+    key_pos = names.index(key_column)
+    with open_input(previous_filename) as prev_file:
+        lines = iter(prev_file.readline, b"")
+        header = next(lines).decode().rstrip("\n").split(",")
+        if header != list(schema.fields):
+            raise ValueError(f"{previous_filename} does not match the schema "
+                             f"of {schema.__name__}")
+        for line in lines:
+            fields = line.decode().rstrip("\n").split(",")
+            new = replacements.pop(fields[key_pos], None)
+            if new is None:
+                if not delta_only:
+                    yield fields
+            elif tuple(new) != tuple(fields) or not delta_only:
+                yield new
+    yield from replacements.values()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+__all__ = ("LineIndex", "snap_to_line", "skip_lines", "snap_stream_to_line",
+           "skip_stream_lines", "parse_byte_range", "split_ranges")
+
+from mmap import mmap
+import os
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+
+from .compression import BlockIndex, compression_of, open_input
+
+
+def snap_to_line(mm: mmap, offset: int) -> int:
+    """Return the offset of the first line that starts at or after offset.
+
+    A line belongs to a byte range if its first byte falls within the range,
+    so snapping both ends of consecutive ranges with this function hands
+    every line to exactly one range.
+    """
+    if offset <= 0:
+        return 0
+    if offset >= len(mm):
+        return len(mm)
+    if mm[offset - 1] == ord("\n"):
+        return offset
+    newline = mm.find(b"\n", offset)
+    if newline == -1:
+        return len(mm)
+    return newline + 1
+
+
+def skip_lines(mm: mmap, offset: int, count: int) -> int:
+    """Return the offset of the line count lines after the one starting at
+    offset. This is still O(count), but only scans for newlines rather than
+    decoding each line.
+    """
+    for _ in range(count):
+        newline = mm.find(b"\n", offset)
+        if newline == -1:
+            return len(mm)
+        offset = newline + 1
+    return offset
+
+
+def snap_stream_to_line(stream: BinaryIO, offset: int) -> int:
+    """Like snap_to_line, for a seekable stream such as a BlockReader that
+    can not be memory mapped. The stream is left at the returned offset.
+    """
+    if offset <= 0:
+        return stream.seek(0)
+    stream.seek(offset - 1)
+    # Reading the line holding the byte before offset leaves the stream at
+    # the start of the next line, which is offset itself if that byte is a
+    # newline
+    stream.readline()
+    return stream.tell()
+
+
+def skip_stream_lines(stream: BinaryIO, offset: int, count: int) -> int:
+    """Like skip_lines, for a seekable stream that can not be memory
+    mapped. The stream is left at the returned offset.
+    """
+    stream.seek(offset)
+    for _ in range(count):
+        if not stream.readline():
+            break
+    return stream.tell()
+
+
+def parse_byte_range(value: str) -> Tuple[int, Optional[int]]:
+    """Parse a start:end string as given on the command line. Either side
+    may be left empty to mean the start or end of the file.
+    """
+    try:
+        start, end = value.split(":")
+        return (int(start) if start else 0, int(end) if end else None)
+    except ValueError:
+        raise ValueError(f"Could not interpret byte range {value}, expected "
+                         "start:end")
+
+
+def split_ranges(filename: str, chunk_size: int) ->\
+        List[Tuple[int, Optional[int]]]:
+    """Adjacent byte ranges of about chunk_size bytes covering filename,
+    the last one open ended. Compressed inputs are a single range, as byte
+    ranges count decompressed bytes.
+    """
+    if compression_of(filename) is not None:
+        return [(0, None)]
+    size = os.path.getsize(filename)
+    return [(start, start + chunk_size if start + chunk_size < size else None)
+            for start in range(0, max(size, 1), chunk_size)]
+
+
+class LineIndex:
+    """Byte offsets of the start of every line in a file.
+
+    The offsets are stored next to the input file as a flat array of little
+    endian int64 values, with the size of the file appended as a final
+    sentinel. The index is memory mapped when loaded, so looking up the
+    offset of a given row is O(1) no matter how large the file is.
+    """
+    SUFFIX = ".lineidx"
+    BLOCK_SIZE = 1 << 26
+    # Number of bytes scanned for newlines at a time when building an index
+
+    def __init__(self, offsets: np.ndarray):
+        self.offsets = offsets
+
+    @staticmethod
+    def index_filename(filename: str) -> str:
+        return filename + LineIndex.SUFFIX
+
+    @classmethod
+    def build(cls, filename: str) -> LineIndex:
+        """Scan filename for newlines and write the index next to it. The
+        index is written to a temporary file first, so that several jobs
+        sharing an input never see a partially written index.
+        """
+        index_filename = cls.index_filename(filename)
+        tmp_filename = f"{index_filename}.{os.getpid()}"
+        # Compressed files are indexed by their decompressed contents, which
+        # is how they are read
+        with open_input(filename) as in_file,\
+                open(tmp_filename, "wb") as out_file:
+            size = 0
+            # The start of the last line seen is held back until it is known
+            # not to be a trailing newline, which does not start a new line
+            held: Optional[np.ndarray] = None
+            for chunk in iter(lambda: in_file.read(cls.BLOCK_SIZE), b""):
+                if held is None:
+                    held = np.zeros(1, dtype="<i8")
+                block = np.frombuffer(chunk, dtype=np.uint8)
+                starts = np.concatenate([
+                    held, np.flatnonzero(block == ord("\n")) + (size + 1)])
+                starts[:-1].astype("<i8").tofile(out_file)
+                held = starts[-1:]
+                size += len(chunk)
+            if held is not None and held[0] < size:
+                held.astype("<i8").tofile(out_file)
+            np.array([size], dtype="<i8").tofile(out_file)
+        os.replace(tmp_filename, index_filename)
+        return cls.load(filename)  # type: ignore
+
+    @classmethod
+    def load(cls, filename: str) -> Optional[LineIndex]:
+        """Load the index for filename, returning None if there is no index
+        or it is older than the file it describes.
+        """
+        index_filename = cls.index_filename(filename)
+        if not os.path.exists(index_filename):
+            return None
+        stats = os.stat(filename)
+        if os.stat(index_filename).st_mtime < stats.st_mtime:
+            return None
+        offsets = np.memmap(index_filename, dtype="<i8", mode="r")
+        size = stats.st_size
+        if compression_of(filename) is not None:
+            blocks = BlockIndex.load(filename)
+            # Without a block index the decompressed size is not known
+            # without reading the whole file, so only the time is checked
+            size = blocks.size if blocks is not None else offsets[-1]
+        if offsets[-1] != size:
+            return None
+        return cls(offsets)
+
+    @classmethod
+    def open(cls, filename: str) -> LineIndex:
+        """Load the index for filename, building it if needed."""
+        index = cls.load(filename)
+        if index is None:
+            index = cls.build(filename)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def row_offset(self, row: int) -> int:
+        """Byte offset of the start of row, or the end of the file if row is
+        past the last line.
+        """
+        return int(self.offsets[min(row, len(self))])
+
+    def row_at(self, offset: int) -> int:
+        """Number of the first row starting at or after offset."""
+        return int(np.searchsorted(self.offsets, offset, side="left"))
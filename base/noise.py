@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+__all__ = ("NoiseStream", "noise_stream", "seed_noise",
+           "noise_per_thread")
+
+from contextlib import contextmanager
+import threading
+from typing import Dict, Iterator, List, Optional
+import zlib
+
+import numpy as np
+
+
+class NoiseStream:
+    """A stream of standard normal values for use inside conversion
+    functions.
+
+    Values are drawn from a numpy Generator a block at a time and handed out
+    one per call to next, avoiding the overhead of calling into numpy for
+    every row. When seeded, the stream is derived from the seed, the shard
+    being converted, the name of the input file and the name of the stream,
+    so the values a given row receives depend only on the seed and how the
+    inputs were split up, not on which process converts which shard.
+
+    Within noise_per_thread every thread draws from, and seeds, a copy of
+    the stream of its own.
+    """
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, name: str):
+        self.name = name
+        self._per_thread: Optional[threading.local] = None
+        self.seed(None)
+
+    def _thread_stream(self) -> NoiseStream:
+        stream = getattr(self._per_thread, "stream", None)
+        if stream is None:
+            stream = NoiseStream(self.name)
+            self._per_thread.stream = stream  # type: ignore
+        return stream
+
+    def seed(self, seed: Optional[int], shard: int = 0, source: str = ""):
+        """Restart the stream. A seed of None draws fresh entropy from the
+        operating system, giving non-reproducible values.
+        """
+        if self._per_thread is not None:
+            self._thread_stream().seed(seed, shard, source)
+            return
+        if seed is None:
+            sequence = np.random.SeedSequence()
+        else:
+            sequence = np.random.SeedSequence(
+                [seed, shard, zlib.crc32(source.encode()),
+                 zlib.crc32(self.name.encode())])
+        self.generator = np.random.default_rng(sequence)
+        self._buffer: List[float] = []
+        self._pos = 0
+
+    def next(self) -> float:
+        if self._per_thread is not None:
+            return self._thread_stream().next()
+        if self._pos == len(self._buffer):
+            self._buffer = self.generator.standard_normal(
+                self.BLOCK_SIZE).tolist()
+            self._pos = 0
+        value = self._buffer[self._pos]
+        self._pos += 1
+        return value
+
+
+NOISE_STREAMS: Dict[str, NoiseStream] = {}
+
+
+def noise_stream(name: str) -> NoiseStream:
+    """Return the stream registered under name, creating it if needed."""
+    return NOISE_STREAMS.setdefault(name, NoiseStream(name))
+
+
+def seed_noise(seed: Optional[int], shard: int = 0, source: str = ""):
+    """Reseed every registered stream for converting the given shard of
+    the input named source.
+    """
+    for stream in NOISE_STREAMS.values():
+        stream.seed(seed, shard, source)
+
+
+@contextmanager
+def noise_per_thread() -> Iterator[None]:
+    """Give every thread its own copy of each registered stream while
+    active, so that shards converted concurrently in threads each draw the
+    values they would if converted on their own. Each thread has to seed
+    its streams with seed_noise before drawing from them.
+    """
+    streams = list(NOISE_STREAMS.values())
+    for stream in streams:
+        stream._per_thread = threading.local()
+    try:
+        yield
+    finally:
+        for stream in streams:
+            stream._per_thread = None
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+__all__ = ("decode_batch", "rows_to_records", "scan_range")
+
+from mmap import mmap, PROT_READ
+import os
+from typing import (Any, Callable, Dict, List, Mapping, Optional, Sequence,
+                    Tuple, Union)
+
+import numpy as np
+
+from .compression import BlockReader, compression_of
+from .lineIndex import snap_stream_to_line, snap_to_line
+
+BATCH_SIZE = 1 << 24
+# Number of bytes of a table decoded into one batch at a time
+NULL = "\\N"
+# How nulls are written in converted tables
+NUMERIC_TYPES = {"int": np.int64, "float": np.float64}
+# Schema types decoded into numeric arrays, others are kept as text
+
+
+def _typed(values: List[Any], kind: str) -> np.ndarray:
+    dtype = NUMERIC_TYPES.get(kind)
+    if dtype is None:
+        return np.array(values, dtype=str).astype(object)
+    try:
+        array = np.array(values, dtype=dtype)
+        nulls = np.zeros(len(array), dtype=bool)
+    except ValueError:
+        # Only columns with nulls take the slower path
+        nulls = np.array([value == NULL or value == "" for value in values],
+                         dtype=bool)
+        fill = "0" if dtype is np.int64 else "nan"
+        array = np.array([fill if null else value
+                          for null, value in zip(nulls, values)], dtype=dtype)
+    if dtype is np.int64:
+        # Converting to float64 for NaN would round ids past 2**53
+        return np.ma.MaskedArray(array, mask=nulls)
+    return array
+
+
+def decode_batch(data: bytes, fields: Mapping[str, str],
+                 columns: Optional[Sequence[str]] = None) ->\
+        Dict[str, np.ndarray]:
+    """Decode whole lines of a converted table into an array per column,
+    parsing each column in one numpy call rather than a value at a time.
+
+    float columns become float64 arrays with nulls as NaN, and int columns
+    int64 masked arrays, masked where they are null. Other columns are
+    arrays of str objects, holding NULL for nulls. A column has the same
+    dtype in every batch.
+
+    Parameters
+    ----------
+    data : `bytes`
+        Lines of the table, without its header
+    fields : `Mapping of str to str`
+        Schema fields of the table, i.e. TableSchema.fields
+    columns : `Sequence of str`
+        Columns to decode, by default all of them
+    """
+    names = list(fields)
+    text = data.decode()
+    if text.endswith("\n"):
+        text = text[:-1]
+    values = text.replace("\n", ",").split(",") if text else []
+    if len(values) % len(names):
+        raise ValueError(f"Lines of the batch do not all have {len(names)} "
+                         "fields")
+    batch = {}
+    for name in names if columns is None else columns:
+        position = names.index(name)
+        batch[name] = _typed(values[position::len(names)], fields[name])
+    return batch
+
+
+def rows_to_records(rows: Sequence[Sequence[Any]], fields: Mapping[str, str],
+                    columns: Optional[Sequence[str]] = None) ->\
+        np.ma.MaskedArray:
+    """Pack rows converted by a builder into a numpy masked structured
+    array with a field per column, typed as decode_batch types them. Only
+    int fields are masked where they are null, float fields holding NaN and
+    other fields NULL as in decode_batch.
+
+    Parameters
+    ----------
+    rows : `Sequence of Sequence`
+        Converted rows, holding the values of columns in order
+    fields : `Mapping of str to str`
+        Schema fields of the table, i.e. TableSchema.fields
+    columns : `Sequence of str`
+        Columns of the rows, by default all of the fields
+    """
+    names = list(fields) if columns is None else list(columns)
+    values = list(zip(*rows)) if rows else [() for _ in names]
+    arrays = [_typed(list(column), fields[name])
+              for name, column in zip(names, values)]
+    records = np.ma.empty(len(rows), dtype=[(name, array.dtype) for
+                                            name, array in zip(names, arrays)])
+    for name, array in zip(names, arrays):
+        records[name] = array
+    return records
+
+
+def _scan(handle: Union[mmap, BlockReader], start: int, end: Optional[int],
+          fields: Mapping[str, str], columns: Optional[Sequence[str]],
+          fn: Callable[[Dict[str, np.ndarray]], Any],
+          reduce_fn: Callable[[Any, Any], Any]) -> List[Any]:
+    snap = snap_to_line if isinstance(handle, mmap) else snap_stream_to_line
+    handle.seek(0)
+    header_end = len(handle.readline())
+    start = max(snap(handle, start), header_end)  # type: ignore
+    if end is not None:
+        end = snap(handle, end)  # type: ignore
+    handle.seek(start)
+    position = start
+    result: List[Any] = []
+    while end is None or position < end:
+        data = handle.read(BATCH_SIZE if end is None
+                           else min(BATCH_SIZE, end - position))
+        if not data:
+            break
+        if not data.endswith(b"\n"):
+            # Finish the last line, which never runs past end as end falls
+            # on a line boundary
+            data += handle.readline()
+        position += len(data)
+        value = fn(decode_batch(data, fields, columns))
+        result = [reduce_fn(result[0], value) if result else value]
+    return result
+
+
+def scan_range(task: Tuple[str, Tuple[int, Optional[int]], Mapping[str, str],
+                           Optional[Sequence[str]], Callable, Callable]) ->\
+        List[Any]:
+    """Apply fn to every batch of the lines of a table starting within a
+    byte range, and combine the results with reduce_fn. Returns a list
+    holding the result, or nothing if the range has no lines. The task is a
+    single tuple of the filename, byte range, schema fields, columns, fn and
+    reduce_fn, so it can be sent to a worker process.
+    """
+    filename, (start, end), fields, columns, fn, reduce_fn = task
+    if compression_of(filename) is not None:
+        with BlockReader(filename) as reader:
+            return _scan(reader, start, end, fields, columns, fn, reduce_fn)
+    if os.path.getsize(filename) == 0:
+        return []
+    with open(filename, "rb") as in_file,\
+            mmap(in_file.fileno(), 0, prot=PROT_READ) as mm:
+        return _scan(mm, start, end, fields, columns, fn, reduce_fn)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+__all__ = ("ColumnResultCache", "converter_fingerprint")
+
+import glob
+import hashlib
+import inspect
+import json
+import os
+from types import CodeType
+from typing import (Any, BinaryIO, Callable, Dict, Iterator, List, Sequence,
+                    Set, Tuple)
+
+MAGIC = b"SSTRES01"
+SUFFIX = ".col"
+SEPARATOR = "\0"
+# Values are stored separated by this, which never appears in a table
+READ_SIZE = 1 << 20
+# Number of bytes of a column file read at a time
+FLUSH_EVERY = 1 << 14
+# Number of values of a column held before they are written out
+SIMPLE_TYPES = (str, bytes, int, float, bool, type(None))
+# Values whose repr is hashed as part of a converter, others only count by
+# their type, as their repr may hold a memory address
+
+
+def _code_names(code: CodeType) -> Set[str]:
+    """Global names used by code, including by the code it defines, i.e.
+    comprehensions and lambdas.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _hash_value(value: Any, digest: Any, seen: Set[int]):
+    if inspect.isfunction(value):
+        _hash_function(value, digest, seen)
+    elif isinstance(value, SIMPLE_TYPES):
+        digest.update(repr(value).encode())
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _hash_value(item, digest, seen)
+    else:
+        digest.update(type(value).__qualname__.encode())
+
+
+def _hash_function(function: Callable, digest: Any, seen: Set[int]):
+    if id(function) in seen:
+        return
+    seen.add(id(function))
+    code = function.__code__  # type: ignore
+    try:
+        digest.update(inspect.getsource(function).encode())
+    except (OSError, TypeError):
+        digest.update(code.co_code)
+    for cell in function.__closure__ or ():  # type: ignore
+        _hash_value(cell.cell_contents, digest, seen)
+    for name in sorted(_code_names(code)):
+        value = function.__globals__.get(name)  # type: ignore
+        if inspect.isfunction(value) or isinstance(value, SIMPLE_TYPES):
+            digest.update(name.encode())
+            _hash_value(value, digest, seen)
+
+
+def converter_fingerprint(function: Callable) -> str:
+    """A hash of the source of a conversion function, which changes when
+    it is edited. Along with the function's own source this covers the
+    values it closes over, i.e. the format spec of a formatted converter,
+    and the source of the module level functions and the values of the
+    simple module level constants it uses, following those functions in
+    turn. Changes to classes, i.e. the methods of a NoiseStream, are not
+    seen.
+    """
+    digest = hashlib.sha1()
+    if inspect.isfunction(function):
+        _hash_function(function, digest, set())
+    else:
+        digest.update(repr(function).encode())
+    return digest.hexdigest()[:16]
+
+
+class _ColumnWriter:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.{os.getpid()}"
+        self.out_file: BinaryIO = open(self.tmp_filename, "wb")
+        self.out_file.write(MAGIC)
+        self.values: List[str] = []
+        self.count = 0
+        self.first = True
+
+    def append(self, value: Any):
+        self.values.append(str(value))
+        if len(self.values) == FLUSH_EVERY:
+            self._flush()
+
+    def _flush(self):
+        if not self.values:
+            return
+        text = SEPARATOR.join(self.values)
+        if not self.first:
+            text = SEPARATOR + text
+        self.first = False
+        self.out_file.write(text.encode())
+        self.count += len(self.values)
+        self.values = []
+
+    def close(self):
+        self._flush()
+        self.out_file.write(self.count.to_bytes(8, "little"))
+        self.out_file.close()
+        os.replace(self.tmp_filename, self.filename)
+
+    def discard(self):
+        self.out_file.close()
+        os.remove(self.tmp_filename)
+
+
+class ColumnResultCache:
+    """Keeps the converted values of each column of a table, so that
+    building the table again from the same input only runs the conversion
+    functions that changed since.
+
+    Values are kept in a directory per input, keyed by a hash of key_parts,
+    which should identify the input (its path, size and modification time)
+    and everything else that changes which rows are converted or how, i.e.
+    skip_rows and the noise seed. Each column is a binary file of the text
+    of its values, named after the column and the converter_fingerprint of
+    its conversion function. Files of older versions of a column are removed
+    when a new one is written.
+
+    Parameters
+    ----------
+    directory : `str`
+        Directory to keep the values of every input in
+    key_parts : `Sequence`
+        JSON serializable values identifying the input and conversion
+    """
+    def __init__(self, directory: str, key_parts: Sequence[Any]):
+        key = hashlib.sha1(json.dumps(list(key_parts)).encode()).hexdigest()
+        self.path = os.path.join(directory, key[:24])
+        os.makedirs(self.path, exist_ok=True)
+        self._writers: Dict[str, _ColumnWriter] = {}
+
+    def filename(self, column: str, fingerprint: str) -> str:
+        return os.path.join(self.path, f"{column}.{fingerprint}{SUFFIX}")
+
+    def count(self, column: str, fingerprint: str) -> int:
+        """Number of values cached for column, or -1 if there are none for
+        a converter with this fingerprint.
+        """
+        try:
+            with open(self.filename(column, fingerprint), "rb") as in_file:
+                if in_file.read(len(MAGIC)) != MAGIC:
+                    return -1
+                in_file.seek(-8, os.SEEK_END)
+                return int.from_bytes(in_file.read(8), "little")
+        except (FileNotFoundError, OSError):
+            return -1
+
+    def values(self, column: str, fingerprint: str) -> Iterator[str]:
+        """Yield the cached values of column in row order."""
+        filename = self.filename(column, fingerprint)
+        count = self.count(column, fingerprint)
+        remaining = os.path.getsize(filename) - len(MAGIC) - 8
+        with open(filename, "rb") as in_file:
+            in_file.seek(len(MAGIC))
+            pending = b""
+            while remaining > 0:
+                block = in_file.read(min(READ_SIZE, remaining))
+                remaining -= len(block)
+                values = (pending + block).split(SEPARATOR.encode())
+                pending = values.pop()
+                for value in values:
+                    yield value.decode()
+            if count:
+                yield pending.decode()
+
+    def wrap(self, columns: Sequence[str], functions: Sequence[Callable]) ->\
+            Tuple[List[Callable], int]:
+        """Replace the conversion functions of columns whose values are
+        cached by ones handing out the cached values in order, ignoring the
+        row they are given, and wrap the others to record their values. Also
+        returns the number of rows cached, or -1 if any column is converted,
+        in which case the input has to be read.
+        """
+        wrapped = []
+        counts = set()
+        for column, function in zip(columns, functions):
+            fingerprint = converter_fingerprint(function)
+            count = self.count(column, fingerprint)
+            if count >= 0:
+                wrapped.append(_replay(column, self.values(column,
+                                                           fingerprint)))
+                counts.add(count)
+                continue
+            writer = _ColumnWriter(self.filename(column, fingerprint))
+            self._writers[column] = writer
+            wrapped.append(_record(function, writer.append))
+        if self._writers or len(counts) != 1:
+            return wrapped, -1
+        return wrapped, counts.pop()
+
+    def close(self):
+        """Keep the values of the columns that were converted, removing any
+        older versions of them.
+        """
+        for column, writer in self._writers.items():
+            writer.close()
+            for old in glob.glob(os.path.join(self.path,
+                                              f"{column}.*{SUFFIX}")):
+                if old != writer.filename:
+                    os.remove(old)
+        self._writers = {}
+
+    def discard(self):
+        """Drop the values of the columns that were being converted."""
+        for writer in self._writers.values():
+            writer.discard()
+        self._writers = {}
+
+
+def _replay(column: str, values: Iterator[str]) -> Callable[[Any], str]:
+    next_value = values.__next__
+
+    def convert(row: Any) -> str:
+        try:
+            return next_value()
+        except StopIteration:
+            raise ValueError(f"The cached values of {column} ran out before "
+                             "the input did") from None
+    return convert
+
+
+def _record(function: Callable, append: Callable[[Any], None]) ->\
+        Callable[[Any], Any]:
+    def convert(row: Any) -> Any:
+        value = function(row)
+        append(value)
+        return value
+    return convert
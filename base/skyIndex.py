@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+__all__ = ("SkyIndex", "SkyIndexer", "radec_to_vec", "vec_to_pixel",
+           "pixel_to_vec", "max_pixel_radius", "cone_pixels")
+
+from array import array
+import math
+import os
+from typing import Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# HEALPix pixels in the nested scheme, following Gorski et al. (2005) and
+# the reference implementation. The sky is split into 12 base faces, each
+# of which is split into 4**order pixels, with the bits of a pixel's x and
+# y position within its face interleaved so that the 4 children of pixel p
+# at the next order are 4p to 4p + 3.
+
+_JRLL = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+_JPLL = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+MAX_ORDER = 29
+SPILL_ROWS = 1 << 16
+# Number of positions a SkyIndexer holds in memory before appending them to
+# its spill file
+
+
+def _spread_bits(value: np.ndarray) -> np.ndarray:
+    """Move bit i of each value to bit 2i."""
+    value = value.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)):
+        value = (value | (value << np.uint64(shift))) & np.uint64(mask)
+    return value
+
+
+def _compact_bits(value: np.ndarray) -> np.ndarray:
+    """Move bit 2i of each value to bit i, the inverse of _spread_bits."""
+    value = value.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for shift, mask in ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F),
+                        (4, 0x00FF00FF00FF00FF), (8, 0x0000FFFF0000FFFF),
+                        (16, 0x00000000FFFFFFFF)):
+        value = (value | (value >> np.uint64(shift))) & np.uint64(mask)
+    return value.astype(np.int64)
+
+
+def radec_to_vec(ra: np.ndarray, dec: np.ndarray) ->\
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Unit vectors of positions given in degrees, computed the same way as
+    build_coord does for a single position.
+    """
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    cosdec = np.cos(dec)
+    return cosdec*np.cos(ra), cosdec*np.sin(ra), np.sin(dec)
+
+
+def vec_to_pixel(order: int, x: np.ndarray, y: np.ndarray,
+                 z: np.ndarray) -> np.ndarray:
+    """Nested pixel containing each unit vector, or -1 where the vector is
+    not finite.
+    """
+    nside = 1 << order
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+    x, y, z = (np.where(valid, v, 0.0) for v in (x, y, z))
+    z = np.clip(z, -1.0, 1.0)
+    za = np.abs(z)
+    tt = np.mod(np.arctan2(y, x), 2*math.pi)*(2/math.pi)
+    tt = np.where(tt >= 4, tt - 4, tt)
+
+    # Equatorial region
+    temp1 = nside*(0.5 + tt)
+    temp2 = nside*(0.75*z)
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps, using the distance from the pole rather than 1 - |z| to
+    # keep precision close to the poles
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside*np.hypot(x, y)/np.sqrt((1 + za)/3)
+    jp = np.minimum((tp*tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1 - tp)*tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_pole = np.where(north, ntt, ntt + 8)
+    ix_pole = np.where(north, nside - jm - 1, jp)
+    iy_pole = np.where(north, nside - jp - 1, jm)
+
+    equatorial = za <= 2/3
+    face = np.where(equatorial, face_eq, face_pole)
+    ix = np.where(equatorial, ix_eq, ix_pole)
+    iy = np.where(equatorial, iy_eq, iy_pole)
+    pixels = (face << (2*order)) + (_spread_bits(ix) |
+                                    (_spread_bits(iy) << np.uint64(1))
+                                    ).astype(np.int64)
+    return np.where(valid, pixels, -1)
+
+
+def pixel_to_vec(order: int, pixels: np.ndarray) ->\
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Unit vectors of the centers of nested pixels."""
+    nside = 1 << order
+    pixels = np.asarray(pixels, dtype=np.int64)
+    face = pixels >> (2*order)
+    in_face = pixels & ((1 << (2*order)) - 1)
+    ix = _compact_bits(in_face)
+    iy = _compact_bits(in_face >> 1)
+
+    jr = _JRLL[face]*nside - ix - iy - 1
+    north = jr < nside
+    south = jr > 3*nside
+    nr = np.where(north, jr, np.where(south, 4*nside - jr, nside))
+    fact = 1/(3.0*nside*nside)
+    z = np.where(north, 1 - nr*nr*fact,
+                 np.where(south, nr*nr*fact - 1, (2*nside - jr)*2/(3*nside)))
+    kshift = np.where(north | south, 0, (jr - nside) & 1)
+    jp = (_JPLL[face]*nr + ix - iy + 1 + kshift)//2
+    jp = np.where(jp > 4*nr, jp - 4*nr, jp)
+    jp = np.where(jp < 1, jp + 4*nr, jp)
+    phi = (jp - (kshift + 1)*0.5)*(math.pi/(2*nr))
+    sth = np.sqrt((1 - z)*(1 + z))
+    return sth*np.cos(phi), sth*np.sin(phi), z
+
+
+def max_pixel_radius(order: int) -> float:
+    """Largest angle, in radians, between the center of a pixel and any
+    point inside it.
+    """
+    nside = 1 << order
+    z_a, phi_a = 2/3, math.pi/(4*nside)
+    z_b = 1 - (1 - 1/nside)**2/3
+    s_a, s_b = math.sqrt(1 - z_a*z_a), math.sqrt(1 - z_b*z_b)
+    a = (s_a*math.cos(phi_a), s_a*math.sin(phi_a), z_a)
+    b = (s_b, 0.0, z_b)
+    return _angle(*a, *b)
+
+
+def _angle(x1, y1, z1, x2, y2, z2):
+    """Angle between vectors, accurate for small and large angles alike."""
+    cross = np.sqrt((y1*z2 - z1*y2)**2 + (z1*x2 - x1*z2)**2 +
+                    (x1*y2 - y1*x2)**2)
+    return np.arctan2(cross, x1*x2 + y1*y2 + z1*z2)
+
+
+def cone_pixels(order: int, ra: float, dec: float,
+                radius: float) -> np.ndarray:
+    """Sorted nested pixels at order that may overlap the cone of radius
+    degrees around ra, dec. Pixels are refined a level at a time from the
+    base faces, keeping those whose center is close enough to the cone that
+    part of them could fall inside it, so some returned pixels may lie just
+    outside the cone but none overlapping it are missed.
+    """
+    center = radec_to_vec(np.array(ra), np.array(dec))
+    radius = math.radians(radius)
+    pixels = np.arange(12, dtype=np.int64)
+    for level in range(order + 1):
+        if level:
+            pixels = (pixels[:, None]*4 + np.arange(4)).ravel()
+        distance = _angle(*center, *pixel_to_vec(level, pixels))
+        # Allow for rounding in the vectors on top of the pixel radius
+        pixels = pixels[distance <= radius + max_pixel_radius(level) + 1e-9]
+    return pixels
+
+
+class SkyIndex:
+    """Rows of a table ordered by the HEALPix pixel they fall in, so rows in
+    a region of the sky can be found without reading the whole table.
+
+    The index is stored next to the table as little endian int64 values: the
+    HEALPix order and number of rows, followed by arrays of the pixel, row
+    number, right ascension and declination of every row, all sorted by
+    pixel. Rows without a position have a pixel of -1. The arrays are memory
+    mapped when loaded.
+    """
+    SUFFIX = ".healpix"
+    HEADER = 2
+
+    def __init__(self, order: int, pixels: np.ndarray, rows: np.ndarray,
+                 ra: np.ndarray, dec: np.ndarray):
+        self.order = order
+        self.pixels = pixels
+        self.rows = rows
+        self.ra = ra
+        self.dec = dec
+
+    @staticmethod
+    def index_filename(filename: str) -> str:
+        return filename + SkyIndex.SUFFIX
+
+    @classmethod
+    def write(cls, filename: str, order: int, ra: np.ndarray, dec: np.ndarray,
+              rows: Optional[np.ndarray] = None,
+              pixels: Optional[np.ndarray] = None) -> SkyIndex:
+        """Index the table at filename, whose rows (numbered from 0 after
+        the header) are at positions ra and dec in degrees. Positions that
+        are not numbers are kept, but never match a query.
+        """
+        if not 0 <= order <= MAX_ORDER:
+            raise ValueError(f"HEALPix order must be between 0 and "
+                             f"{MAX_ORDER}, not {order}")
+        ra = np.asarray(ra, dtype=np.float64)
+        dec = np.asarray(dec, dtype=np.float64)
+        if rows is None:
+            rows = np.arange(len(ra), dtype=np.int64)
+        if pixels is None:
+            pixels = vec_to_pixel(order, *radec_to_vec(ra, dec))
+        sort = np.argsort(pixels, kind="stable")
+        index_filename = cls.index_filename(filename)
+        tmp_filename = f"{index_filename}.{os.getpid()}"
+        with open(tmp_filename, "wb") as out_file:
+            np.array([order, len(ra)], dtype="<i8").tofile(out_file)
+            for values, dtype in ((pixels, "<i8"), (rows, "<i8"),
+                                  (ra, "<f8"), (dec, "<f8")):
+                values[sort].astype(dtype).tofile(out_file)
+        os.replace(tmp_filename, index_filename)
+        return cls.load(filename)  # type: ignore
+
+    @classmethod
+    def load(cls, filename: str) -> Optional[SkyIndex]:
+        """Load the index for filename, returning None if there is no index
+        or it is older than the file it describes.
+        """
+        index_filename = cls.index_filename(filename)
+        if not os.path.exists(index_filename):
+            return None
+        if os.path.exists(filename) and os.stat(index_filename).st_mtime <\
+                os.stat(filename).st_mtime:
+            return None
+        order, size = np.fromfile(index_filename, dtype="<i8",
+                                  count=cls.HEADER)
+        arrays = [np.memmap(index_filename, dtype=dtype, mode="r",
+                            offset=8*(cls.HEADER + i*size), shape=(size,))
+                  for i, dtype in enumerate(("<i8", "<i8", "<f8", "<f8"))]
+        return cls(int(order), *arrays)
+
+    @classmethod
+    def merge(cls, partial_filenames: Sequence[str], filename: str):
+        """Combine the indexes of tables that have been concatenated, in
+        order, into the table at filename.
+        """
+        parts = []
+        for partial in partial_filenames:
+            index = cls.load(partial)
+            if index is None:
+                raise ValueError(f"{partial} does not have a sky index")
+            parts.append(index)
+        orders = {index.order for index in parts}
+        if len(orders) > 1:
+            raise ValueError("Sky indexes to merge must have the same order")
+        offsets = np.cumsum([0] + [len(index) for index in parts[:-1]])
+        cls.write(filename, orders.pop() if orders else 0,
+                  np.concatenate([index.ra for index in parts]),
+                  np.concatenate([index.dec for index in parts]),
+                  np.concatenate([index.rows + offset for index, offset in
+                                  zip(parts, offsets)]),
+                  np.concatenate([index.pixels for index in parts]))
+
+    def __len__(self) -> int:
+        return len(self.pixels)
+
+    def pixel_rows(self, pixels: np.ndarray) -> np.ndarray:
+        """Positions in the index arrays of rows that fall in any of the
+        sorted pixels.
+        """
+        starts = np.searchsorted(self.pixels, pixels, side="left")
+        ends = np.searchsorted(self.pixels, pixels, side="right")
+        found = ends > starts
+        starts, ends = starts[found], ends[found]
+        if not len(starts):
+            return np.zeros(0, dtype=np.int64)
+        lengths = ends - starts
+        # starts[i], starts[i] + 1, ..., ends[i] - 1 for every pixel
+        steps = np.ones(lengths.sum(), dtype=np.int64)
+        steps[0] = starts[0]
+        heads = np.cumsum(lengths)[:-1]
+        steps[heads] = starts[1:] - ends[:-1] + 1
+        return np.cumsum(steps)
+
+    def cone_rows(self, ra: float, dec: float, radius: float) -> np.ndarray:
+        """Sorted numbers of the rows within radius degrees of ra, dec."""
+        found = self.pixel_rows(cone_pixels(self.order, ra, dec, radius))
+        distance = _angle(*radec_to_vec(np.array(ra), np.array(dec)),
+                          *radec_to_vec(self.ra[found], self.dec[found]))
+        return np.sort(self.rows[found[distance <= math.radians(radius)]])
+
+
+class SkyIndexer:
+    """Collects the position of each row as a table is built, to write a
+    SkyIndex once it is done.
+
+    Positions are appended to a spill file next to the table every
+    SPILL_ROWS rows, or when flush is called, and the file is only open
+    while being appended to, so many indexers can be filled at once, i.e.
+    one per time partition, without holding every position in memory.
+
+    Parameters
+    ----------
+    order : `int`
+        HEALPix order of the index, each order splitting every pixel of the
+        one before in 4
+    ra_column : `str`
+        Input column holding the right ascension in degrees
+    dec_column : `str`
+        Input column holding the declination in degrees
+    filename : `str`
+        Path of the table being indexed
+    """
+    def __init__(self, order: int, ra_column: str, dec_column: str,
+                 filename: str):
+        self.order = order
+        self.ra_column = ra_column
+        self.dec_column = dec_column
+        self.filename = filename
+        self.spill_filename = \
+            f"{SkyIndex.index_filename(filename)}.{os.getpid()}.spill"
+        # Right ascension and declination of each row, one after the other
+        self._positions = array('d')
+        self._spilled = False
+
+    def add(self, row: Mapping[str, str]):
+        try:
+            ra, dec = float(row[self.ra_column]), float(row[self.dec_column])
+        except (TypeError, ValueError):
+            ra = dec = math.nan
+        self._positions.append(ra)
+        self._positions.append(dec)
+        if len(self._positions) >= 2*SPILL_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Append the positions held in memory to the spill file."""
+        if not self._positions:
+            return
+        with open(self.spill_filename,
+                  "ab" if self._spilled else "wb") as spill:
+            self._positions.tofile(spill)
+        self._spilled = True
+        self._positions = array('d')
+
+    def write(self) -> SkyIndex:
+        self.flush()
+        positions = np.zeros(0, dtype=np.float64)
+        if self._spilled:
+            positions = np.fromfile(self.spill_filename, dtype=np.float64)
+            os.remove(self.spill_filename)
+            self._spilled = False
+        return SkyIndex.write(self.filename, self.order, positions[0::2],
+                              positions[1::2])
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+__all__ = ("TimePartitioner", "read_manifest", "merge_partitions")
+
+from array import array
+from collections import OrderedDict
+import csv
+import json
+import math
+import os
+import shutil
+from typing import (Any, Dict, IO, List, Mapping, Optional, Sequence, Tuple)
+
+import numpy as np
+
+from .skyIndex import SkyIndex, SkyIndexer
+
+MANIFEST = "manifest.json"
+TIMES_SUFFIX = ".mjd"
+NULL_PARTITION = "mjd_null.csv"
+# Partition of rows whose time could not be read
+MAX_OPEN_PARTITIONS = 64
+# Most partition files kept open at once, the least recently written one
+# being closed, and reopened to append to, when another is needed
+TIMES_BUFFER_ROWS = 1 << 16
+# Number of times a partition holds in memory before appending them to its
+# times file
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """Read the manifest of a time partitioned output."""
+    with open(os.path.join(directory, MANIFEST)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(directory: str, window: float, time_column: str,
+                    partitions: List[Dict[str, Any]]):
+    partitions = sorted(partitions, key=lambda entry: (entry["start"] is None,
+                                                       entry["start"]))
+    tmp_filename = os.path.join(directory, f"{MANIFEST}.{os.getpid()}")
+    with open(tmp_filename, "w") as manifest_file:
+        json.dump({"window": window, "time_column": time_column,
+                   "partitions": partitions}, manifest_file, indent=1)
+    os.replace(tmp_filename, os.path.join(directory, MANIFEST))
+
+
+class _Partition:
+    def __init__(self, filename: str, header: Sequence[str],
+                 start: Optional[float], end: Optional[float],
+                 sky: Optional[SkyIndexer]):
+        self.filename = filename
+        self.header = header
+        self.file: Optional[IO] = None
+        self.writer: Any = None
+        self.created = False
+        self.start = start
+        self.end = end
+        # Times of the rows added since they were last appended to the
+        # times file, along with the count and range of those appended
+        self.times = array('d')
+        self.rows = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sky = sky
+
+    def open(self):
+        """Open the file to write to, creating it with its header the first
+        time and appending to it after.
+        """
+        self.file = open(self.filename, "a" if self.created else "w",
+                         newline="")
+        self.writer = csv.writer(self.file, quoting=csv.QUOTE_NONE,
+                                 lineterminator="\n")
+        if not self.created:
+            self.writer.writerow(self.header)
+            self.created = True
+
+    def add_time(self, time: float):
+        self.times.append(time)
+        if len(self.times) >= TIMES_BUFFER_ROWS:
+            self.flush_times()
+
+    def flush_times(self):
+        """Append the times held in memory to the times file."""
+        if not self.times:
+            return
+        times = np.frombuffer(self.times)
+        with open(self.filename + TIMES_SUFFIX,
+                  "ab" if self.rows else "wb") as times_file:
+            times.astype("<f8").tofile(times_file)
+        self.rows += len(times)
+        self.min = min(self.min, float(times.min()))
+        self.max = max(self.max, float(times.max()))
+        self.times = array('d')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writer = None
+        self.flush_times()
+        if self.sky is not None:
+            self.sky.flush()
+
+    def entry(self) -> Dict[str, Any]:
+        return {"filename": os.path.basename(self.filename),
+                "start": self.start, "end": self.end,
+                "min": self.min if self.start is not None else None,
+                "max": self.max if self.start is not None else None,
+                "rows": self.rows}
+
+
+class TimePartitioner:
+    """Splits a table being built into one file per window of time, written
+    into a directory along with a manifest of the bounds and row count of
+    each file.
+
+    Rows are assigned to windows by the input column time_column, holding
+    an MJD, with window k covering [k*window, (k+1)*window). Next to each
+    partition the time of every row is kept as an array of little endian
+    float64 values, so rows can be selected by time whether or not the
+    table has a time column itself. Times are appended to it
+    TIMES_BUFFER_ROWS at a time, and whenever the partition file is closed.
+
+    add must be called with each input row before the converted row is
+    written with writerow, following the other trackers of
+    FileTableBuilder._make_rows. At most MAX_OPEN_PARTITIONS files are open
+    at once, so any number of windows can be written.
+
+    Parameters
+    ----------
+    directory : `str`
+        Directory to write the partitions and manifest to
+    window : `float`
+        Length of each partition in days
+    time_column : `str`
+        Input column holding the time of each row
+    header : `Sequence of str`
+        Header written at the top of every partition
+    sky_order : `int`
+        Write a SkyIndex of every partition at this HEALPix order
+    sky_columns : `tuple of str`
+        Input columns holding the position of each row, when sky_order is
+        set
+    """
+    def __init__(self, directory: str, window: float, time_column: str,
+                 header: Sequence[str], sky_order: Optional[int] = None,
+                 sky_columns: Optional[Tuple[str, str]] = None):
+        if not window > 0:
+            raise ValueError(f"Time partition window must be positive, not "
+                             f"{window}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.window = window
+        self.time_column = time_column
+        self.header = list(header)
+        self.sky_order = sky_order
+        self.sky_columns = sky_columns
+        self.partitions: Dict[Optional[int], _Partition] = {}
+        # Partitions with an open file, least recently written first
+        self._open_partitions: OrderedDict[Optional[int], _Partition] =\
+            OrderedDict()
+        self._current: Optional[_Partition] = None
+
+    def _open(self, key: Optional[int]) -> _Partition:
+        if key is None:
+            name, start, end = NULL_PARTITION, None, None
+        else:
+            start, end = key*self.window, (key + 1)*self.window
+            name = f"mjd_{start:.6f}.csv"
+        sky = None
+        if self.sky_order is not None:
+            sky = SkyIndexer(self.sky_order, *self.sky_columns,  # type: ignore
+                             os.path.join(self.directory, name))
+        partition = _Partition(os.path.join(self.directory, name),
+                               self.header, start, end, sky)
+        self.partitions[key] = partition
+        return partition
+
+    def add(self, row: Mapping[str, str]):
+        try:
+            time = float(row[self.time_column])
+        except (TypeError, ValueError):
+            time = math.nan
+        key = math.floor(time/self.window) if math.isfinite(time) else None
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = self._open(key)
+        if partition.file is None:
+            if len(self._open_partitions) >= MAX_OPEN_PARTITIONS:
+                self._open_partitions.popitem(last=False)[1].close()
+            partition.open()
+            self._open_partitions[key] = partition
+        else:
+            self._open_partitions.move_to_end(key)
+        partition.add_time(time)
+        if partition.sky is not None:
+            partition.sky.add(row)
+        self._current = partition
+
+    def writerow(self, row: Sequence[str]):
+        self._current.writer.writerow(row)  # type: ignore
+
+    def writerows(self, rows):
+        for row in rows:
+            self._current.writer.writerow(row)  # type: ignore
+
+    def close(self):
+        """Close every partition, writing their time arrays, sky indexes and
+        the manifest.
+        """
+        for partition in self.partitions.values():
+            partition.close()
+            if partition.sky is not None:
+                partition.sky.write()
+        _write_manifest(self.directory, self.window, self.time_column,
+                        [partition.entry()
+                         for partition in self.partitions.values()])
+        self._open_partitions.clear()
+
+
+def merge_partitions(partial_directories: Sequence[str], directory: str):
+    """Combine time partitioned outputs into directory, concatenating the
+    partitions of the same window in the order of partial_directories. The
+    partial directories are removed.
+    """
+    manifests = [read_manifest(partial) for partial in partial_directories]
+    windows = {(manifest["window"], manifest["time_column"])
+               for manifest in manifests}
+    if len(windows) > 1:
+        raise ValueError("Time partitioned outputs to merge must have the "
+                         "same window")
+    window, time_column = windows.pop()
+    os.makedirs(directory, exist_ok=True)
+    merged: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for partial, manifest in zip(partial_directories, manifests):
+        for entry in manifest["partitions"]:
+            merged.setdefault(entry["filename"], []).append((partial, entry))
+
+    partitions = []
+    for name, parts in merged.items():
+        filename = os.path.join(directory, name)
+        part_filenames = [os.path.join(partial, name)
+                          for partial, _ in parts]
+        with open(filename, "wb") as out_file,\
+                open(filename + TIMES_SUFFIX, "wb") as times_file:
+            for i, part in enumerate(part_filenames):
+                with open(part, "rb") as part_file:
+                    if i:
+                        # Only keep the header of the first part
+                        part_file.readline()
+                    shutil.copyfileobj(part_file, out_file)
+                with open(part + TIMES_SUFFIX, "rb") as part_times:
+                    shutil.copyfileobj(part_times, times_file)
+        entries = [entry for _, entry in parts]
+        mins = [entry["min"] for entry in entries if entry["min"] is not None]
+        maxs = [entry["max"] for entry in entries if entry["max"] is not None]
+        partitions.append({"filename": name, "start": entries[0]["start"],
+                           "end": entries[0]["end"],
+                           "min": min(mins) if mins else None,
+                           "max": max(maxs) if maxs else None,
+                           "rows": sum(entry["rows"] for entry in entries)})
+        if all(os.path.exists(SkyIndex.index_filename(part))
+               for part in part_filenames):
+            SkyIndex.merge(part_filenames, filename)
+    _write_manifest(directory, window, time_column, partitions)
+    for partial in partial_directories:
+        shutil.rmtree(partial)
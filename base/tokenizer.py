@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+__all__ = ("RowTokenizer", "count_lines")
+
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+SCAN_SIZE = 1 << 24
+# Number of bytes counted for newlines at a time by count_lines
+
+
+def count_lines(buffer: Any, start: int, end: int) -> int:
+    """Number of newlines in buffer[start:end], where buffer is anything
+    exposing the buffer protocol, i.e. an mmap. When end falls on a line
+    boundary this is the number of lines starting in the range.
+
+    The bytes are compared in bulk with NumPy over views of the buffer, so
+    nothing is copied and no Python code runs per line.
+    """
+    count = 0
+    for offset in range(start, end, SCAN_SIZE):
+        size = min(SCAN_SIZE, end - offset)
+        block = np.frombuffer(buffer, dtype=np.uint8, count=size,
+                              offset=offset)
+        count += int(np.count_nonzero(block == ord("\n")))
+        # Drop the view straight away, as an mmap can not be closed while
+        # arrays still export its buffer
+        del block
+    return count
+
+
+class RowTokenizer:
+    """Splits lines of an input file into mappings of input column name to
+    field, the form conversion functions expect their rows in.
+
+    rows chains the decoding, splitting and pairing of fields with names as
+    builtin iterators, so tokenizing runs without a Python function call per
+    line. The fields are the same strings that splitting each line by hand
+    would give, including the line ending on the last field.
+
+    Parameters
+    ----------
+    names : `Iterable of str`
+        Names of the fields of each line, in order
+    delimiter : `str`
+        Separator of the fields, or None to split on runs of whitespace as
+        str.split does
+    """
+    def __init__(self, names: Iterable[str], delimiter: Optional[str] = ","):
+        self.names = tuple(names)
+        self.delimiter = delimiter
+
+    def __call__(self, line: str) -> Dict[str, str]:
+        return dict(zip(self.names, line.split(self.delimiter)))
+
+    def rows(self, lines: Iterable[bytes]) -> Iterator[Dict[str, str]]:
+        """Lazily tokenize every line of lines. A UnicodeDecodeError is
+        raised when iteration reaches a line that is not valid UTF-8.
+        """
+        fields = map(str.split, map(bytes.decode, lines),
+                     repeat(self.delimiter))
+        return map(dict, map(zip, repeat(self.names), fields))
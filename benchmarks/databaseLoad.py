@@ -0,0 +1,81 @@
+"""Compare writing a table straight into a database with writing a CSV file
+and loading it into the database afterwards.
+
+Run from the directory containing the package, i.e.
+
+    python SSTableConvertMod/benchmarks/databaseLoad.py --skip_rows 1 \
+        S0.dat.csv /tmp/bench
+"""
+import argparse
+import csv
+import importlib
+import os
+import sys
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PACKAGE_DIR)
+# The package is imported from the directory containing it
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+
+TABLES = {"dia": "DiaSourceFT", "sssource": "SSSourceFT"}
+
+
+def build(table, args, output_filename, **kwargs):
+    package = importlib.import_module(PACKAGE)
+    base = importlib.import_module(f"{PACKAGE}.base")
+    start = time.perf_counter()
+    getattr(package, TABLES[table]).builder(
+        input_filename=args.input_filename, output_filename=output_filename,
+        skip_rows=args.skip_rows, stop_after=args.stop_after, do_index=False,
+        indexer_class=base.Indexer, seed=1, **kwargs).run()
+    return time.perf_counter() - start
+
+
+def load_csv(table, database, csv_filename, db_filename):
+    """Load a converted CSV file the way it would be without a sink."""
+    base = importlib.import_module(f"{PACKAGE}.base")
+    schema = getattr(importlib.import_module(PACKAGE), TABLES[table]).schema
+    start = time.perf_counter()
+    if database == "duckdb":
+        import duckdb
+        connection = duckdb.connect(db_filename)
+        connection.execute(f"create or replace table {schema.__name__} as "
+                           f"select * from read_csv('{csv_filename}', "
+                           "header = true, nullstr = '\\N')")
+        connection.close()
+        return time.perf_counter() - start
+    # Loading through a sink gives the table the same column types
+    with base.DatabaseSink(db_filename, "sqlite", schema.__name__,
+                           schema.fields) as sink,\
+            open(csv_filename) as in_file:
+        rows = csv.reader(in_file)
+        next(rows)
+        sink.writerows(rows)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", choices=list(TABLES), default="dia")
+    parser.add_argument("--database", choices=["sqlite", "duckdb"],
+                        default="sqlite")
+    parser.add_argument("--skip_rows", type=int, default=0)
+    parser.add_argument("--stop_after", type=int, default=None)
+    parser.add_argument("input_filename")
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    csv_filename = os.path.join(args.output_dir, f"{args.table}.csv")
+    loaded = os.path.join(args.output_dir, f"{args.table}_loaded.db")
+    direct = os.path.join(args.output_dir, f"{args.table}_direct.db")
+    write = build(args.table, args, csv_filename)
+    load = load_csv(args.table, args.database, csv_filename, loaded)
+    sink = build(args.table, args, direct, database=args.database)
+    print(f"csv then load {write + load:8.2f} s  (write {write:.2f} s, "
+          f"load {load:.2f} s)")
+    print(f"direct        {sink:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Measure how long the package takes to start, which matters when many small
+conversion jobs are run as separate processes.
+
+Run from the directory containing the package, i.e.
+
+    python SSTableConvertMod/benchmarks/startup.py --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PACKAGE = os.path.basename(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+CASES = {
+    "import": [sys.executable, "-c", f"import {PACKAGE}"],
+    "--help": [sys.executable, "-m", PACKAGE, "--help"],
+    "mpcorb --help": [sys.executable, "-m", PACKAGE, "mpcorb", "--help"],
+    "import MPCORBFT": [sys.executable, "-c",
+                        f"from {PACKAGE} import MPCORBFT"],
+    "import SSSourceFT": [sys.executable, "-c",
+                          f"from {PACKAGE} import SSSourceFT"],
+    "import SSObjectFT": [sys.executable, "-c",
+                          f"from {PACKAGE} import SSObjectFT"],
+}
+
+HEAVY_MODULES = ("numpy", "pandas", "astropy", "coord", "zmq")
+
+
+def time_command(command, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def heavy_imports(command):
+    """Return which of HEAVY_MODULES a python -c command ends up importing."""
+    check = (f"; import sys; print(' '.join(m for m in {HEAVY_MODULES!r} "
+             f"if m in sys.modules))")
+    result = subprocess.run(command[:-1] + [command[-1] + check],
+                            check=True, capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for name, command in CASES.items():
+        times = time_command(command, args.repeat)
+        line = (f"{name:20} median {statistics.median(times)*1000:8.1f} ms  "
+                f"min {min(times)*1000:8.1f} ms")
+        if command[1] == "-c":
+            line += f"  imports: {' '.join(heavy_imports(command)) or '-'}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import click
 
-from . import (MPCORBFT, DiaSourceFT, SSObjectFT, SSSourceFT)
-from .accumulator import run_server
+# Each command imports what it needs when it runs, keeping start up cheap
+# for commands that don't use the heavier dependencies (pandas, zmq, ...)
 
 
 @click.group(name="SSTableConvertMod")
@@ -10,9 +10,13 @@ def cli():
 
 
 @click.command()
+@click.option("--backend", help="Write the sidecar as a sqlite database or "
+              "as compact binary arrays", default="sqlite",
+              type=click.Choice(["sqlite", "binary"]))
 @click.argument("filename")
-def cli_server(filename):
-    run_server(filename)
+def cli_server(filename, backend):
+    from .accumulator import run_server
+    run_server(filename, backend=backend)
 
 
 @click.command()
@@ -20,15 +24,56 @@ def cli_server(filename):
               " file", default=0)
 @click.option("--stop_after", help="stop after N rows have been converted",
               default=None)
+@click.option("--previous", help="Previously built MPCORB table to update "
+              "with the orbits in the input", default=None)
+@click.option("--delta_only", help="Only write rows that differ from the "
+              "previous table", default=False)
+@click.option("--index_backend", help="Write the sidecar as a sqlite "
+              "database or as compact binary arrays", default="sqlite",
+              type=click.Choice(["sqlite", "binary"]))
 @click.argument("input_fileglob")
 @click.argument("output_filename")
-def mpcorb(input_fileglob, output_filename, skip_rows, stop_after):
+def mpcorb(input_fileglob, output_filename, skip_rows, stop_after, previous,
+           delta_only, index_backend):
+    from . import MPCORBFT
     if stop_after is not None:
         stop_after = int(stop_after)
     MPCORBFT.builder(input_fileglob=input_fileglob,
                      output_filename=output_filename,
                      skip_rows=skip_rows,
-                     stop_after=stop_after).run()
+                     stop_after=stop_after,
+                     previous_filename=previous,
+                     delta_only=delta_only,
+                     index_backend=index_backend).run()
+
+
+def run_builder(table, input_filenames, output_filename, workers, per_input,
+                **builder_kwargs):
+    """Run table's builder on a single input directly, or hand several
+    inputs (given as file names or globs) out to a pool of processes.
+    """
+    from .parallel import convert_files, expand_inputs
+    inputs = expand_inputs(input_filenames)
+    if len(inputs) == 1 and workers == 1 and not per_input:
+        table.builder(input_filename=inputs[0],
+                      output_filename=output_filename,
+                      **builder_kwargs).run()
+        return
+    if builder_kwargs["byte_range"] is not None:
+        raise click.UsageError("--byte_range can only be used with a single "
+                               "input")
+    if builder_kwargs.get("database") is not None:
+        raise click.UsageError("--database can only be used with a single "
+                               "input")
+    convert_files(table, inputs, output_filename, workers, per_input,
+                  **builder_kwargs)
+
+
+@click.command(name="line-index")
+@click.argument("input_filename")
+def line_index(input_filename):
+    from .base import LineIndex
+    LineIndex.build(input_filename)
 
 
 @click.command()
@@ -38,16 +83,168 @@ def mpcorb(input_fileglob, output_filename, skip_rows, stop_after):
               default=None)
 @click.option("--do_index", help="Index the file as it is being created",
               default=True)
-@click.argument("input_filename")
+@click.option("--byte_range", help="Only convert lines starting within the "
+              "start:end byte range of the input", default=None)
+@click.option("--line_index", help="Use a line offset index of the input to "
+              "skip rows", default=False)
+@click.option("--workers", help="Number of processes to convert several "
+              "inputs with", default=1)
+@click.option("--per_input", help="Write one output per input into the "
+              "output directory rather than concatenating them", default=False)
+@click.option("--sky_order", help="Write a HEALPix sky index of the output "
+              "at this order, for cone searches", default=None, type=int)
+@click.option("--time_window", help="Partition the output into a directory "
+              "with one file per this many days of midPointTai", default=None,
+              type=float)
+@click.option("--compression", help="Compress the output with gzip or zstd, "
+              "in blocks that can be read from any row", default=None,
+              type=click.Choice(["gzip", "zstd"]))
+@click.option("--compression_level", help="Level to compress the output at",
+              default=None, type=int)
+@click.option("--compression_threads", help="Number of threads to compress "
+              "the output with", default=1)
+@click.option("--index_backend", help="Write the sidecar as a sqlite "
+              "database or as compact binary arrays", default="sqlite",
+              type=click.Choice(["sqlite", "binary"]))
+@click.option("--column_cache", help="Directory to keep converted columns "
+              "in, so a re-run only converts the columns whose conversion "
+              "changed", default=None)
+@click.option("--conversion_threads", help="Number of threads to convert "
+              "chunks of the input with", default=1)
+@click.option("--database", help="Write the output into a table of a sqlite "
+              "or duckdb database at output_filename rather than to a CSV "
+              "file", default=None, type=click.Choice(["sqlite", "duckdb"]))
+@click.argument("input_filenames", nargs=-1, required=True)
 @click.argument("output_filename")
-def dia(input_filename, output_filename, skip_rows, stop_after, do_index):
+def dia(input_filenames, output_filename, skip_rows, stop_after, do_index,
+        byte_range, line_index, workers, per_input, sky_order,
+        time_window, compression, compression_level, compression_threads,
+        index_backend, column_cache, conversion_threads, database):
+    from . import DiaSourceFT
+    from .base import parse_byte_range
     if stop_after is not None:
         stop_after = int(stop_after)
-    DiaSourceFT.builder(input_filename=input_filename,
-                        output_filename=output_filename,
-                        skip_rows=skip_rows,
-                        stop_after=stop_after,
-                        do_index=do_index).run()
+    if byte_range is not None:
+        byte_range = parse_byte_range(byte_range)
+    builder_kwargs = dict(skip_rows=skip_rows,
+                          stop_after=stop_after,
+                          do_index=do_index,
+                          byte_range=byte_range,
+                          line_index=line_index,
+                          sky_order=sky_order,
+                          time_window=time_window,
+                          compression=compression,
+                          compression_level=compression_level,
+                          compression_threads=compression_threads,
+                          index_backend=index_backend,
+                          column_cache=column_cache,
+                          conversion_threads=conversion_threads,
+                          database=database)
+    run_builder(DiaSourceFT, input_filenames, output_filename, workers,
+                per_input, **builder_kwargs)
+
+
+@click.command(name="sort")
+@click.option("--key", help="Integer column to sort by", default="ssObjectId")
+@click.option("--max_memory", help="Megabytes of rows to sort in memory at "
+              "once, larger tables are sorted in runs on disk", default=256)
+@click.option("--tmp_dir", help="Directory for the sorted runs", default=None)
+@click.argument("input_filename")
+@click.argument("output_filename")
+def sort_table(input_filename, output_filename, key, max_memory, tmp_dir):
+    from .base import sort_by_object
+    sort_by_object(input_filename, output_filename, key,
+                   max_memory*(1 << 20), tmp_dir)
+
+
+@click.command()
+@click.option("--table", help="Table to convert the inputs to",
+              default="dia", type=click.Choice(["dia", "sssource"]))
+@click.option("--skip_rows", help="Number or rows to skip at the start of "
+              "each input", default=0)
+@click.option("--do_index", help="Index each part as it is being created",
+              default=True)
+@click.option("--seed", help="Seed for the random residuals, making the "
+              "output reproducible", default=None, type=int)
+@click.option("--index_backend", help="Write the sidecars as sqlite "
+              "databases or as compact binary arrays", default="sqlite",
+              type=click.Choice(["sqlite", "binary"]))
+@click.option("--chunk_size", help="Megabytes of input in each task",
+              default=256)
+@click.option("--port", help="Port to listen for workers on", default=8392)
+@click.option("--host", help="Address to listen for workers on, i.e. that "
+              "of an interface on a trusted network, or * for all of them",
+              default="127.0.0.1")
+@click.option("--max_attempts", help="Most times a task is tried",
+              default=3)
+@click.option("--task_timeout", help="Seconds after which an unfinished "
+              "task is handed to another worker", default=3600.0)
+@click.option("--local_workers", help="Number of workers to start on this "
+              "machine", default=0)
+@click.argument("input_filenames", nargs=-1, required=True)
+@click.argument("output_dir")
+def coordinator(input_filenames, output_dir, table, skip_rows, do_index,
+                seed, index_backend, chunk_size, port, host, max_attempts,
+                task_timeout, local_workers):
+    from . import DiaSourceFT, SSSourceFT
+    from .parallel import expand_inputs
+    from .workQueue import Coordinator
+    kwargs = dict(skip_rows=skip_rows, do_index=do_index,
+                  index_backend=index_backend)
+    if table == "sssource":
+        kwargs["seed"] = seed
+    manifest = Coordinator({"dia": DiaSourceFT, "sssource": SSSourceFT}[table],
+                           expand_inputs(input_filenames), output_dir,
+                           chunk_size=chunk_size << 20, port=port,
+                           host=host, max_attempts=max_attempts,
+                           task_timeout=task_timeout,
+                           **kwargs).run(local_workers)
+    if manifest["failed"]:
+        raise click.ClickException(f"{len(manifest['failed'])} parts failed, "
+                                   "see the manifest for their errors")
+
+
+@click.command()
+@click.option("--timeout", help="Seconds to wait for the coordinator to "
+              "reply", default=600.0)
+@click.argument("address")
+def worker(address, timeout):
+    from .workQueue import run_worker
+    run_worker(address, timeout=timeout)
+
+
+@click.command(name="merge-index")
+@click.option("--sources", help="Add a source column naming the table each "
+              "row is in, taken as the path of its sidecar without "
+              ".sidecar", default=False)
+@click.option("--backend", help="Backend of the merged sidecar, by default "
+              "that of the first input", default=None,
+              type=click.Choice(["sqlite", "binary"]))
+@click.argument("sidecars", nargs=-1, required=True)
+@click.argument("output_filename")
+def merge_index(sidecars, output_filename, sources, backend):
+    from .base import merge_sidecars
+    from .parallel import expand_inputs
+    partials = expand_inputs(sidecars)
+    names = None
+    if sources:
+        names = [partial[:-len(".sidecar")] if partial.endswith(".sidecar")
+                 else partial for partial in partials]
+    merge_sidecars(partials, output_filename, sources=names, backend=backend)
+
+
+@click.command()
+@click.option("--compression", help="gzip or zstd", default="gzip",
+              type=click.Choice(["gzip", "zstd"]))
+@click.option("--level", help="Level to compress at", default=None, type=int)
+@click.option("--threads", help="Number of threads to compress with",
+              default=1)
+@click.argument("input_filename")
+@click.argument("output_filename")
+def compress(input_filename, output_filename, compression, level, threads):
+    from .base import compress_file
+    compress_file(input_filename, output_filename, compression, level,
+                  threads)
 
 
 @click.command()
@@ -55,18 +252,36 @@ def dia(input_filename, output_filename, skip_rows, stop_after, do_index):
               " file", default=0)
 @click.option("--stop_after", help="stop after N rows have been converted",
               default=None)
+@click.option("--previous", help="Previously built SSObject table to update",
+              default=None)
+@click.option("--changed", help="Sidecar of a new DiaSource batch or MPCORB "
+              "delta whose objects should be recomputed, may be repeated",
+              multiple=True)
+@click.option("--delta_only", help="Only write rows that differ from the "
+              "previous table", default=False)
+@click.option("--sssource", help="Sidecar of the SSSource table, used to fit "
+              "H and G12 per filter", default=None)
+@click.option("--block_size", help="Number of objects to look up and fit "
+              "photometry for at once", default=1000)
 @click.argument("input_dia_filename")
 @click.argument("input_mpc_filename")
 @click.argument("output_filename")
 def ssobject(input_dia_filename, input_mpc_filename, output_filename,
-             skip_rows, stop_after):
+             skip_rows, stop_after, previous, changed, delta_only, sssource,
+             block_size):
+    from . import SSObjectFT
     if stop_after is not None:
         stop_after = int(stop_after)
     SSObjectFT.builder(input_dia_filename=input_dia_filename,
                        input_mpc_filename=input_mpc_filename,
                        output_filename=output_filename,
                        skip_rows=skip_rows,
-                       stop_after=stop_after).run()
+                       stop_after=stop_after,
+                       previous_filename=previous,
+                       changed_filenames=changed,
+                       delta_only=delta_only,
+                       input_sssource_filename=sssource,
+                       block_size=block_size).run()
 
 
 @click.command()
@@ -74,18 +289,144 @@ def ssobject(input_dia_filename, input_mpc_filename, output_filename,
               " file", default=0)
 @click.option("--stop_after", help="stop after N rows have been converted",
               default=None)
-@click.argument("input_filename")
+@click.option("--do_index", help="Index the file as it is being created, "
+              "needed to fit photometry in ssobject", default=False)
+@click.option("--byte_range", help="Only convert lines starting within the "
+              "start:end byte range of the input", default=None)
+@click.option("--line_index", help="Use a line offset index of the input to "
+              "skip rows", default=False)
+@click.option("--seed", help="Seed for the random residuals, making the "
+              "output reproducible", default=None, type=int)
+@click.option("--workers", help="Number of processes to convert several "
+              "inputs with", default=1)
+@click.option("--per_input", help="Write one output per input into the "
+              "output directory rather than concatenating them", default=False)
+@click.option("--sky_order", help="Write a HEALPix sky index of the output "
+              "at this order, for cone searches", default=None, type=int)
+@click.option("--time_window", help="Partition the output into a directory "
+              "with one file per this many days of midPointTai", default=None,
+              type=float)
+@click.option("--compression", help="Compress the output with gzip or zstd, "
+              "in blocks that can be read from any row", default=None,
+              type=click.Choice(["gzip", "zstd"]))
+@click.option("--compression_level", help="Level to compress the output at",
+              default=None, type=int)
+@click.option("--compression_threads", help="Number of threads to compress "
+              "the output with", default=1)
+@click.option("--index_backend", help="Write the sidecar as a sqlite "
+              "database or as compact binary arrays", default="sqlite",
+              type=click.Choice(["sqlite", "binary"]))
+@click.option("--column_cache", help="Directory to keep converted columns "
+              "in, so a re-run only converts the columns whose conversion "
+              "changed", default=None)
+@click.option("--conversion_threads", help="Number of threads to convert "
+              "chunks of the input with", default=1)
+@click.option("--database", help="Write the output into a table of a sqlite "
+              "or duckdb database at output_filename rather than to a CSV "
+              "file", default=None, type=click.Choice(["sqlite", "duckdb"]))
+@click.argument("input_filenames", nargs=-1, required=True)
 @click.argument("output_filename")
-def sssource(input_filename, output_filename, skip_rows, stop_after):
+def sssource(input_filenames, output_filename, skip_rows, stop_after,
+             do_index, byte_range, line_index, seed, workers, per_input,
+             sky_order, time_window, compression, compression_level,
+             compression_threads, index_backend, column_cache,
+             conversion_threads, database):
+    from . import SSSourceFT
+    from .base import parse_byte_range
+    if stop_after is not None:
+        stop_after = int(stop_after)
+    if byte_range is not None:
+        byte_range = parse_byte_range(byte_range)
+    builder_kwargs = dict(skip_rows=skip_rows,
+                          stop_after=stop_after,
+                          do_index=do_index,
+                          byte_range=byte_range,
+                          line_index=line_index,
+                          seed=seed,
+                          sky_order=sky_order,
+                          time_window=time_window,
+                          compression=compression,
+                          compression_level=compression_level,
+                          compression_threads=compression_threads,
+                          index_backend=index_backend,
+                          column_cache=column_cache,
+                          conversion_threads=conversion_threads,
+                          database=database)
+    run_builder(SSSourceFT, input_filenames, output_filename, workers,
+                per_input, **builder_kwargs)
+
+
+@click.command(name="dia-sssource")
+@click.option("--skip_rows", help="Number or rows to skip when building a"
+              " file", default=0)
+@click.option("--stop_after", help="stop after N rows have been converted",
+              default=None)
+@click.option("--do_index", help="Index the DiaSource file as it is being "
+              "created", default=True)
+@click.option("--sssource_do_index", help="Index the SSSource file as it is "
+              "being created", default=False)
+@click.option("--byte_range", help="Only convert lines starting within the "
+              "start:end byte range of the input", default=None)
+@click.option("--line_index", help="Use a line offset index of the input to "
+              "skip rows", default=False)
+@click.option("--seed", help="Seed for the random residuals, making the "
+              "output reproducible", default=None, type=int)
+@click.option("--sky_order", help="Write a HEALPix sky index of the output "
+              "at this order, for cone searches", default=None, type=int)
+@click.option("--time_window", help="Partition the output into a directory "
+              "with one file per this many days of midPointTai", default=None,
+              type=float)
+@click.option("--compression", help="Compress the output with gzip or zstd, "
+              "in blocks that can be read from any row", default=None,
+              type=click.Choice(["gzip", "zstd"]))
+@click.option("--compression_level", help="Level to compress the output at",
+              default=None, type=int)
+@click.option("--compression_threads", help="Number of threads to compress "
+              "the output with", default=1)
+@click.option("--index_backend", help="Write the sidecar as a sqlite "
+              "database or as compact binary arrays", default="sqlite",
+              type=click.Choice(["sqlite", "binary"]))
+@click.argument("input_filename")
+@click.argument("dia_output_filename")
+@click.argument("sssource_output_filename")
+def dia_sssource(input_filename, dia_output_filename,
+                 sssource_output_filename, skip_rows, stop_after, do_index,
+                 sssource_do_index, byte_range, line_index, seed, sky_order,
+                 time_window, compression, compression_level,
+                 compression_threads, index_backend):
+    from .DiaSSSourceBuilder import DiaSSSourceBuilder
+    from .base import parse_byte_range
     if stop_after is not None:
         stop_after = int(stop_after)
-    SSSourceFT.builder(input_filename=input_filename,
-                       output_filename=output_filename, do_index=False,
-                       skip_rows=skip_rows).run()
+    if byte_range is not None:
+        byte_range = parse_byte_range(byte_range)
+    DiaSSSourceBuilder(input_filename=input_filename,
+                       dia_output_filename=dia_output_filename,
+                       sssource_output_filename=sssource_output_filename,
+                       skip_rows=skip_rows,
+                       stop_after=stop_after,
+                       do_index=do_index,
+                       sssource_do_index=sssource_do_index,
+                       byte_range=byte_range,
+                       line_index=line_index,
+                       seed=seed,
+                       sky_order=sky_order,
+                       time_window=time_window,
+                       compression=compression,
+                       compression_level=compression_level,
+                       compression_threads=compression_threads,
+                       index_backend=index_backend).run()
 
 
 cli.add_command(mpcorb)
 cli.add_command(dia)
 cli.add_command(ssobject)
 cli.add_command(sssource)
+cli.add_command(dia_sssource)
 cli.add_command(cli_server)
+cli.add_command(line_index)
+cli.add_command(sort_table)
+cli.add_command(compress)
+cli.add_command(merge_index)
+cli.add_command(coordinator)
+cli.add_command(worker)
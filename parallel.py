@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+__all__ = ("expand_inputs", "convert_files")
+
+from glob import glob
+from multiprocessing import Pool
+import os
+import shutil
+from typing import Any, Iterable, List, Tuple, Type
+
+from .base import (BlockIndex, FileTable, Indexer, SkyIndex,
+                   concatenate_blocks, merge_partitions, merge_sidecars)
+
+COMBINED_SIDECAR = "combined.sidecar"
+# Name of the sidecar indexing every output when writing one output per input
+
+
+def expand_inputs(patterns: Iterable[str]) -> List[str]:
+    """Expand each pattern as a glob, keeping the order patterns were given
+    in. Patterns that match nothing are kept as is so that opening them
+    raises a useful error.
+    """
+    filenames: List[str] = []
+    for pattern in patterns:
+        matches = sorted(glob(pattern))
+        filenames.extend(matches if matches else [pattern])
+    return filenames
+
+
+def _convert_file(task: Tuple[Type[FileTable], str, str, dict]) -> str:
+    table, input_filename, output_filename, kwargs = task
+    # Each worker writes its own sidecar, which are merged afterwards, so no
+    # shared index server is needed
+    table.builder(input_filename=input_filename,
+                  output_filename=output_filename,
+                  indexer_class=Indexer, **kwargs).run()
+    return output_filename
+
+
+def convert_files(table: Type[FileTable], input_filenames: List[str],
+                  output_filename: str, workers: int = 1,
+                  per_input: bool = False, **kwargs: Any):
+    """Convert several input files with table's builder, spreading them over
+    a pool of worker processes.
+
+    Parameters
+    ----------
+    table : `type`
+        FileTable subclass whose builder converts each input
+    input_filenames : `list of str`
+        Paths of the files to convert
+    output_filename : `str`
+        When per_input is False, the path of a single output that the
+        converted files are concatenated into, in the order of
+        input_filenames, with one sidecar indexing all of it. Otherwise a
+        directory that gets one output (and sidecar) per input, named after
+        the input, along with a combined sidecar that has an extra source
+        column naming the output each row is in.
+    workers : `int`
+        Number of processes to convert files with
+    per_input : `bool`
+        Write one output per input rather than concatenating them
+    **kwargs
+        Passed on to the builder of each file, i.e. skip_rows, which is
+        applied to each file
+    """
+    if per_input:
+        os.makedirs(output_filename, exist_ok=True)
+        outputs = [os.path.join(output_filename, os.path.basename(filename))
+                   for filename in input_filenames]
+        if len(set(outputs)) != len(outputs):
+            raise ValueError("Inputs must have unique file names when "
+                             "writing one output per input")
+    else:
+        outputs = [f"{output_filename}.part{i}"
+                   for i in range(len(input_filenames))]
+    tasks = [(table, filename, output, kwargs)
+             for filename, output in zip(input_filenames, outputs)]
+
+    if workers > 1:
+        with Pool(workers) as pool:
+            for _ in pool.imap_unordered(_convert_file, tasks):
+                pass
+    else:
+        for task in tasks:
+            _convert_file(task)
+
+    sidecars = [output+".sidecar" for output in outputs]
+    do_index = kwargs.get("do_index", True)
+    if per_input:
+        if do_index:
+            merge_sidecars(sidecars,
+                           os.path.join(output_filename, COMBINED_SIDECAR),
+                           sources=outputs)
+        return
+
+    if kwargs.get("time_window") is not None:
+        # Parts are directories of partitions, with any sky indexes merged
+        # a partition at a time
+        merge_partitions(outputs, output_filename)
+    else:
+        if kwargs.get("compression") is not None:
+            # Compressed parts are joined block by block, without
+            # decompressing them
+            concatenate_blocks(outputs, output_filename)
+            for part in outputs:
+                os.remove(part)
+                os.remove(BlockIndex.index_filename(part))
+        else:
+            _concatenate(outputs, output_filename)
+        if kwargs.get("sky_order") is not None:
+            SkyIndex.merge(outputs, output_filename)
+            for part in outputs:
+                os.remove(SkyIndex.index_filename(part))
+    if do_index:
+        merge_sidecars(sidecars, output_filename+".sidecar")
+        for sidecar in sidecars:
+            os.remove(sidecar)
+
+
+def _concatenate(outputs: List[str], output_filename: str):
+    with open(output_filename, "wb") as out_file:
+        for i, part in enumerate(outputs):
+            with open(part, "rb") as part_file:
+                if i:
+                    # Only keep the header of the first part
+                    part_file.readline()
+                shutil.copyfileobj(part_file, out_file)
+            os.remove(part)
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+__all__ = ("FILTERS", "HG12Fit", "PhotometryBatch", "fit_hg12")
+
+from array import array
+import math
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+FILTERS = "ugrizy"
+FILTER_POS = {f: pos for pos, f in enumerate(FILTERS)}
+
+MIN_NDATA = 3
+# Fewest observations in a band needed to fit both H and G12
+
+G12_GRID = np.linspace(0.0, 1.0, 51)
+# Values of G12 the chi2 is profiled over, the minimum is then refined by
+# fitting a parabola through the closest grid points
+
+
+class _ClampedSpline:
+    """Cubic spline through nodes with fixed first derivatives at both
+    ends, the form used by Muinonen et al. (2010) to define the HG12 basis
+    functions.
+    """
+    def __init__(self, x: Sequence[float], y: Sequence[float],
+                 d_start: float, d_end: float):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        h = np.diff(self.x)
+        n = len(self.x)
+        system = np.zeros((n, n))
+        rhs = np.zeros(n)
+        system[0, :2] = 2*h[0], h[0]
+        rhs[0] = 6*((self.y[1] - self.y[0])/h[0] - d_start)
+        system[-1, -2:] = h[-1], 2*h[-1]
+        rhs[-1] = 6*(d_end - (self.y[-1] - self.y[-2])/h[-1])
+        for i in range(1, n - 1):
+            system[i, i-1:i+2] = h[i-1], 2*(h[i-1] + h[i]), h[i]
+            rhs[i] = 6*((self.y[i+1] - self.y[i])/h[i] -
+                        (self.y[i] - self.y[i-1])/h[i-1])
+        self.m = np.linalg.solve(system, rhs)
+        self.h = h
+
+    def __call__(self, value: np.ndarray) -> np.ndarray:
+        value = np.clip(value, self.x[0], self.x[-1])
+        i = np.clip(np.searchsorted(self.x, value) - 1, 0, len(self.h) - 1)
+        h = self.h[i]
+        left = self.x[i + 1] - value
+        right = value - self.x[i]
+        return (self.m[i]*left**3 + self.m[i+1]*right**3)/(6*h) +\
+            (self.y[i]/h - self.m[i]*h/6)*left +\
+            (self.y[i+1]/h - self.m[i+1]*h/6)*right
+
+
+_PHI1 = _ClampedSpline(np.radians([7.5, 30, 60, 90, 120, 150]),
+                       [7.5e-1, 3.3486016e-1, 1.3410560e-1, 5.1104756e-2,
+                        2.1465687e-2, 3.6396989e-3],
+                       -1.9098593, -9.1328612e-2)
+_PHI2 = _ClampedSpline(np.radians([7.5, 30, 60, 90, 120, 150]),
+                       [9.25e-1, 6.2884169e-1, 3.1755495e-1, 1.2716367e-1,
+                        2.2373903e-2, 1.6505689e-4],
+                       -5.7295780e-1, -8.6573138e-8)
+_PHI3 = _ClampedSpline(np.radians([0, 0.3, 1, 2, 4, 8, 12, 20, 30]),
+                       [1, 8.3381185e-1, 5.7735424e-1, 4.2144772e-1,
+                        2.3174230e-1, 1.0348178e-1, 6.1733473e-2,
+                        1.6107006e-2, 0],
+                       -1.0630097e-1, 0)
+_SMALL_ANGLE = math.radians(7.5)
+
+
+def basis_functions(alpha: np.ndarray) -> np.ndarray:
+    """Evaluate the three HG12 basis functions at phase angles alpha (in
+    radians), returning an array of shape (3, len(alpha)).
+    """
+    small = alpha < _SMALL_ANGLE
+    phi1 = np.where(small, 1 - 6*alpha/math.pi, _PHI1(alpha))
+    phi2 = np.where(small, 1 - 9*alpha/(5*math.pi), _PHI2(alpha))
+    phi3 = np.where(alpha < math.radians(30), _PHI3(alpha), 0.0)
+    return np.stack((phi1, phi2, phi3))
+
+
+def _g12_to_g1g2(g12: np.ndarray) -> np.ndarray:
+    g1 = np.where(g12 < 0.2, 0.7527*g12 + 0.06164, 0.9529*g12 + 0.02162)
+    g2 = np.where(g12 < 0.2, -0.9612*g12 + 0.6270, -0.6125*g12 + 0.5572)
+    return np.stack((g1, g2, 1 - g1 - g2))
+
+
+_GRID_WEIGHTS = _g12_to_g1g2(G12_GRID)
+
+
+class HG12Fit(NamedTuple):
+    """Results of fitting H and G12, one entry per group. Entries that could
+    not be fit are NaN, and ndata is the number of observations in the
+    group.
+    """
+    H: np.ndarray
+    G12: np.ndarray
+    HErr: np.ndarray
+    G12Err: np.ndarray
+    H_G12_Cov: np.ndarray
+    Chi2: np.ndarray
+    Ndata: np.ndarray
+
+
+def fit_hg12(groups: np.ndarray, alpha: np.ndarray, reduced_mag: np.ndarray,
+             sigma: np.ndarray, n_groups: int) -> HG12Fit:
+    """Fit H and G12 independently for every group of observations at once.
+
+    For a fixed G12 the model is linear in H, so chi2 is profiled over
+    G12_GRID by computing the weighted least squares H for every group and
+    grid point in one set of array operations. The grid minimum is refined
+    with a parabola through its neighbours, whose curvature also gives the
+    G12 uncertainty. HErr combines the uncertainty at fixed G12 with how H
+    moves along the profile, and the covariance follows from the same slope.
+
+    Parameters
+    ----------
+    groups : `np.ndarray` of int
+        Group (i.e. object and filter) each observation belongs to, in the
+        range [0, n_groups)
+    alpha : `np.ndarray`
+        Phase angle of each observation in degrees
+    reduced_mag : `np.ndarray`
+        Magnitude reduced to unit heliocentric and topocentric distance
+    sigma : `np.ndarray`
+        Uncertainty of each magnitude
+    n_groups : `int`
+        Number of groups to return results for
+    """
+    nan = np.full(n_groups, np.nan)
+    ndata = np.bincount(groups, minlength=n_groups)
+    result = HG12Fit(nan.copy(), nan.copy(), nan.copy(), nan.copy(),
+                     nan.copy(), nan.copy(), ndata)
+    if not len(groups):
+        return result
+
+    order = np.argsort(groups, kind="stable")
+    groups = groups[order]
+    starts = np.flatnonzero(np.diff(groups, prepend=-1))
+    group_ids = groups[starts]
+    weight = 1/sigma[order]**2
+    mag = reduced_mag[order]
+    sum_w = np.add.reduceat(weight, starts)
+    # Work relative to the mean magnitude of each group to keep the sums of
+    # squares well conditioned
+    mean_mag = np.add.reduceat(weight*mag, starts)/sum_w
+    mag = mag - np.repeat(mean_mag, np.diff(np.append(starts, len(mag))))
+
+    phi = basis_functions(np.radians(alpha[order]))
+    # log of the phase function for every observation and grid point
+    log_phi = 2.5*np.log10(np.maximum(phi.T @ _GRID_WEIGHTS, 1e-300))
+
+    sum_wm = np.add.reduceat(weight*mag, starts)
+    sum_wm2 = np.add.reduceat(weight*mag*mag, starts)
+    weighted_log_phi = weight[:, None]*log_phi
+    sum_wl = np.add.reduceat(weighted_log_phi, starts)
+    sum_wml = np.add.reduceat(weighted_log_phi*mag[:, None], starts)
+    sum_wl2 = np.add.reduceat(weighted_log_phi*log_phi, starts)
+
+    sum_wy = sum_wm[:, None] + sum_wl
+    h_grid = sum_wy/sum_w[:, None]
+    chi2 = sum_wm2[:, None] + 2*sum_wml + sum_wl2 - sum_wy*h_grid
+
+    rows = np.arange(len(group_ids))
+    best = np.clip(np.argmin(chi2, axis=1), 1, len(G12_GRID) - 2)
+    low, mid, high = (chi2[rows, best - 1], chi2[rows, best],
+                      chi2[rows, best + 1])
+    step = G12_GRID[1] - G12_GRID[0]
+    curvature = (low - 2*mid + high)/step**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(curvature > 0, 0.5*(low - high)/(curvature*step),
+                         0.0)
+        shift = np.clip(shift, -step, step)
+        g12 = np.clip(G12_GRID[best] + shift, G12_GRID[0], G12_GRID[-1])
+        slope = (h_grid[rows, best + 1] - h_grid[rows, best - 1])/(2*step)
+        h = mean_mag + h_grid[rows, best] + slope*shift
+        g12_var = np.where(curvature > 0, 2/curvature, np.nan)
+        chi2_min = mid - 0.5*curvature*shift**2
+
+    fit = ndata[group_ids] >= MIN_NDATA
+    group_ids = group_ids[fit]
+    result.H[group_ids] = h[fit]
+    result.G12[group_ids] = g12[fit]
+    result.HErr[group_ids] = np.sqrt(1/sum_w[fit] + slope[fit]**2 *
+                                     g12_var[fit])
+    result.G12Err[group_ids] = np.sqrt(g12_var[fit])
+    result.H_G12_Cov[group_ids] = slope[fit]*g12_var[fit]
+    result.Chi2[group_ids] = np.maximum(chi2_min[fit], 0)
+    return result
+
+
+class PhotometryBatch:
+    """Collects DiaSource photometry for a block of objects so that all of
+    them can be fit with a single call to fit_hg12.
+
+    Observations are appended to flat arrays, grouped by object slot within
+    the block and filter.
+    """
+    def __init__(self, n_objects: int):
+        self.n_objects = n_objects
+        self.groups = array('q')
+        self.alpha = array('d')
+        self.mag = array('d')
+        self.distance = array('d')
+        # product of the heliocentric and topocentric distances
+        self.sigma = array('d')
+
+    def add(self, slot: int, filter: str, mag: str, alpha: str,
+            heliocentric_dist: str, topocentric_dist: str, sigma: str):
+        """Add one observation of the object in slot. Values come straight
+        from the sidecars, observations with a missing value or unknown
+        filter are skipped.
+        """
+        pos = FILTER_POS.get(filter)
+        if pos is None:
+            return
+        try:
+            values = (float(mag), float(alpha),
+                      float(heliocentric_dist)*float(topocentric_dist),
+                      float(sigma))
+        except (TypeError, ValueError):
+            return
+        if not values[3] > 0 or not values[2] > 0:
+            return
+        self.groups.append(slot*len(FILTERS) + pos)
+        self.mag.append(values[0])
+        self.alpha.append(values[1])
+        self.distance.append(values[2])
+        self.sigma.append(values[3])
+
+    def fit(self) -> HG12Fit:
+        """Fit every object and filter in the batch. Results for the object
+        in slot and filter f are at index slot*len(FILTERS) +
+        FILTERS.index(f).
+        """
+        reduced_mag = np.frombuffer(self.mag) -\
+            5*np.log10(np.frombuffer(self.distance))
+        return fit_hg12(np.frombuffer(self.groups, dtype=np.int64),
+                        np.frombuffer(self.alpha), reduced_mag,
+                        np.frombuffer(self.sigma),
+                        self.n_objects*len(FILTERS))
@@ -38,3 +38,21 @@ class SSSource(TableSchema):
     topocentricVX: float
     topocentricVY: float
     topocentricVZ: float
+
+    # Angles in degrees to 1e-8 (36 micro arcseconds), distances and
+    # positions in au to 1e-9 (150 m), magnitudes to 1e-4, and the small
+    # sigmas and velocities to 9 significant digits
+    formats = {
+        **{column: ".8f" for column in (
+            "eclipticLambda", "eclipticBeta", "galacticL", "galacticB",
+            "residualRa", "residualDec")},
+        **{column: ".9f" for column in (
+            "heliocentricDist", "topocentricDist", "heliocentricX",
+            "heliocentricY", "heliocentricZ", "topocentricX",
+            "topocentricY", "topocentricZ")},
+        **{column: ".4f" for column in (
+            "predictedMagnitude", "predictedMagnitudeSigma")},
+        **{column: ".9g" for column in (
+            "predictedRaSigma", "predictedDecSigma", "topocentricVX",
+            "topocentricVY", "topocentricVZ")},
+    }
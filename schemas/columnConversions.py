@@ -3,10 +3,10 @@ from __future__ import annotations
 __all__ = ()
 
 from sys import maxsize
-import astropy.units as u  # or use conversion factors to save compute time?
 from coord import CelestialCoord, degrees, _Angle, util
 from hashlib import sha1
-from typing import MutableMapping, Mapping, TYPE_CHECKING, Tuple
+from typing import (Callable, MutableMapping, Mapping, TYPE_CHECKING, Tuple,
+                    Union)
 from functools import lru_cache
 import math
 import numpy as np
@@ -16,6 +16,8 @@ from .MPCORBSchema import MPCORB
 from .SSSourceSchema import SSSource
 from .SSObjectSchema import SSObject
 from ..base.SSTableBase import NoIndexError
+from ..base.noise import noise_stream
+from ..photometricFit import FILTERS
 
 from ..customTypes import ColumnName
 
@@ -25,10 +27,11 @@ if TYPE_CHECKING:
 
 DIASOURCE_SSID_CACHE: MutableMapping = {}
 
-# conversions
-KM_TO_AU = u.km.to(u.au)
-KM_PER_SECOND_TO_AU_PER_DAY = (u.km/u.s).to(u.au/u.day)
-MAS_TO_DEG = u.mas.to(u.deg)
+# conversions, precomputed with astropy.units (i.e. u.km.to(u.au)) rather
+# than importing it, which dominates the start up time of the package
+KM_TO_AU = 6.684587122268446e-09
+KM_PER_SECOND_TO_AU_PER_DAY = 0.0005775483273639937
+MAS_TO_DEG = 2.777777777777778e-07
 DEG2RAD = np.deg2rad(1)
 RAD2DEG = 1/DEG2RAD
 
@@ -172,24 +175,17 @@ def return_ssObjectId(row: SSObjectRow) -> str:
 
 @SSObject.register(ColumnName("numObs"))
 def count_obs(row: SSObjectRow) -> str:
-    return f"{len(row.dia_list)}"
+    return f"{row.aggregate.count}"
 
 
 @SSObject.register(ColumnName("arc"))
 def calculate_arc(row: SSObjectRow) -> str:
-    midPointTai_list = [d['midPointTai'] for d in row.dia_list]
-    if '\\N' in midPointTai_list:
+    aggregate = row.aggregate
+    if aggregate.tai_null or not aggregate.count:
         return '\\N'
-    sort_dates = sorted(float(x) for x in midPointTai_list)
-    return f"{sort_dates[-1] - sort_dates[0]}"
+    return f"{aggregate.tai_max - aggregate.tai_min}"
 
 
-@SSObject.register(ColumnName("uH"))
-@SSObject.register(ColumnName("gH"))
-@SSObject.register(ColumnName("rH"))
-@SSObject.register(ColumnName("iH"))
-@SSObject.register(ColumnName("zH"))
-@SSObject.register(ColumnName("yH"))
 def pass_through_h(row: SSObjectRow) -> str:
     entry = row.mpc_entry
     if entry is None:
@@ -199,25 +195,52 @@ def pass_through_h(row: SSObjectRow) -> str:
     return f"{entry['mpcH']}"
 
 
+def make_photometry_converter(band_pos: int, attribute: str) ->\
+        Callable[[SSObjectRow], str]:
+    """Make a converter returning one attribute of the H, G12 fit for the
+    filter at band_pos. When no photometry was fit at all, H falls back to
+    the MPCORB value and every other column is null.
+    """
+    def convert_photometry(row: SSObjectRow) -> str:
+        if row.photometry is None:
+            return pass_through_h(row) if attribute == "H" else '\\N'
+        value = getattr(row.photometry,
+                        attribute)[row.photometry_offset + band_pos]
+        if value != value:
+            # NaN marks a band that could not be fit
+            return '\\N'
+        return f"{value}"
+    return convert_photometry
+
+
+for band_pos, band in enumerate(FILTERS):
+    for suffix, attribute in (("H", "H"), ("G12", "G12"), ("HErr", "HErr"),
+                              ("G12Err", "G12Err"),
+                              (f"H_{band}G12_Cov", "H_G12_Cov"),
+                              ("Chi2", "Chi2"), ("Ndata", "Ndata")):
+        SSObject.register(ColumnName(f"{band}{suffix}"))(
+            make_photometry_converter(band_pos, attribute))
+
+
 # ### SSSource ####
 @SSSource.register(ColumnName("eclipticLambda"))
 def make_ecliptic_lamba(row: Mapping):
-    return f"{build_ecliptic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[0]}"  # noqa: E501
+    return build_ecliptic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[0]  # noqa: E501
 
 
 @SSSource.register(ColumnName("eclipticBeta"))
 def make_ecliptic_beta(row: Mapping):
-    return f"{build_ecliptic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[1]}"  # noqa: E501
+    return build_ecliptic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[1]  # noqa: E501
 
 
 @SSSource.register(ColumnName("galacticL"))
-def make_galactic_l(row: Mapping) -> str:
-    return f"{build_galactic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[0]}"  # noqa: E501
+def make_galactic_l(row: Mapping) -> Union[float, str]:
+    return build_galactic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[0]  # noqa: E501
 
 
 @SSSource.register(ColumnName("galacticB"))
-def make_galactic_b(row: Mapping) -> str:
-    return f"{build_galactic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[1]}"  # noqa: E501
+def make_galactic_b(row: Mapping) -> Union[float, str]:
+    return build_galactic_coord(float(row['AstRA(deg)']), float(row['AstDec(deg)']))[1]  # noqa: E501
 
 
 @lru_cache(maxsize=1000)
@@ -270,21 +293,21 @@ def return_phaseAngle(row: Mapping) -> str:
 
 
 @SSSource.register(ColumnName("heliocentricDist"))
-def return_heliocentricDist(row: Mapping) -> str:
+def return_heliocentricDist(row: Mapping) -> Union[float, str]:
     if not row['Ast-Sun(J2000x)(km)'] or not row['Ast-Sun(J2000y)(km)'] or\
             not row['Ast-Sun(J2000z)(km)']:
         return '\\N'
     value = math.sqrt(float(row['Ast-Sun(J2000x)(km)'])**2 +
                       float(row['Ast-Sun(J2000y)(km)'])**2 +
                       float(row['Ast-Sun(J2000z)(km)'])**2)
-    return f"{value*KM_TO_AU}"
+    return value*KM_TO_AU
 
 
 @SSSource.register(ColumnName("topocentricDist"))
-def return_topocentricDist(row: Mapping) -> str:
+def return_topocentricDist(row: Mapping) -> Union[float, str]:
     if not row['AstRange(km)']:
         return '\\N'
-    return f"{float(row['AstRange(km)'])*KM_TO_AU}"
+    return float(row['AstRange(km)'])*KM_TO_AU
 
 
 @SSSource.register(ColumnName("predictedMagnitude"))
@@ -298,71 +321,77 @@ def return_photometricSigma(row: Mapping) -> str:
 
 
 @SSSource.register(ColumnName("predictedRaSigma"))
-def return_predicted_ra_sigma(row: Mapping) -> str:
+def return_predicted_ra_sigma(row: Mapping) -> Union[float, str]:
     if row['AstRASigma(mas)'] == '':
         return '\\N'
-    return f"{float(row['AstRASigma(mas)'])* MAS_TO_DEG}"
+    return float(row['AstRASigma(mas)'])*MAS_TO_DEG
 
 
 @SSSource.register(ColumnName("predictedDecSigma"))
-def return_predicted_dec_sigma(row: Mapping) -> str:
+def return_predicted_dec_sigma(row: Mapping) -> Union[float, str]:
     if row['AstDecSigma(mas)'] == '':
         return '\\N'
-    return f"{float(row['AstDecSigma(mas)'])* MAS_TO_DEG}"
+    return float(row['AstDecSigma(mas)'])*MAS_TO_DEG
 
 
 @SSSource.register(ColumnName('predictedMagnitude'))
-def predMag(row: Mapping) -> str:
-    return f'{float(row["Filtermag"])}'
+def predMag(row: Mapping) -> Union[float, str]:
+    return float(row["Filtermag"])
 
 
 @SSSource.register(ColumnName('predictedMagnitudeSigma'))
-def predMagSig(row: Mapping) -> str:
-    return f'{float(row["PhotometricSigma(mag)"])}'
+def predMagSig(row: Mapping) -> Union[float, str]:
+    return float(row["PhotometricSigma(mag)"])
+
+
+RESIDUAL_RA_NOISE = noise_stream("residualRa")
+RESIDUAL_DEC_NOISE = noise_stream("residualDec")
 
 
 @SSSource.register(ColumnName('residualRa'))
-def residualRa(row: Mapping) -> str:
+def residualRa(row: Mapping) -> Union[float, str]:
+    # Draw for every row, even null ones, so each row always receives the
+    # same value from a seeded stream
+    noise = RESIDUAL_RA_NOISE.next()
     if not row['AstRA(deg)'] or not row['AstRASigma(mas)']:
         return '\\N'
     ra = float(row['AstRA(deg)'])
     ras = float(row['AstRASigma(mas)'])*MAS_TO_DEG
-    ran = np.random.normal(ra, ras)
-    return f"{ran}"
+    return ra + ras*noise
 
 
 @SSSource.register(ColumnName('residualDec'))
-def residualDec(row: Mapping) -> str:
+def residualDec(row: Mapping) -> Union[float, str]:
+    noise = RESIDUAL_DEC_NOISE.next()
     if not row['AstDec(deg)'] or not row['AstDecSigma(mas)']:
         return '\\N'
     dec = float(row['AstDec(deg)'])
     decs = float(row['AstDecSigma(mas)'])*MAS_TO_DEG
-    ran = np.random.normal(dec, decs)
-    return f"{ran}"
+    return dec + decs*noise
 
 
 # @SSSource.register(ColumnName('predictedRaDecCov'))
 # add things
 
 @SSSource.register(ColumnName('heliocentricX'))
-def helioX(row: Mapping) -> str:
+def helioX(row: Mapping) -> Union[float, str]:
     if row['Ast-Sun(J2000x)(km)'] == '':
         return '\\N'
-    return f"{float(row['Ast-Sun(J2000x)(km)'])*KM_TO_AU}"
+    return float(row['Ast-Sun(J2000x)(km)'])*KM_TO_AU
 
 
 @SSSource.register(ColumnName('heliocentricY'))
-def helioY(row: Mapping) -> str:
+def helioY(row: Mapping) -> Union[float, str]:
     if row['Ast-Sun(J2000y)(km)'] == '':
         return '\\N'
-    return f"{float(row['Ast-Sun(J2000y)(km)'])*KM_TO_AU}"
+    return float(row['Ast-Sun(J2000y)(km)'])*KM_TO_AU
 
 
 @SSSource.register(ColumnName('heliocentricZ'))
-def helioZ(row: Mapping) -> str:
+def helioZ(row: Mapping) -> Union[float, str]:
     if row['Ast-Sun(J2000z)(km)'] == '':
         return '\\N'
-    return f"{float(row['Ast-Sun(J2000z)(km)'])*KM_TO_AU}"
+    return float(row['Ast-Sun(J2000z)(km)'])*KM_TO_AU
 
 # @SSSource.register(ColumnName('heliocentricVX'))
 # add things
@@ -375,7 +404,7 @@ def helioZ(row: Mapping) -> str:
 
 
 @SSSource.register(ColumnName('topocentricX'))
-def topoX(row: Mapping) -> str:
+def topoX(row: Mapping) -> Union[float, str]:
     if not row['AstRA(deg)'] or not row['AstDec(deg)'] or\
             not row['AstRange(km)']:
         return '\\N'
@@ -383,11 +412,11 @@ def topoX(row: Mapping) -> str:
     dec = float(row['AstDec(deg)'])
     dau = float(row['AstRange(km)'])*KM_TO_AU
     x = np.cos(dec*DEG2RAD)*np.cos(ra*DEG2RAD)*dau
-    return f"{x}"
+    return x
 
 
 @SSSource.register(ColumnName('topocentricY'))
-def topoY(row: Mapping) -> str:
+def topoY(row: Mapping) -> Union[float, str]:
     if not row['AstRA(deg)'] or not row['AstDec(deg)'] or\
             not row['AstRange(km)']:
         return '\\N'
@@ -395,21 +424,21 @@ def topoY(row: Mapping) -> str:
     dec = float(row['AstDec(deg)'])
     dau = float(row['AstRange(km)'])*KM_TO_AU
     y = np.cos(dec*DEG2RAD)*np.sin(ra*DEG2RAD)*dau
-    return f"{y}"
+    return y
 
 
 @SSSource.register(ColumnName('topocentricZ'))
-def topoZ(row: Mapping) -> str:
+def topoZ(row: Mapping) -> Union[float, str]:
     if not row['AstDec(deg)'] or not row['AstRange(km)']:
         return '\\N'
     dec = float(row['AstDec(deg)'])
     dau = float(row['AstRange(km)'])*KM_TO_AU
     z = np.sin(dec*DEG2RAD)*dau
-    return f"{z}"
+    return z
 
 
 @SSSource.register(ColumnName('topocentricVX'))
-def topoVX(row: Mapping) -> str:
+def topoVX(row: Mapping) -> Union[float, str]:
     if not row['AstRA(deg)'] or not row['AstDec(deg)'] or\
             not row['AstRange(km)'] or not row['AstRangeRate(km/s)'] or\
             not row['AstRARate(deg/day)'] or not row['AstDecRate(deg/day)']:
@@ -424,11 +453,11 @@ def topoVX(row: Mapping) -> str:
         np.cos(dec*DEG2RAD)*np.sin(ra*DEG2RAD)*(vra*DEG2RAD) +\
         dau * np.sin(dec*DEG2RAD)*np.cos(ra*DEG2RAD) *\
         (vdec * DEG2RAD)
-    return f"{vx}"
+    return vx
 
 
 @SSSource.register(ColumnName('topocentricVY'))
-def topoVY(row: Mapping) -> str:
+def topoVY(row: Mapping) -> Union[float, str]:
     if not row['AstRA(deg)'] or not row['AstDec(deg)'] or\
             not row['AstRange(km)'] or not row['AstRangeRate(km/s)'] or\
             not row['AstRARate(deg/day)'] or not row['AstDecRate(deg/day)']:
@@ -443,11 +472,11 @@ def topoVY(row: Mapping) -> str:
         np.cos(dec*DEG2RAD)*np.cos(ra*DEG2RAD)*(vra*DEG2RAD) +\
         dau * np.sin(dec*DEG2RAD)*np.sin(ra*DEG2RAD) *\
         (vdec * DEG2RAD)
-    return f"{vy}"
+    return vy
 
 
 @SSSource.register(ColumnName('topocentricVZ'))
-def topoVZ(row: Mapping) -> str:
+def topoVZ(row: Mapping) -> Union[float, str]:
     if not row['AstRA(deg)'] or  not row['AstRange(km)'] or\
             not row['AstRangeRate(km/s)'] or\
             not row['AstDecRate(deg/day)']:
@@ -458,4 +487,4 @@ def topoVZ(row: Mapping) -> str:
     vdec = float(row['AstDecRate(deg/day)'])
     vz = np.sin(dec*DEG2RAD)*vda - dau * np.cos(dec*DEG2RAD) *\
         (vdec * DEG2RAD)
-    return f"{vz}"
+    return vz
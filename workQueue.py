@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+__all__ = ("PARTS_MANIFEST", "RangeTask", "Coordinator", "run_worker",
+           "split_ranges")
+
+from collections import deque
+from dataclasses import asdict, dataclass, replace
+from importlib import import_module
+import json
+from multiprocessing import Process
+import os
+import socket
+import time
+import traceback
+from typing import Any, Deque, Dict, Optional, Sequence, Set, Tuple, Type
+
+import zmq
+
+from .base import FileTable, Indexer, split_ranges
+
+PARTS_MANIFEST = "parts.json"
+# Name of the manifest of output parts written by the coordinator
+DEFAULT_PORT = 8392
+# Port the coordinator listens on, next to the one of the index server
+DEFAULT_HOST = "127.0.0.1"
+# Address the coordinator listens on, only reachable from its own machine
+TABLES = {"DiaSourceFileTable": ".DiaSourceFileTable",
+          "SSSourceFileTable": ".SSSourceFileTable"}
+# Tables workers can be asked to convert, by name, and the modules defining
+# them
+POLL_MS = 1000
+# How often the coordinator checks for tasks that have timed out
+WAIT_SECONDS = 1.0
+# How long a worker waits before asking again while the last tasks run
+STOP_GRACE = 10.0
+# How long the coordinator keeps telling workers to stop once all tasks
+# are done
+
+
+@dataclass(frozen=True)
+class RangeTask:
+    """A byte range of an input to convert, and which attempt at it this
+    is. Every attempt writes its own output part, so a worker that was
+    given up on can not overwrite the part of the attempt that replaced it.
+    """
+    index: int
+    input_filename: str
+    byte_range: Tuple[int, Optional[int]]
+    attempt: int = 1
+
+    def output_filename(self, output_dir: str) -> str:
+        return os.path.join(output_dir,
+                            f"part{self.index:05d}_{self.attempt}.csv")
+
+    def to_message(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> RangeTask:
+        start, end = message["byte_range"]
+        return cls(int(message["index"]), str(message["input_filename"]),
+                   (int(start), None if end is None else int(end)),
+                   int(message["attempt"]))
+
+
+def _table(name: str) -> Type[FileTable]:
+    """The table of TABLES named name."""
+    if name not in TABLES:
+        raise ValueError(f"{name} is not a table workers can convert, "
+                         f"expected one of {', '.join(TABLES)}")
+    return getattr(import_module(TABLES[name], __package__), name)
+
+
+class Coordinator:
+    """Splits inputs into byte ranges and hands them out to workers (see
+    run_worker) over ZMQ, so conversion can be spread over the nodes of a
+    cluster.
+
+    Messages are JSON, naming the table rather than pickling it, so a
+    message can not run code on the coordinator or the workers. They are
+    not authenticated though: anyone who can reach the port can take tasks
+    or report parts as done. The coordinator only listens on this machine
+    unless given another host, which should be an interface of a trusted
+    network.
+
+    Workers ask for a task whenever they are idle, reporting how their last
+    one went. Failed tasks are retried up to max_attempts times, as are
+    tasks whose worker has not reported back within task_timeout seconds.
+    A manifest of the finished parts (PARTS_MANIFEST) is kept up to date in
+    output_dir, and a coordinator started again on the same output_dir
+    skips the parts it lists.
+
+    Parameters
+    ----------
+    table : `type`
+        FileTable subclass whose builder converts each range, one of TABLES
+    input_filenames : `Sequence of str`
+        Paths of the inputs to convert, which must be readable by every
+        worker at the same path
+    output_dir : `str`
+        Directory the parts are written to, which must be shared with the
+        workers
+    chunk_size : `int`
+        Number of bytes of input in each task
+    port : `int`
+        Port to listen for workers on
+    host : `str`
+        Address to listen for workers on, i.e. the address of an interface,
+        or * for all of them
+    max_attempts : `int`
+        Most times a task is handed out before it is recorded as failed
+    task_timeout : `float`
+        Seconds after which a task that was handed out is handed out again,
+        or None to wait for every worker to report back
+    **builder_kwargs
+        Passed on to the builder of each range, i.e. skip_rows, which is
+        counted from the start of the input for every range. These are sent
+        to the workers as JSON.
+    """
+    def __init__(self, table: Type[FileTable], input_filenames: Sequence[str],
+                 output_dir: str, chunk_size: int = 1 << 28,
+                 port: int = DEFAULT_PORT, max_attempts: int = 3,
+                 task_timeout: Optional[float] = 3600.0,
+                 host: str = DEFAULT_HOST, **builder_kwargs: Any):
+        _table(table.__name__)
+        try:
+            json.dumps(builder_kwargs)
+        except TypeError as error:
+            raise ValueError(f"Builder arguments must be JSON serializable: "
+                             f"{error}") from None
+        self.table = table
+        # Workers may run from anywhere, so they are given absolute paths
+        self.output_dir = os.path.abspath(output_dir)
+        self.chunk_size = chunk_size
+        self.port = port
+        self.host = host
+        self.max_attempts = max_attempts
+        self.task_timeout = task_timeout
+        self.builder_kwargs = builder_kwargs
+        os.makedirs(self.output_dir, exist_ok=True)
+        ranges = [(filename, byte_range) for filename in
+                  map(os.path.abspath, input_filenames)
+                  for byte_range in split_ranges(filename, chunk_size)]
+        self.tasks = [RangeTask(i, filename, byte_range)
+                      for i, (filename, byte_range) in enumerate(ranges)]
+        self.parts: Dict[int, Dict[str, Any]] = {}
+        self.failed: Dict[int, Dict[str, Any]] = {}
+        # Handed out tasks by index, along with the worker and the time
+        self.running: Dict[int, Tuple[RangeTask, str, float]] = {}
+        self._resume()
+        self.pending: Deque[RangeTask] = deque(
+            task for task in self.tasks if task.index not in self.parts)
+
+    @property
+    def manifest_filename(self) -> str:
+        return os.path.join(self.output_dir, PARTS_MANIFEST)
+
+    def _resume(self):
+        """Take the parts of the same tasks in an existing manifest as
+        done, as long as they are still there.
+        """
+        if not os.path.exists(self.manifest_filename):
+            return
+        with open(self.manifest_filename) as in_file:
+            manifest = json.load(in_file)
+        tasks = {(task.index, task.input_filename, task.byte_range): task
+                 for task in self.tasks}
+        for part in manifest["parts"]:
+            key = (part["index"], part["input_filename"],
+                   tuple(part["byte_range"]))
+            if key in tasks and os.path.exists(part["filename"]):
+                self.parts[part["index"]] = part
+
+    def manifest(self) -> Dict[str, Any]:
+        return {"table": self.table.__name__,
+                "chunk_size": self.chunk_size,
+                "parts": [self.parts[index] for index in sorted(self.parts)],
+                "failed": [self.failed[index]
+                           for index in sorted(self.failed)]}
+
+    def _write_manifest(self):
+        tmp_filename = f"{self.manifest_filename}.{os.getpid()}"
+        with open(tmp_filename, "w") as out_file:
+            json.dump(self.manifest(), out_file, indent=1)
+        os.replace(tmp_filename, self.manifest_filename)
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and not self.running
+
+    def handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the result a worker sent, if any, and reply with its next
+        task, a wait while other workers finish theirs, or a stop.
+        """
+        worker = message["worker"]
+        if message.get("result") is not None:
+            self._record(worker, message["result"])
+        if self.pending:
+            task = self.pending.popleft()
+            self.running[task.index] = (task, worker, time.time())
+            return {"task": task.to_message(), "table": self.table.__name__,
+                    "output_filename": task.output_filename(self.output_dir),
+                    "builder_kwargs": self.builder_kwargs}
+        if self.running:
+            return {"wait": WAIT_SECONDS}
+        return {"stop": True}
+
+    def _record(self, worker: str, result: Dict[str, Any]):
+        task = RangeTask.from_message(result["task"])
+        if task.index in self.parts:
+            # A late report from an attempt that was already replaced
+            return
+        current = self.running.get(task.index)
+        if result["error"] is None:
+            # Late successes are taken too, even once the task was given up
+            # on after timing out
+            self.running.pop(task.index, None)
+            self.failed.pop(task.index, None)
+            self.pending = deque(pending for pending in self.pending
+                                 if pending.index != task.index)
+            self.parts[task.index] = {
+                "index": task.index, "input_filename": task.input_filename,
+                "byte_range": list(task.byte_range),
+                "filename": task.output_filename(self.output_dir),
+                "attempts": task.attempt, "worker": worker}
+            self._write_manifest()
+            return
+        if current is not None and current[0] == task:
+            self._retry(task, worker, result["error"])
+
+    def _retry(self, task: RangeTask, worker: str, error: str):
+        del self.running[task.index]
+        if task.attempt < self.max_attempts:
+            print(f"Retrying part {task.index} after {worker} failed: "
+                  f"{error.strip().splitlines()[-1]}")
+            self.pending.append(replace(task, attempt=task.attempt + 1))
+            return
+        self.failed[task.index] = {
+            "index": task.index, "input_filename": task.input_filename,
+            "byte_range": list(task.byte_range), "attempts": task.attempt,
+            "worker": worker, "error": error}
+        self._write_manifest()
+
+    def _expire(self):
+        if self.task_timeout is None:
+            return
+        now = time.time()
+        for task, worker, started in list(self.running.values()):
+            if now - started > self.task_timeout:
+                self._retry(task, worker, f"timed out after "
+                            f"{self.task_timeout}s")
+
+    def run(self, local_workers: int = 0) -> Dict[str, Any]:
+        """Hand out tasks until every one is done or has failed, and return
+        the manifest.
+
+        Parameters
+        ----------
+        local_workers : `int`
+            Number of worker processes to start on this machine, in addition
+            to any workers started elsewhere
+        """
+        context = zmq.Context()
+        server = context.socket(zmq.REP)
+        server.bind(f"tcp://{self.host}:{self.port}")
+        local_host = "127.0.0.1" if self.host in ("*", "0.0.0.0") else\
+            self.host
+        finished_at = time.time() if self.finished else None
+        # Local workers are waited for until they have been told to stop,
+        # even if they only connect after the last task is done
+        local = {f"local{i}" for i in range(local_workers)}
+        processes = [Process(target=run_worker,
+                             args=(f"tcp://{local_host}:{self.port}", name))
+                     for name in sorted(local)] if finished_at is None else []
+        for process in processes:
+            process.start()
+        seen: Set[str] = set(local) if processes else set()
+        stopped: Set[str] = set()
+        progress = None
+        try:
+            while finished_at is None or (seen - stopped and
+                                          time.time() - finished_at <
+                                          STOP_GRACE):
+                if server.poll(POLL_MS):
+                    try:
+                        message = server.recv_json()
+                        seen.add(message["worker"])
+                        reply = self.handle(message)
+                    except (ValueError, KeyError, TypeError) as error:
+                        print(f"Ignoring a malformed message: {error!r}")
+                        server.send_json({"error": "malformed message"})
+                        continue
+                    if "stop" in reply:
+                        stopped.add(message["worker"])
+                    server.send_json(reply)
+                self._expire()
+                if finished_at is None and self.finished:
+                    finished_at = time.time()
+                if progress != (len(self.parts), len(self.failed)):
+                    progress = (len(self.parts), len(self.failed))
+                    print(f"{len(self.parts)} of {len(self.tasks)} parts "
+                          f"done, {len(self.failed)} failed")
+        finally:
+            server.close(linger=0)
+            self._write_manifest()
+        for process in processes:
+            process.join()
+        return self.manifest()
+
+
+def _run_task(reply: Dict[str, Any]) -> Dict[str, Any]:
+    task = RangeTask.from_message(reply["task"])
+    try:
+        # Each part gets its own sidecar, which can be combined with
+        # merge_sidecars, so no shared index server is needed
+        _table(reply["table"]).builder(
+            input_filename=task.input_filename,
+            output_filename=reply["output_filename"],
+            byte_range=task.byte_range, indexer_class=Indexer,
+            **reply["builder_kwargs"]).run()
+    except (Exception, SystemExit):
+        return {"task": task.to_message(), "error": traceback.format_exc()}
+    return {"task": task.to_message(), "error": None}
+
+
+def run_worker(address: str, name: Optional[str] = None,
+               timeout: float = 600.0):
+    """Convert the tasks handed out by a Coordinator until it says to stop.
+
+    Parameters
+    ----------
+    address : `str`
+        Address of the coordinator, i.e. tcp://host:8392
+    name : `str`
+        Name the coordinator knows this worker by, by default its host and
+        process id
+    timeout : `float`
+        Seconds to wait for the coordinator to reply before giving up
+    """
+    if name is None:
+        name = f"{socket.gethostname()}:{os.getpid()}"
+    context = zmq.Context()
+    client = context.socket(zmq.REQ)
+    client.connect(address)
+    result = None
+    try:
+        while True:
+            client.send_json({"worker": name, "result": result})
+            if not client.poll(int(timeout*1000)):
+                print(f"{name} had no reply from {address} in {timeout}s")
+                return
+            reply = client.recv_json()
+            result = None
+            if "error" in reply:
+                print(f"{name} was refused by {address}: {reply['error']}")
+                return
+            if "stop" in reply:
+                return
+            if "wait" in reply:
+                time.sleep(reply["wait"])
+                continue
+            result = _run_task(reply)
+    finally:
+        client.close(linger=0)